@@ -4,10 +4,11 @@
 
 import argparse
 import logging
+import sys
 
 from OpenSSL import crypto
 
-from py509 import client
+from py509 import client, metrics
 
 
 logging.basicConfig(level=logging.INFO)
@@ -17,10 +18,17 @@ log = logging.getLogger(__name__)
 def main():
   parser = argparse.ArgumentParser(description=__doc__)
   parser.add_argument('host')
+  parser.add_argument('--profile', action='store_true',
+                      help='Print a stage-by-stage timing summary to stderr.')
   args = parser.parse_args()
 
+  registry = metrics.enable() if args.profile else None
+
   x509cert = client.get_host_certificate(args.host)
-  print crypto.dump_certificate(crypto.FILETYPE_PEM, x509cert)
+  sys.stdout.write(crypto.dump_certificate(crypto.FILETYPE_PEM, x509cert).decode('ascii'))
+
+  if registry:
+    sys.stderr.write(registry.summary() + '\n')
 
 
 if __name__ == '__main__':
@@ -2,16 +2,17 @@
 
 """List contents of a certificate."""
 
+import argparse
 import datetime
 import logging
 import ssl
 import sys
 
 from OpenSSL import crypto
-import dateutil.parser
 
+from py509 import metrics
 from py509.utils import tree
-from py509.x509 import load_certificate
+from py509.x509 import load_certificates, parse_time
 
 
 logging.basicConfig(level=logging.INFO)
@@ -35,8 +36,24 @@ def stringify_subject(s):
 
 
 def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--at', default=None,
+                      help='Report the time left as of this date instead of now, e.g. 2030-01-01.')
+  parser.add_argument('--profile', action='store_true',
+                      help='Print a stage-by-stage timing summary to stderr.')
+  args = parser.parse_args()
 
-  x509cert = load_certificate(crypto.FILETYPE_PEM, sys.stdin.read())
+  # Every certificate is measured against the same instant.
+  now = parse_time(args.at) if args.at else datetime.datetime.utcnow()
+
+  registry = metrics.enable() if args.profile else None
+
+  try:
+    x509cert = next(load_certificates(getattr(sys.stdin, 'buffer', sys.stdin).read()), None)
+  except (crypto.Error, ValueError):
+    x509cert = None
+  if x509cert is None:
+    parser.error('no certificate found on stdin')
 
   subject_id = 'unknown'
   if 'subjectKeyIdentifier' in x509cert.extensions:
@@ -46,17 +63,15 @@ def main():
   if 'authorityKeyIdentifier' in x509cert.extensions:
     issuer_id = x509cert.extensions['authorityKeyIdentifier'].id
 
-  print 'Certificate:'
-  print '\n'.join(tree({
+  not_before = parse_time(x509cert.get_notBefore())
+  not_after = parse_time(x509cert.get_notAfter())
+
+  info = {
     'validity': {
       'lifetime': {
-        '{0} to {1}'.format(
-          dateutil.parser.parse(x509cert.get_notBefore()).date(),
-          dateutil.parser.parse(x509cert.get_notAfter()).date()): {
-            str(dateutil.parser.parse(x509cert.get_notAfter()) -
-                dateutil.parser.parse(x509cert.get_notBefore())): {},
-            str(dateutil.parser.parse(x509cert.get_notAfter(), ignoretz=True) -
-                datetime.datetime.utcnow()): {}
+        '{0} to {1}'.format(not_before.date(), not_after.date()): {
+          str(not_after - not_before): {},
+          str(not_after - now): {}
         },
       },
     },
@@ -90,7 +105,12 @@ def main():
         },
       },
     }
-  }))
+  }
+  print('Certificate:')
+  print('\n'.join(tree(info)))
+
+  if registry:
+    sys.stderr.write(registry.summary() + '\n')
 
 
 if __name__ == '__main__':
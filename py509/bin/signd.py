@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Serve certificate signing over HTTP on localhost."""
+
+import click
+import logging
+
+from OpenSSL import crypto
+
+from py509.signer import SigningService, make_server
+
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option('--ca-key', required=True, type=click.File('rb'),
+              help='The signing authority\'s PEM encoded private key.')
+@click.option('--ca-cert', required=True, type=click.File('rb'),
+              help='The signing authority\'s PEM encoded certificate.')
+@click.option('--host', default='127.0.0.1',
+              help='The address to listen on.')
+@click.option('--port', default=8510,
+              help='The port to listen on.')
+@click.option('--processes', default=2,
+              help='The number of signing processes.')
+@click.option('--batch-size', default=64,
+              help='The most requests sent to a signing process at once.')
+@click.option('--rate', default=None, type=float,
+              help='The number of requests each client may make per second.')
+@click.option('--burst', default=None, type=int,
+              help='The number of requests each client may make at once.')
+@click.option('--validity', default=365 * 24 * 60 * 60,
+              help='How long, in seconds, certificates are valid for.')
+def main(ca_key, ca_cert, host, port, processes, batch_size, rate, burst, validity):
+
+  key = crypto.load_privatekey(crypto.FILETYPE_PEM, ca_key.read())
+  crt = crypto.load_certificate(crypto.FILETYPE_PEM, ca_cert.read())
+  service = SigningService(key, crt, processes=processes, batch_size=batch_size, rate=rate, burst=burst,
+                           validity=validity)
+  service.start()
+  server = make_server(service, host=host, port=port)
+  log.info('Signing as "%s" on http://%s:%d', crt.get_subject().CN, host, server.server_port)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    service.stop()
+
+
+if __name__ == '__main__':
+  main()
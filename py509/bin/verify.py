@@ -10,8 +10,11 @@ import sys
 from OpenSSL import crypto
 import certifi
 
+from py509 import metrics
+from py509.store import TrustStore
 from py509.utils import tree, transmogrify, assemble_chain
-from py509.x509 import resolve_pkix_certificate, load_x509_certificates, load_certificate
+from py509.verification import Verifier, error_string
+from py509.x509 import get_extensions, resolve_pkix_certificates, load_certificates, parse_time
 
 
 logging.getLogger('urllib3').setLevel(logging.WARNING)
@@ -26,28 +29,44 @@ CERTIFI = certifi.where()
 
 @click.command()
 @click.option('--ca', default=CERTIFI,
-              help='A custom trust store to use if different than certifi\'s.')
+              help='A custom trust store to use if different than certifi\'s: a '
+                   'bundle, a directory of certificates or a glob pattern.')
 @click.option('--resolve/--no-resolve', default=True,
               help='Should intermediate certificates be resolved and added to the trust store?')
-def main(ca, resolve):
-
-  trust_store = []
-  with open(ca) as fh:
-    trust_store = list(load_x509_certificates(fh.read()))
-
-  x509store = crypto.X509Store()
-  for ca in trust_store:
-    x509store.add_cert(ca)
-
-  x509cert = load_certificate(crypto.FILETYPE_PEM, sys.stdin.read())
-
-  intermediate = None
+@click.option('--at', 'dates', multiple=True,
+              help='Also verify as of a date, e.g. 2030-01-01, in UTC unless a zone is given. '
+                   'May be given many times; the chain is only verified once.')
+@click.option('--profile', is_flag=True, default=False,
+              help='Print a stage-by-stage timing summary to stderr.')
+def main(ca, resolve, dates, profile):
+
+  registry = metrics.enable() if profile else None
+
+  store = TrustStore(ca)
+  store.refresh()
+  # Only the --ca certificates; the untrusted ones below are kept apart.
+  trust_store = store.certificates
+
+  x509store = store.x509store()
+
+  # Anything after the first certificate, e.g. the rest of a PKCS#7 bundle,
+  # and anything resolved from the authority information access extension,
+  # is untrusted: it may only complete the chain to a certificate in the
+  # trust store, never anchor it.
+  try:
+    given = list(load_certificates(getattr(sys.stdin, 'buffer', sys.stdin).read()))
+  except (crypto.Error, ValueError):
+    given = []
+  if not given:
+    raise click.ClickException('No certificate found on stdin.')
+  x509cert = given[0]
+  untrusted = given[1:]
+
+  intermediates = []
   if resolve:
     if 'authorityInfoAccess' in x509cert.extensions:
-      intermediate = resolve_pkix_certificate(x509cert.extensions['authorityInfoAccess'].ca_issuer)
-      if intermediate:
-        x509store.add_cert(intermediate)
-        trust_store.append(intermediate)
+      intermediates = resolve_pkix_certificates(x509cert.extensions['authorityInfoAccess'].ca_issuer)
+      untrusted.extend(intermediates)
 
   def cert_string(cert):
     return '{0}'.format(cert.get_subject().CN)
@@ -57,8 +76,9 @@ def main(ca, resolve):
     string = []
     string.append(click.style('[+] ', fg=color))
     uid = 'unknown'
-    if 'subjectKeyIdentifier' in key.extensions:
-      uid = key.extensions['subjectKeyIdentifier'].id
+    extensions = get_extensions(key)
+    if 'subjectKeyIdentifier' in extensions:
+      uid = extensions['subjectKeyIdentifier'].id
       uid = uid.replace(':', '')
       uid = uid.lower()
       uid = uid[:8]
@@ -66,14 +86,14 @@ def main(ca, resolve):
     return ''.join(string)
 
   def style_intermediate(key):
-    if intermediate and intermediate.get_subject().CN == key.get_subject().CN:
+    if any(i.get_subject().CN == key.get_subject().CN for i in intermediates):
       return click.style(' (resolved)', fg='yellow')
     return ''
 
   try:
-    crypto.X509StoreContext(x509store, x509cert).verify_certificate()
-
-    chain = assemble_chain(x509cert, trust_store)
+    with metrics.timed('verification'):
+      verified = crypto.X509StoreContext(x509store, x509cert, chain=untrusted).get_verified_chain()
+    chain = list(reversed(verified))
     # Success
     g = partial(style_cert, True)
     click.secho('[{0}] '.format(len(chain)), nl=False, fg='green')
@@ -82,10 +102,22 @@ def main(ca, resolve):
       click.secho(line)
 
   except crypto.X509StoreContextError as e:
-    chain = assemble_chain(x509cert, trust_store)
+    chain = assemble_chain(x509cert, trust_store + untrusted)
     # Failure
     g = partial(style_cert, False)
     click.secho('[{0}] '.format(len(chain)), nl=False, fg='red')
-    click.secho(e.message[2])
+    click.secho(error_string(e))
     for line in tree(transmogrify(chain), formatter=cert_string, prefix=g, postfix=style_intermediate):
       click.secho(line)
+
+  if dates:
+    verifier = Verifier(trust_store)
+    dates = [parse_time(d) for d in dates]
+    for when, outcome in zip(dates, verifier.verify_at(x509cert, dates, intermediates=untrusted)):
+      if outcome.valid:
+        click.secho('[+] {0}: verified'.format(when), fg='green')
+      else:
+        click.secho('[-] {0}: {1}'.format(when, outcome.error), fg='red')
+
+  if registry:
+    click.echo(registry.summary(), err=True)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""Serve certificate verification over HTTP on localhost."""
+
+import click
+import logging
+
+import certifi
+
+from py509.server import VerificationService, make_server
+from py509.store import TrustStore
+
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+CERTIFI = certifi.where()
+
+
+@click.command()
+@click.option('--ca', default=CERTIFI,
+              help='A custom trust store to use if different than certifi\'s: a '
+                   'bundle, a directory of certificates or a glob pattern.')
+@click.option('--host', default='127.0.0.1',
+              help='The address to listen on.')
+@click.option('--port', default=8509,
+              help='The port to listen on.')
+@click.option('--reload-interval', default=5,
+              help='How often, in seconds, to check the trust store for changes.')
+@click.option('--time-bucket', default=3600,
+              help='How long, in seconds, verification outcomes are reused for.')
+def main(ca, host, port, reload_interval, time_bucket):
+
+  service = VerificationService(TrustStore(ca), reload_interval=reload_interval, time_bucket=time_bucket)
+  service.start()
+  server = make_server(service, host=host, port=port)
+  log.info('Serving %d trusted certificates on http://%s:%d', len(service.trust_store), host, server.server_port)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    service.stop()
+
+
+if __name__ == '__main__':
+  main()
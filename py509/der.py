@@ -0,0 +1,189 @@
+"""A minimal reader for DER encoded ASN.1.
+
+pyasn1 decodes complete object graphs, which is more than is needed to find a
+few fields in a certificate. The functions in this module instead walk the
+tag-length-value structure of a DER buffer in place and only decode what they
+are asked for.
+
+Buffers must be indexable to integers, i.e. :class:`bytearray` objects (or
+:class:`bytes` on Python 3).
+
+"""
+
+import datetime
+
+
+SEQUENCE = 0x30
+SET = 0x31
+INTEGER = 0x02
+BIT_STRING = 0x03
+OCTET_STRING = 0x04
+NULL = 0x05
+OID = 0x06
+BOOLEAN = 0x01
+UTC_TIME = 0x17
+GENERALIZED_TIME = 0x18
+
+#: Short names of common name attribute OIDs.
+NAME_ATTRIBUTES = {
+  '2.5.4.3': 'CN',
+  '2.5.4.4': 'SN',
+  '2.5.4.5': 'serialNumber',
+  '2.5.4.6': 'C',
+  '2.5.4.7': 'L',
+  '2.5.4.8': 'ST',
+  '2.5.4.9': 'street',
+  '2.5.4.10': 'O',
+  '2.5.4.11': 'OU',
+  '2.5.4.42': 'GN',
+  '1.2.840.113549.1.9.1': 'emailAddress',
+  '0.9.2342.19200300.100.1.25': 'DC',
+}
+
+
+class DERError(ValueError):
+  """Raised when a buffer is not valid DER."""
+
+
+def context(number, constructed=True):
+  """The tag of a context specific field, e.g. ``[0]``."""
+  return 0x80 | (0x20 if constructed else 0) | number
+
+
+def read_header(buf, offset, end=None):
+  """Read the tag and length of the element at ``offset``.
+
+  :param bytearray buf: The buffer.
+  :param int offset: The offset of the element.
+  :param int end: The offset the element must end before. Defaults to the end
+    of the buffer.
+  :return: The element's tag, the offset of its contents and the offset just
+    past its end.
+  :rtype: tuple(int, int, int)
+  :raises DERError: If the element is truncated or uses an unsupported form.
+
+  """
+  if end is None:
+    end = len(buf)
+  if offset + 2 > end:
+    raise DERError('Truncated element at offset {0}'.format(offset))
+  tag = buf[offset]
+  if tag & 0x1f == 0x1f:
+    raise DERError('High tag numbers are not supported (offset {0})'.format(offset))
+  length = buf[offset + 1]
+  offset += 2
+  if length & 0x80:
+    count = length & 0x7f
+    if count == 0 or count > 4 or offset + count > end:
+      raise DERError('Unsupported length encoding at offset {0}'.format(offset - 2))
+    length = 0
+    for idx in range(offset, offset + count):
+      length = (length << 8) | buf[idx]
+    offset += count
+  if offset + length > end:
+    raise DERError('Truncated element at offset {0}'.format(offset))
+  return tag, offset, offset + length
+
+
+def iter_elements(buf, offset=0, end=None):
+  """Iterate over consecutive elements.
+
+  :return: An iterator of ``(tag, start, content_offset, end)`` tuples.
+
+  """
+  if end is None:
+    end = len(buf)
+  while offset < end:
+    tag, content, stop = read_header(buf, offset, end)
+    yield tag, offset, content, stop
+    offset = stop
+
+
+def children(buf, offset, end=None):
+  """List the elements inside the constructed element at ``offset``.
+
+  :return: A list of ``(tag, start, content_offset, end)`` tuples.
+
+  """
+  _, content, stop = read_header(buf, offset, end)
+  return list(iter_elements(buf, content, stop))
+
+
+def read_integer(buf, start, end):
+  """Decode the contents of an INTEGER."""
+  value = 0
+  for idx in range(start, end):
+    value = (value << 8) | buf[idx]
+  if end > start and buf[start] & 0x80:
+    value -= 1 << (8 * (end - start))
+  return value
+
+
+def read_oid(buf, start, end):
+  """Decode the contents of an OBJECT IDENTIFIER to a dotted string."""
+  arcs = []
+  value = 0
+  for idx in range(start, end):
+    value = (value << 7) | (buf[idx] & 0x7f)
+    if not buf[idx] & 0x80:
+      arcs.append(value)
+      value = 0
+  if not arcs:
+    raise DERError('Empty object identifier at offset {0}'.format(start))
+  first = min(arcs[0] // 40, 2)
+  return '.'.join(str(a) for a in [first, arcs[0] - 40 * first] + arcs[1:])
+
+
+def read_time(tag, buf, start, end):
+  """Decode the contents of a UTCTime or GeneralizedTime.
+
+  :return: A naive UTC datetime.
+  :rtype: datetime.datetime
+
+  """
+  text = bytes(buf[start:end]).decode('ascii')
+  if tag == UTC_TIME:
+    value = datetime.datetime.strptime(text, '%y%m%d%H%M%SZ')
+    # RFC 5280: two digit years from 50 onwards are in the 20th century.
+    if value.year >= 2050:
+      value = value.replace(year=value.year - 100)
+    return value
+  if tag == GENERALIZED_TIME:
+    return datetime.datetime.strptime(text, '%Y%m%d%H%M%SZ')
+  raise DERError('Unexpected time tag {0:#x} at offset {1}'.format(tag, start))
+
+
+def read_string(tag, buf, start, end):
+  """Decode the contents of a string type to text."""
+  data = bytes(buf[start:end])
+  if tag == 0x1e:
+    return data.decode('utf-16-be')
+  if tag == 0x1c:
+    return data.decode('utf-32-be')
+  if tag in (0x13, 0x16, 0x1a):
+    return data.decode('ascii', 'replace')
+  if tag == 0x14:
+    return data.decode('latin-1')
+  return data.decode('utf-8', 'replace')
+
+
+def read_name(buf, offset, end=None):
+  """Decode a Name.
+
+  :return: The name's attributes as ``(type, value)`` pairs, in order. Types
+    are short names like ``CN`` where known, and dotted OIDs otherwise.
+  :rtype: tuple
+
+  """
+  attributes = []
+  for _, rdn, _, _ in children(buf, offset, end):
+    for _, atv, _, _ in children(buf, rdn, end):
+      (_, _, oid_start, oid_end), (tag, _, value_start, value_end) = children(buf, atv, end)[:2]
+      oid = read_oid(buf, oid_start, oid_end)
+      attributes.append((NAME_ATTRIBUTES.get(oid, oid), read_string(tag, buf, value_start, value_end)))
+  return tuple(attributes)
+
+
+def format_name(attributes):
+  """Format decoded name attributes, e.g. ``CN=example.com, O=Example``."""
+  return ', '.join('{0}={1}'.format(k, v) for k, v in attributes)
@@ -0,0 +1,151 @@
+"""Compute certificate digests in bulk.
+
+Deduplicating or pinning a corpus of certificates needs a few digests of each
+one: fingerprints of the whole certificate, a hash of its SubjectPublicKeyInfo
+for pinning, and its key identifier. :func:`bulk_digests` computes them
+straight from DER encodings, e.g. as found by
+:func:`~py509.x509.der_certificates`, without building a pyOpenSSL object per
+certificate. Certificates are hashed in chunks across a pool, and each digest
+is returned as a single :class:`bytes` object of fixed width rows rather than
+a list of small objects.
+
+:mod:`hashlib` only releases the GIL for buffers larger than about two
+kilobytes, which is more than most certificates, so a process pool is usually
+faster than a thread pool for large corpora.
+
+"""
+
+import base64
+import collections
+import hashlib
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from py509 import der
+
+
+#: The width, in bytes, of each row of each digest.
+WIDTHS = collections.OrderedDict([
+  ('sha1', 20),
+  ('sha256', 32),
+  ('spki_sha256', 32),
+  ('key_id', 20),
+])
+
+_EMPTY = dict((name, b'\x00' * width) for name, width in WIDTHS.items())
+
+
+class Digests(collections.namedtuple('Digests', ['count'] + list(WIDTHS) + ['errors'])):
+  """The digests of many certificates.
+
+  ``sha1`` and ``sha256`` are fingerprints of the certificates;
+  ``spki_sha256`` is the SHA-256 hash of their SubjectPublicKeyInfo, as used
+  for public key pinning; and ``key_id`` is the SHA-1 hash of their public key,
+  the key identifier of RFC 5280's first method, which is what OpenSSL puts in
+  the subject key identifier extension. Each is a :class:`bytes` object of
+  ``count`` rows of :data:`WIDTHS` bytes. ``errors`` lists the indices of the
+  certificates whose public key could not be found; their ``spki_sha256`` and
+  ``key_id`` rows are zeros.
+
+  """
+
+  __slots__ = ()
+
+  def get(self, name, idx):
+    """Get one certificate's digest.
+
+    :param str name: The digest, e.g. ``sha256``.
+    :param int idx: The certificate's index.
+    :rtype: bytes
+
+    """
+    width = WIDTHS[name]
+    return getattr(self, name)[idx * width:(idx + 1) * width]
+
+  def pin(self, idx):
+    """Get one certificate's public key pin, e.g. ``sha256/YLh1...``."""
+    return 'sha256/' + base64.b64encode(self.get('spki_sha256', idx)).decode('ascii')
+
+
+def _public_key(blob):
+  """Find a certificate's SubjectPublicKeyInfo and public key.
+
+  :return: The ``(start, end)`` offsets of each.
+
+  """
+  buf = bytearray(blob) if bytes is str else blob
+  _, tbs, _, _ = der.children(buf, 0)[0]
+  fields = der.children(buf, tbs)
+  if fields[0][0] == der.context(0):
+    fields = fields[1:]
+  _, spki_start, spki_content, spki_end = fields[5]
+  _, _, key_start, key_end = der.children(buf, spki_start, spki_end)[1]
+  # Skip the BIT STRING's byte of unused bits.
+  return (spki_start, spki_end), (key_start + 1, key_end)
+
+
+def _digest_chunk(blobs):
+  rows = dict((name, []) for name in WIDTHS)
+  errors = []
+  for idx, blob in enumerate(blobs):
+    view = memoryview(blob)
+    rows['sha1'].append(hashlib.sha1(view).digest())
+    rows['sha256'].append(hashlib.sha256(view).digest())
+    try:
+      (spki_start, spki_end), (key_start, key_end) = _public_key(blob)
+    except (der.DERError, IndexError, ValueError):
+      errors.append(idx)
+      rows['spki_sha256'].append(_EMPTY['spki_sha256'])
+      rows['key_id'].append(_EMPTY['key_id'])
+      continue
+    rows['spki_sha256'].append(hashlib.sha256(view[spki_start:spki_end]).digest())
+    rows['key_id'].append(hashlib.sha1(view[key_start:key_end]).digest())
+  return len(blobs), dict((name, b''.join(values)) for name, values in rows.items()), errors
+
+
+def _chunks(blobs, chunk_size):
+  blobs = iter(blobs)
+  while True:
+    chunk = [bytes(blob) for blob in itertools.islice(blobs, chunk_size)]
+    if not chunk:
+      return
+    yield chunk
+
+
+def bulk_digests(blobs, processes=None, chunk_size=1024, pool='process'):
+  """Compute the digests of many certificates.
+
+  :param iterable blobs: DER encoded certificates. Any iterable is accepted,
+    so certificates can be streamed from
+    :func:`~py509.x509.der_certificates`.
+  :param int processes: The size of the pool. Defaults to the number of CPUs;
+    ``1`` computes the digests in the calling thread.
+  :param int chunk_size: The number of certificates sent to the pool at once.
+  :param str pool: ``process`` or ``thread``.
+  :rtype: :class:`Digests`
+
+  """
+  processes = processes or multiprocessing.cpu_count()
+  columns = dict((name, bytearray()) for name in WIDTHS)
+  errors = []
+  count = 0
+
+  if processes == 1:
+    results = (_digest_chunk(chunk) for chunk in _chunks(blobs, chunk_size))
+    workers = None
+  else:
+    workers = (ThreadPool if pool == 'thread' else multiprocessing.Pool)(processes)
+    results = workers.imap(_digest_chunk, _chunks(blobs, chunk_size))
+  try:
+    for n, rows, chunk_errors in results:
+      for name, value in rows.items():
+        columns[name] += value
+      errors.extend(count + idx for idx in chunk_errors)
+      count += n
+  finally:
+    if workers is not None:
+      workers.close()
+      workers.join()
+
+  return Digests(count=count, errors=errors, **dict((name, bytes(value)) for name, value in columns.items()))
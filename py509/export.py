@@ -0,0 +1,206 @@
+"""Export certificate fields in a columnar layout.
+
+Loading a large corpus of certificates for analysis one Python object graph at
+a time is slow and memory hungry. The functions in this module flatten
+certificates into batches of columns that can be handed to a dataframe library
+directly.
+
+The best available backend is used: `pyarrow` record batches (and Parquet
+files) when `pyarrow` is installed, :mod:`numpy` arrays when only `numpy` is
+installed, and plain :class:`list` objects otherwise.
+
+"""
+
+from py509.x509 import KEY_TYPES, get_extensions, parse_time
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+try:
+  import pyarrow
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+
+#: Name attributes exported for both the subject and the issuer.
+NAME_FIELDS = ('CN', 'O', 'OU', 'C', 'ST', 'L')
+
+_NAME_COLUMNS = [('{0}_{1}'.format(prefix, f), 'str') for prefix in ('subject', 'issuer') for f in NAME_FIELDS]
+
+#: The exported columns and their type: one of ``str``, ``int`` or
+#: ``datetime``.
+COLUMNS = tuple(_NAME_COLUMNS + [
+  ('serial', 'str'),
+  ('not_before', 'datetime'),
+  ('not_after', 'datetime'),
+  ('key_type', 'str'),
+  ('key_bits', 'int'),
+  ('san_dns_count', 'int'),
+  ('san_ip_count', 'int'),
+  ('san_uri_count', 'int'),
+  ('subject_key_id', 'str'),
+  ('authority_key_id', 'str'),
+  ('aia_ocsp', 'str'),
+  ('aia_ca_issuer', 'str'),
+])
+
+
+def _text(value):
+  if value is None or isinstance(value, str):
+    return value
+  if isinstance(value, bytes):
+    return value.decode('utf-8', 'replace')
+  return str(value)
+
+
+def certificate_row(x509cert):
+  """Flatten a certificate into a row of exported values.
+
+  :param OpenSSL.crypto.X509 x509cert: The certificate to flatten. If it was
+    loaded with :func:`~py509.x509.load_certificate` its already decoded
+    extensions are reused.
+  :return: A mapping of column name to value, in the order of :data:`COLUMNS`.
+  :rtype: dict
+
+  """
+  row = {}
+  for prefix, name in (('subject', x509cert.get_subject()), ('issuer', x509cert.get_issuer())):
+    for field in NAME_FIELDS:
+      row['{0}_{1}'.format(prefix, field)] = _text(getattr(name, field))
+
+  row['serial'] = '{0:x}'.format(x509cert.get_serial_number())
+  row['not_before'] = parse_time(x509cert.get_notBefore())
+  row['not_after'] = parse_time(x509cert.get_notAfter())
+
+  pkey = x509cert.get_pubkey()
+  row['key_type'] = KEY_TYPES.get(pkey.type(), 'unknown')
+  row['key_bits'] = pkey.bits()
+
+  extensions = get_extensions(x509cert)
+
+  san = extensions['subjectAltName'] if 'subjectAltName' in extensions else None
+  row['san_dns_count'] = len(san.dns) if san else 0
+  row['san_ip_count'] = len(san.ips) if san else 0
+  row['san_uri_count'] = len(san.uris) if san else 0
+
+  ski = extensions['subjectKeyIdentifier'] if 'subjectKeyIdentifier' in extensions else None
+  row['subject_key_id'] = _text(ski.id) if ski else None
+
+  aki = extensions['authorityKeyIdentifier'] if 'authorityKeyIdentifier' in extensions else None
+  row['authority_key_id'] = _text(aki.id) if aki else None
+
+  aia = extensions['authorityInfoAccess'] if 'authorityInfoAccess' in extensions else None
+  row['aia_ocsp'] = _text(aia.ocsp) if aia else None
+  row['aia_ca_issuer'] = _text(aia.ca_issuer) if aia else None
+
+  return row
+
+
+def _to_numpy(columns):
+  arrays = {}
+  for name, kind in COLUMNS:
+    values = columns[name]
+    if kind == 'int':
+      arrays[name] = numpy.array(values, dtype=numpy.int64)
+    elif kind == 'datetime':
+      arrays[name] = numpy.array(
+        [v if v is not None else 'NaT' for v in values], dtype='datetime64[s]')
+    else:
+      arrays[name] = numpy.array(values, dtype=object)
+  return arrays
+
+
+def _arrow_schema():
+  types = {
+    'str': pyarrow.string(),
+    'int': pyarrow.int64(),
+    'datetime': pyarrow.timestamp('s'),
+  }
+  return pyarrow.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def _to_arrow(columns, schema):
+  return pyarrow.RecordBatch.from_arrays(
+    [pyarrow.array(columns[name], type=schema.field(name).type) for name, _ in COLUMNS],
+    schema=schema)
+
+
+def _default_backend():
+  if pyarrow is not None:
+    return 'arrow'
+  if numpy is not None:
+    return 'numpy'
+  return 'python'
+
+
+def iter_batches(certificates, batch_size=4096, backend=None):
+  """Stream certificates into batches of columns.
+
+  Only a single batch of rows is held in memory at a time, so `certificates`
+  may be a lazy iterator such as :func:`~py509.x509.load_x509_certificates`
+  over an arbitrarily large corpus.
+
+  :param iterable certificates: The certificates to export.
+  :param int batch_size: The maximum number of rows in a batch.
+  :param str backend: One of ``arrow``, ``numpy`` or ``python``. Defaults to
+    the best installed backend.
+  :return: An iterator of batches. A batch is a `pyarrow.RecordBatch` for the
+    ``arrow`` backend, and a :class:`dict` of column name to array or list
+    otherwise.
+
+  """
+  backend = backend or _default_backend()
+  if backend == 'arrow':
+    if pyarrow is None:
+      raise RuntimeError('The arrow backend requires pyarrow to be installed!')
+    schema = _arrow_schema()
+
+    def convert(columns):
+      return _to_arrow(columns, schema)
+  elif backend == 'numpy':
+    if numpy is None:
+      raise RuntimeError('The numpy backend requires numpy to be installed!')
+    convert = _to_numpy
+  elif backend == 'python':
+    def convert(columns):
+      return columns
+  else:
+    raise ValueError('Unknown backend `{0}`!'.format(backend))
+
+  columns = dict((name, []) for name, _ in COLUMNS)
+  size = 0
+  for x509cert in certificates:
+    row = certificate_row(x509cert)
+    for name, _ in COLUMNS:
+      columns[name].append(row[name])
+    size += 1
+    if size == batch_size:
+      yield convert(columns)
+      columns = dict((name, []) for name, _ in COLUMNS)
+      size = 0
+  if size:
+    yield convert(columns)
+
+
+def write_parquet(certificates, path, batch_size=4096):
+  """Stream certificates into a Parquet file.
+
+  :param iterable certificates: The certificates to export.
+  :param str path: The path of the Parquet file to write.
+  :param int batch_size: The maximum number of rows buffered before they are
+    written out as a row group.
+  :return: The number of rows written.
+  :rtype: int
+
+  """
+  if pyarrow is None:
+    raise RuntimeError('Writing Parquet files requires pyarrow to be installed!')
+  rows = 0
+  with pyarrow.parquet.ParquetWriter(path, _arrow_schema()) as writer:
+    for batch in iter_batches(certificates, batch_size=batch_size, backend='arrow'):
+      writer.write_table(pyarrow.Table.from_batches([batch]))
+      rows += batch.num_rows
+  return rows
@@ -1,23 +1,81 @@
+from array import array
 import binascii
+import collections
 import socket
 
 from pyasn1.codec.der.decoder import decode
 from pyasn1_modules.rfc2459 import (
     AuthorityInfoAccessSyntax as _AuthorityInfoAccessSyntax,
     AuthorityKeyIdentifier as _AuthorityKeyIdentifier,
-    SubjectAltName as _SubjectAltName,
     SubjectKeyIdentifier as _SubjectKeyIdentifier,
 )
 
+from py509 import der
+
+
+#: GeneralName choices by tag number.
+OTHER_NAME = 0
+RFC822_NAME = 1
+DNS_NAME = 2
+X400_ADDRESS = 3
+DIRECTORY_NAME = 4
+EDI_PARTY_NAME = 5
+URI = 6
+IP_ADDRESS = 7
+REGISTERED_ID = 8
+
+#: The names of the GeneralName choices, indexed by tag number.
+GENERAL_NAME_TYPES = (
+  'otherName', 'rfc822Name', 'dNSName', 'x400Address', 'directoryName',
+  'ediPartyName', 'uniformResourceIdentifier', 'iPAddress', 'registeredID',
+)
+
+
+def _format_ip(data):
+  if len(data) == 4:
+    return socket.inet_ntoa(data)
+  if len(data) == 16:
+    return socket.inet_ntop(socket.AF_INET6, data)
+  # Name constraints hold an address and a netmask; anything else is bogus.
+  return binascii.hexlify(data).decode('ascii')
+
+
+def _decode_general_names(buf, offset, end):
+  """Decode a sequence of GeneralName elements.
+
+  :param bytearray buf: The buffer holding the GeneralNames.
+  :return: An iterator over ``(type, value)`` pairs, where ``type`` is the
+    GeneralName's tag number. ``otherName`` values are ``(type_id, value)``
+    pairs, with the value decoded if it is a string and hex encoded otherwise.
+
+  """
+  for tag, start, content, stop in der.iter_elements(buf, offset, end):
+    number = tag & 0x1f
+    if number == OTHER_NAME:
+      (_, _, oid_start, oid_end), (_, value, _, value_end) = der.children(buf, start, stop)[:2]
+      (inner, _, inner_start, inner_end), = der.children(buf, value, value_end)
+      if inner in (0x0c, 0x13, 0x16, 0x1e):
+        decoded = der.read_string(inner, buf, inner_start, inner_end)
+      else:
+        decoded = binascii.hexlify(bytes(buf[inner_start:inner_end])).decode('ascii')
+      yield number, (der.read_oid(buf, oid_start, oid_end), decoded)
+    elif number in (RFC822_NAME, DNS_NAME, URI):
+      yield number, bytes(buf[content:stop]).decode('ascii', 'replace')
+    elif number == DIRECTORY_NAME:
+      yield number, der.format_name(der.read_name(buf, content, stop))
+    elif number == IP_ADDRESS:
+      yield number, _format_ip(bytes(buf[content:stop]))
+    elif number == REGISTERED_ID:
+      yield number, der.read_oid(buf, content, stop)
+    else:
+      yield number, binascii.hexlify(bytes(buf[content:stop])).decode('ascii')
+
 
 class SubjectAltName(object):
   """Decode a subject alternative name extensions's data.
 
-  .. warning::
-
-    Not all of the possible types are handled by this method. Currently, only
-    DNS names, IP addresses and URI are handled. If these types of names are
-    present in the ``asn1_data`` they will simply be ignored.
+  Every GeneralName type is decoded. IPv4 and IPv6 addresses are formatted
+  in their usual notation, and directory names as ``CN=..., O=...`` strings.
 
   See https://tools.ietf.org/html/rfc5280.
 
@@ -28,33 +86,106 @@ class SubjectAltName(object):
   """
 
   #: A list of DNS names.
-  dns = []
+  dns = ()
 
   #: A list of IP addresses.
-  ips = []
+  ips = ()
 
   #: A list of uniform resource identifiers.
-  uris = []
+  uris = ()
+
+  #: A list of email addresses.
+  emails = ()
+
+  #: A list of directory names.
+  directory_names = ()
+
+  #: A list of ``(type_id, value)`` pairs of other names.
+  other_names = ()
+
+  #: A list of registered IDs.
+  registered_ids = ()
+
+  #: Every name as a ``(type, value)`` pair in order, where ``type`` is one of
+  #: :data:`GENERAL_NAME_TYPES`.
+  names = ()
 
   def __init__(self, asn1_data):
-    for name in decode(asn1_data, asn1Spec=_SubjectAltName()):
-      if isinstance(name, _SubjectAltName):
-        for entry in range(len(name)):
-          component = name.getComponentByPosition(entry)
-          component_name = component.getName()
-          component_data = component.getComponent().asOctets()
-          if component_name == 'dNSName':
-            self.dns.append(bytes.decode(component_data))
-          elif component_name == 'iPAddress':
-            self.ips.append(socket.inet_ntoa(component_data))
-          elif component_name == 'uniformResourceIdentifier':
-            self.uris.append(bytes.decode(component_data))
-          else:
-            # FIXME: other types are currently not handled.
-            pass
+    self.dns = []
+    self.ips = []
+    self.uris = []
+    self.emails = []
+    self.directory_names = []
+    self.other_names = []
+    self.registered_ids = []
+    self.names = []
+    lists = {
+      OTHER_NAME: self.other_names,
+      RFC822_NAME: self.emails,
+      DNS_NAME: self.dns,
+      DIRECTORY_NAME: self.directory_names,
+      URI: self.uris,
+      IP_ADDRESS: self.ips,
+      REGISTERED_ID: self.registered_ids,
+    }
+    buf = bytearray(asn1_data)
+    _, content, end = der.read_header(buf, 0)
+    for number, value in _decode_general_names(buf, content, end):
+      if number in lists:
+        lists[number].append(value)
+      self.names.append((GENERAL_NAME_TYPES[number], value))
 
   def __repr__(self):
-    return 'SubjectAltName(dns={0}, ip={1}, uri={2})'.format(len(self.dns), len(self.ips), len(self.uris))
+    return 'SubjectAltName(dns={0}, ip={1}, uri={2}, email={3}, dirname={4}, othername={5})'.format(
+      len(self.dns), len(self.ips), len(self.uris), len(self.emails),
+      len(self.directory_names), len(self.other_names))
+
+
+#: Flat arrays of subject alternative names decoded in bulk by
+#: :func:`decode_subject_alt_names`. The i-th name belongs to the certificate at
+#: ``indices[i]``, has the GeneralName tag number ``types[i]`` and the value
+#: ``values[i]``.
+SubjectAltNames = collections.namedtuple('SubjectAltNames', ['indices', 'types', 'values'])
+
+
+def _subject_alt_name_data(certificate):
+  if isinstance(certificate, (bytes, bytearray)):
+    return certificate
+  if hasattr(certificate, 'extension_data'):
+    return certificate.extension_data('subjectAltName')
+  for idx in range(certificate.get_extension_count()):
+    ext = certificate.get_extension(idx)
+    if ext.get_short_name() == b'subjectAltName':
+      return ext.get_data()
+  return None
+
+
+def decode_subject_alt_names(certificates):
+  """Decode the subject alternative names of many certificates at once.
+
+  Names are decoded straight into flat arrays rather than into an object per
+  certificate, which is what large audits of names want.
+
+  :param iterable certificates: :class:`OpenSSL.crypto.X509` or
+    :class:`~py509.view.CertificateView` objects, or raw subject alternative
+    name extension data.
+  :rtype: :class:`SubjectAltNames`
+
+  """
+  indices = array('l')
+  types = array('b')
+  values = []
+  for idx, certificate in enumerate(certificates):
+    data = _subject_alt_name_data(certificate)
+    if not data:
+      continue
+    buf = bytearray(data)
+    _, content, end = der.read_header(buf, 0)
+    for number, value in _decode_general_names(buf, content, end):
+      indices.append(idx)
+      types.append(number)
+      values.append(value)
+  return SubjectAltNames(indices, types, values)
 
 
 class AuthorityInformationAccess(object):
@@ -95,7 +226,7 @@ class SubjectKeyIdentifier(object):
   def __init__(self, asn1_data):
     for authority in decode(asn1_data, asn1Spec=_SubjectKeyIdentifier()):
       if isinstance(authority, _SubjectKeyIdentifier):
-        self.id = binascii.hexlify(authority.asOctets())
+        self.id = binascii.hexlify(authority.asOctets()).decode('ascii')
 
 
 class AuthorityKeyIdentifier(object):
@@ -109,6 +240,6 @@ class AuthorityKeyIdentifier(object):
   def __init__(self, asn1_data):
     for authority in decode(asn1_data, asn1Spec=_AuthorityKeyIdentifier()):
       if isinstance(authority, _AuthorityKeyIdentifier):
-        self.id = binascii.hexlify(authority.getComponentByName('keyIdentifier').asOctets())
+        self.id = binascii.hexlify(authority.getComponentByName('keyIdentifier').asOctets()).decode('ascii')
         self.issuer = authority.getComponentByName('authorityCertIssuer')
         self.serial = authority.getComponentByName('authorityCertSerialNumber')
@@ -0,0 +1,214 @@
+"""Model the issuance graph of a corpus of certificates.
+
+:func:`~py509.utils.assemble_chain` answers "what is the chain of this leaf?".
+The :class:`IssuanceGraph` in this module instead answers questions about an
+entire inventory at once: which intermediates issue how many certificates,
+which certificates are orphaned and which are cross-signed.
+
+"""
+
+from array import array
+
+from py509.utils import CompactTree
+from py509.x509 import get_extensions
+
+
+def _key_identifiers(x509cert):
+  extensions = get_extensions(x509cert)
+  ski = aki = None
+  if 'subjectKeyIdentifier' in extensions:
+    ski = extensions['subjectKeyIdentifier'].id
+  if 'authorityKeyIdentifier' in extensions:
+    aki = extensions['authorityKeyIdentifier'].id
+  return ski, aki
+
+
+def _compress(adjacency):
+  """Pack a list of lists into offset and value arrays."""
+  offsets = array('l', [0])
+  values = array('l')
+  for targets in adjacency:
+    values.extend(targets)
+    offsets.append(len(values))
+  return offsets, values
+
+
+class IssuanceGraph(object):
+  """The issuance graph of a corpus of certificates.
+
+  The graph is built in a single pass over ``certificates``. Every distinct
+  certificate (by SHA-256 fingerprint) becomes a node with an integer id, and
+  an edge is added from each certificate to every certificate that could have
+  issued it: those whose subject key identifier matches its authority key
+  identifier or, when it has none, those whose subject matches its issuer.
+  Adjacency is stored as offset and value arrays of node ids.
+
+  :param iterable certificates: The certificates to add to the graph.
+
+  """
+
+  def __init__(self, certificates):
+    #: The certificate of each node, indexed by node id.
+    self.certificates = []
+    self._ids = {}
+    self._subjects = []
+    self._issuer_names = []
+    self._skis = []
+    self._akis = []
+
+    by_ski = {}
+    by_subject = {}
+    for x509cert in certificates:
+      fingerprint = x509cert.digest('sha256')
+      if fingerprint in self._ids:
+        continue
+      node = len(self.certificates)
+      self._ids[fingerprint] = node
+      self.certificates.append(x509cert)
+      subject = x509cert.get_subject().der()
+      ski, aki = _key_identifiers(x509cert)
+      self._subjects.append(subject)
+      self._issuer_names.append(x509cert.get_issuer().der())
+      self._skis.append(ski)
+      self._akis.append(aki)
+      by_subject.setdefault(subject, []).append(node)
+      if ski is not None:
+        by_ski.setdefault(ski, []).append(node)
+
+    issuers = []
+    issued = [[] for _ in self.certificates]
+    for node in range(len(self.certificates)):
+      if self.is_self_signed(node):
+        candidates = ()
+      elif self._akis[node] is not None and self._akis[node] in by_ski:
+        candidates = by_ski[self._akis[node]]
+      else:
+        candidates = by_subject.get(self._issuer_names[node], ())
+      found = [c for c in candidates if c != node]
+      issuers.append(found)
+      for issuer in found:
+        issued[issuer].append(node)
+
+    self._issuer_offsets, self._issuer_ids = _compress(issuers)
+    self._issued_offsets, self._issued_ids = _compress(issued)
+
+  def __len__(self):
+    return len(self.certificates)
+
+  def node(self, x509cert):
+    """Get a certificate's node id.
+
+    :param OpenSSL.crypto.X509 x509cert: A certificate in the graph.
+    :rtype: int
+    :raises KeyError: If the certificate is not in the graph.
+
+    """
+    return self._ids[x509cert.digest('sha256')]
+
+  def is_self_signed(self, node):
+    """Check if a node's certificate is self-issued."""
+    if self._subjects[node] != self._issuer_names[node]:
+      return False
+    return self._akis[node] is None or self._akis[node] == self._skis[node]
+
+  def issuers(self, node):
+    """The node ids of the certificates that could have issued a node."""
+    return self._issuer_ids[self._issuer_offsets[node]:self._issuer_offsets[node + 1]]
+
+  def issued(self, node):
+    """The node ids of the certificates directly issued by a node."""
+    return self._issued_ids[self._issued_offsets[node]:self._issued_offsets[node + 1]]
+
+  def issued_count(self, node):
+    """The number of certificates directly issued by a node."""
+    return self._issued_offsets[node + 1] - self._issued_offsets[node]
+
+  def roots(self):
+    """The node ids of self-signed certificates."""
+    return [n for n in range(len(self)) if self.is_self_signed(n)]
+
+  def orphans(self):
+    """The node ids of certificates whose issuer is not in the graph."""
+    return [n for n in range(len(self))
+            if not self.is_self_signed(n) and self._issuer_offsets[n] == self._issuer_offsets[n + 1]]
+
+  def cross_signed(self):
+    """Find cross-signed certificates.
+
+    :return: Groups of node ids whose certificates share a subject and key
+      identifier but were issued by different issuers.
+    :rtype: list[list[int]]
+
+    """
+    groups = {}
+    for node in range(len(self)):
+      if self._skis[node] is not None:
+        groups.setdefault((self._subjects[node], self._skis[node]), []).append(node)
+    return [nodes for nodes in groups.values()
+            if len(set(self._issuer_names[n] for n in nodes)) > 1]
+
+  def subtree_size(self, node):
+    """Count the certificates issued under a node, directly or indirectly.
+
+    :param int node: A node id.
+    :return: The number of distinct descendants of ``node``.
+    :rtype: int
+
+    """
+    seen = bytearray(len(self))
+    seen[node] = 1
+    stack = [node]
+    count = 0
+    while stack:
+      for child in self.issued(stack.pop()):
+        if not seen[child]:
+          seen[child] = 1
+          count += 1
+          stack.append(child)
+    return count
+
+  def path(self, node):
+    """Follow a node's first issuer up to a root or orphan.
+
+    :param int node: A node id.
+    :return: The node ids from ``node`` to the top of its hierarchy.
+    :rtype: list[int]
+
+    """
+    path = [node]
+    seen = set(path)
+    while True:
+      parents = [p for p in self.issuers(path[-1]) if p not in seen]
+      if not parents:
+        return path
+      path.append(parents[0])
+      seen.add(parents[0])
+
+  def to_tree(self):
+    """Lay the graph out as a tree for :func:`~py509.utils.tree`.
+
+    Each certificate appears once, under the first of its issuers that is
+    reached from a root or orphan. The tree's labels are the certificates.
+
+    :rtype: :class:`~py509.utils.CompactTree`
+
+    """
+    t = CompactTree()
+    placed = array('l', [-1]) * len(self)
+    tops = [n for n in range(len(self)) if self._issuer_offsets[n] == self._issuer_offsets[n + 1]]
+    # Certificates that only issue each other (cross-signed CAs with no
+    # independent root) are never reached from a top node; they are added as
+    # tops of their own once everything else has been placed.
+    for candidates in (tops, range(len(self))):
+      for top in candidates:
+        if placed[top] != -1:
+          continue
+        placed[top] = t.add(self.certificates[top])
+        stack = [top]
+        while stack:
+          node = stack.pop()
+          for child in self.issued(node):
+            if placed[child] == -1:
+              placed[child] = t.add(self.certificates[child], placed[node])
+              stack.append(child)
+    return t
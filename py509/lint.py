@@ -0,0 +1,312 @@
+"""Lint certificates against many policy rules in one pass.
+
+A :class:`Rule` declares the certificate fields it needs and checks them. A
+:class:`Linter` decodes the fields needed by any of its rules once per
+certificate, with :class:`~py509.x509.X509ExtensionDict` and the decoders in
+:mod:`py509.extensions`, and shares them between all of its rules. A corpus
+is linted in chunks across a pool, and results are streamed back in order
+while the time spent decoding each field and running each rule is recorded.
+
+Fields are looked up by name in :data:`FIELDS`. Extension fields are named
+after the extension, e.g. ``subjectAltName``, and are :class:`None` when the
+certificate does not have the extension. Rules are checked with a mapping of
+the fields they declared, and return :class:`None` when the certificate
+passes or a message explaining why it does not::
+
+  def _check_ev_policy(fields):
+    if '2.23.140.1.1' not in (fields['certificatePolicies'] or ''):
+      return 'Not an EV certificate'
+
+  EV_POLICY = Rule('ev_policy', ('certificatePolicies',), _check_ev_policy)
+
+Rules are sent to worker processes, so their checks must be module level
+functions.
+
+"""
+
+import collections
+import datetime
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from OpenSSL import crypto
+
+from py509 import metrics
+from py509.x509 import KEY_TYPES, get_extensions, load_certificate, parse_time
+
+
+ERROR = 'error'
+WARNING = 'warning'
+
+#: A rule a certificate failed.
+Finding = collections.namedtuple('Finding', ['rule', 'severity', 'message'])
+
+#: The findings of a certificate, which is the ``index``-th certificate linted.
+LintResult = collections.namedtuple('LintResult', ['index', 'findings'])
+
+
+class Rule(object):
+  """A policy rule.
+
+  :param str name: The rule's name.
+  :param tuple fields: The names of the fields the rule needs.
+  :param check: A function of a mapping of those fields to :class:`None` if
+    the certificate passes, or a message if it does not.
+  :param str severity: :data:`ERROR` or :data:`WARNING`.
+
+  """
+
+  def __init__(self, name, fields, check, severity=ERROR):
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+      raise ValueError('Unknown fields: {0}'.format(', '.join(unknown)))
+    self.name = name
+    self.fields = tuple(fields)
+    self.check = check
+    self.severity = severity
+
+  def __repr__(self):
+    return 'Rule({0!r}, {1!r})'.format(self.name, self.fields)
+
+
+def _extension(name):
+  def field(record):
+    extensions = record['extensions']
+    return extensions[name] if name in extensions else None
+  return field
+
+
+def _extensions(record):
+  return get_extensions(record.x509cert)
+
+
+def _critical(record):
+  extensions = record['extensions']
+  # dict.get bypasses the decoders, so these are the raw extensions.
+  return frozenset(name for name in extensions if dict.get(extensions, name).get_critical())
+
+
+def _is_ca(record):
+  constraints = record['basicConstraints']
+  return bool(constraints) and 'CA:TRUE' in constraints
+
+
+#: The fields rules may declare, by name, and the functions that decode them.
+FIELDS = {
+  'x509': lambda record: record.x509cert,
+  'extensions': _extensions,
+  'critical': _critical,
+  'version': lambda record: record.x509cert.get_version(),
+  'serial': lambda record: record.x509cert.get_serial_number(),
+  'subject': lambda record: record.x509cert.get_subject(),
+  'issuer': lambda record: record.x509cert.get_issuer(),
+  'self_signed': lambda record: record.x509cert.get_subject() == record.x509cert.get_issuer(),
+  'signature_algorithm': lambda record: record.x509cert.get_signature_algorithm().decode('ascii'),
+  'not_before': lambda record: parse_time(record.x509cert.get_notBefore()),
+  'not_after': lambda record: parse_time(record.x509cert.get_notAfter()),
+  'key_type': lambda record: KEY_TYPES.get(record.x509cert.get_pubkey().type(), 'unknown'),
+  'key_bits': lambda record: record.x509cert.get_pubkey().bits(),
+  'is_ca': _is_ca,
+}
+for _name in ('authorityInfoAccess', 'authorityKeyIdentifier', 'basicConstraints', 'certificatePolicies',
+              'crlDistributionPoints', 'extendedKeyUsage', 'keyUsage', 'nameConstraints', 'subjectAltName',
+              'subjectKeyIdentifier'):
+  FIELDS[_name] = _extension(_name)
+
+
+class _FieldError(object):
+
+  def __init__(self, error):
+    self.error = error
+
+
+class _Record(object):
+  """The fields of a certificate, each decoded the first time it is needed."""
+
+  def __init__(self, x509cert, timings):
+    self.x509cert = x509cert
+    self.timings = timings
+    self.values = {}
+
+  def __getitem__(self, name):
+    if name not in self.values:
+      start = metrics.clock()
+      try:
+        self.values[name] = FIELDS[name](self)
+      except Exception as e:
+        self.values[name] = _FieldError('Cannot decode {0}: {1}'.format(name, e))
+      self.timings['field:' + name].append(metrics.clock() - start)
+    value = self.values[name]
+    if isinstance(value, _FieldError):
+      raise ValueError(value.error)
+    return value
+
+
+def _lint_one(certificate, rules, timings):
+  if not isinstance(certificate, crypto.X509):
+    try:
+      certificate = load_certificate(crypto.FILETYPE_ASN1, certificate)
+    except crypto.Error as e:
+      return [Finding('parse', ERROR, 'Cannot parse the certificate: {0}'.format(e))]
+  record = _Record(certificate, timings)
+  findings = []
+  for rule in rules:
+    try:
+      fields = dict((name, record[name]) for name in rule.fields)
+    except ValueError as e:
+      findings.append(Finding(rule.name, ERROR, str(e)))
+      continue
+    start = metrics.clock()
+    try:
+      message = rule.check(fields)
+    except Exception as e:
+      message = 'The rule failed: {0!r}'.format(e)
+    timings['rule:' + rule.name].append(metrics.clock() - start)
+    if message is not None:
+      findings.append(Finding(rule.name, rule.severity, message))
+  return findings
+
+
+def _lint_chunk(task):
+  """Lint a chunk of certificates, returning their findings and timings."""
+  rules, chunk = task
+  timings = collections.defaultdict(list)
+  findings = [_lint_one(certificate, rules, timings) for certificate in chunk]
+  return findings, dict(timings)
+
+
+class Linter(object):
+  """Lint certificates against a set of rules.
+
+  :param list[Rule] rules: The rules. Defaults to :data:`DEFAULT_RULES`.
+  :param int processes: The size of the pool. Defaults to the number of CPUs;
+    ``1`` lints in the calling thread.
+  :param int chunk_size: The number of certificates sent to the pool at once.
+  :param str pool: ``process`` or ``thread``. Rules are Python code, so only
+    processes lint in parallel.
+
+  """
+
+  def __init__(self, rules=None, processes=None, chunk_size=256, pool='process'):
+    self.rules = list(rules if rules is not None else DEFAULT_RULES)
+    self.processes = processes or multiprocessing.cpu_count()
+    self.chunk_size = chunk_size
+    self.pool = pool
+    #: The time spent on each field (``field:<name>``) and rule
+    #: (``rule:<name>``); call ``summary()`` on it for a table.
+    self.timings = metrics.Registry()
+
+  def _tasks(self, certificates, to_der):
+    certificates = iter(certificates)
+    while True:
+      chunk = list(itertools.islice(certificates, self.chunk_size))
+      if not chunk:
+        return
+      if to_der:
+        # Certificates cannot be pickled, so they cross to the workers DER
+        # encoded.
+        chunk = [crypto.dump_certificate(crypto.FILETYPE_ASN1, c) if isinstance(c, crypto.X509) else c
+                 for c in chunk]
+      yield self.rules, chunk
+
+  def lint(self, certificates):
+    """Lint certificates.
+
+    :param iterable certificates: :class:`OpenSSL.crypto.X509` objects or DER
+      encoded certificates, e.g. from :func:`~py509.x509.der_certificates`.
+      Any iterable is accepted, and it is consumed as results are produced.
+    :return: An iterator of results, in the order of the certificates.
+    :rtype: iterator[:class:`LintResult`]
+
+    """
+    workers = None
+    if self.processes == 1:
+      results = (_lint_chunk(task) for task in self._tasks(certificates, False))
+    elif self.pool == 'thread':
+      workers = ThreadPool(self.processes)
+      results = workers.imap(_lint_chunk, self._tasks(certificates, False))
+    else:
+      workers = multiprocessing.Pool(self.processes)
+      results = workers.imap(_lint_chunk, self._tasks(certificates, True))
+
+    index = 0
+    try:
+      for findings, timings in results:
+        for stage, values in timings.items():
+          for seconds in values:
+            self.timings.record(stage, seconds)
+        for certificate_findings in findings:
+          yield LintResult(index, certificate_findings)
+          index += 1
+    finally:
+      if workers is not None:
+        workers.terminate()
+        workers.join()
+
+
+MIN_RSA_BITS = 2048
+MAX_VALIDITY = datetime.timedelta(days=398)
+
+
+def _check_key_size(fields):
+  if fields['key_type'] in ('RSA', 'DSA') and fields['key_bits'] < MIN_RSA_BITS:
+    return '{0} key of {1} bits is smaller than {2}'.format(fields['key_type'], fields['key_bits'], MIN_RSA_BITS)
+
+
+def _check_validity_period(fields):
+  if fields['is_ca']:
+    return None
+  validity = fields['not_after'] - fields['not_before']
+  if validity > MAX_VALIDITY:
+    return 'Valid for {0} days, longer than {1}'.format(validity.days, MAX_VALIDITY.days)
+
+
+def _check_subject_alt_name(fields):
+  if fields['is_ca']:
+    return None
+  san = fields['subjectAltName']
+  if san is None or not (san.dns or san.ips):
+    return 'No DNS name or IP address in the subject alternative names'
+
+
+def _check_authority_info_access(fields):
+  if fields['self_signed']:
+    return None
+  aia = fields['authorityInfoAccess']
+  if aia is None or not (aia.ocsp or aia.ca_issuer):
+    return 'No OCSP responder or CA issuer in the authority information access'
+
+
+def _check_basic_constraints(fields):
+  if fields['is_ca'] and 'basicConstraints' not in fields['critical']:
+    return 'The basic constraints of a CA must be critical'
+  if fields['is_ca'] and fields['keyUsage'] is not None and 'Certificate Sign' not in fields['keyUsage']:
+    return 'A CA\'s key usage must allow certificate signing'
+
+
+def _check_key_identifiers(fields):
+  if fields['subjectKeyIdentifier'] is None:
+    return 'No subject key identifier'
+  if not fields['self_signed'] and fields['authorityKeyIdentifier'] is None:
+    return 'No authority key identifier'
+
+
+KEY_SIZE = Rule('key_size', ('key_type', 'key_bits'), _check_key_size)
+VALIDITY_PERIOD = Rule('validity_period', ('is_ca', 'not_before', 'not_after'), _check_validity_period)
+SUBJECT_ALT_NAME = Rule('subject_alt_name', ('is_ca', 'subjectAltName'), _check_subject_alt_name)
+AUTHORITY_INFO_ACCESS = Rule('authority_info_access', ('self_signed', 'authorityInfoAccess'),
+                             _check_authority_info_access, severity=WARNING)
+BASIC_CONSTRAINTS = Rule('basic_constraints', ('is_ca', 'critical', 'keyUsage'), _check_basic_constraints)
+KEY_IDENTIFIERS = Rule('key_identifiers', ('self_signed', 'subjectKeyIdentifier', 'authorityKeyIdentifier'),
+                       _check_key_identifiers, severity=WARNING)
+
+#: The rules a :class:`Linter` checks by default.
+DEFAULT_RULES = (
+  KEY_SIZE,
+  VALIDITY_PERIOD,
+  SUBJECT_ALT_NAME,
+  AUTHORITY_INFO_ACCESS,
+  BASIC_CONSTRAINTS,
+  KEY_IDENTIFIERS,
+)
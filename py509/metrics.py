@@ -0,0 +1,183 @@
+"""Opt-in instrumentation of py509's hot paths.
+
+The stages that dominate py509's running time are timed with :func:`timed`.
+Nothing is recorded until a callback is added with :func:`add_callback` or a
+:class:`Registry` is enabled with :func:`enable`; until then :func:`timed`
+returns a shared no-op context manager.
+
+The instrumented stages are:
+
+  - ``pem_scan``: finding PEM armored certificates in a buffer.
+  - ``parse``: parsing a certificate with pyOpenSSL.
+  - ``extension_decode``: decoding an extension's ASN.1 data.
+  - ``aia_fetch``: fetching a certificate over HTTP.
+  - ``host_fetch``: fetching a host's certificate over TLS.
+  - ``revocation_fetch``: sending an OCSP request or fetching a CRL.
+  - ``chain_assembly``: assembling a trust chain.
+  - ``verification``: verifying a certificate against a trust store.
+
+"""
+
+import bisect
+import threading
+import time
+
+from tabulate import tabulate
+
+
+#: The clock stages are timed with, in seconds.
+clock = getattr(time, 'perf_counter', time.time)
+
+_callbacks = []
+
+
+class Histogram(object):
+  """A latency histogram with exponentially sized buckets.
+
+  Bucket boundaries double from one microsecond up to roughly two minutes, so
+  percentiles are accurate to within a factor of two.
+
+  """
+
+  bounds = [1e-6 * 2 ** i for i in range(28)]
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.buckets = [0] * (len(self.bounds) + 1)
+
+  def record(self, seconds):
+    self.count += 1
+    self.total += seconds
+    self.max = max(self.max, seconds)
+    self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+
+  @property
+  def mean(self):
+    return self.total / self.count if self.count else 0.0
+
+  def percentile(self, q):
+    """Estimate a percentile.
+
+    :param float q: The percentile, between 0 and 100.
+    :return: The upper bound of the bucket holding the percentile, in seconds.
+    :rtype: float
+
+    """
+    if not self.count:
+      return 0.0
+    rank = q / 100.0 * self.count
+    seen = 0
+    for idx, n in enumerate(self.buckets):
+      seen += n
+      if n and seen >= rank:
+        return min(self.bounds[idx], self.max) if idx < len(self.bounds) else self.max
+    return self.max
+
+
+class Registry(object):
+  """Collect a count and a latency histogram for each stage."""
+
+  def __init__(self):
+    self.histograms = {}
+    self._lock = threading.Lock()
+
+  def __call__(self, stage, seconds):
+    self.record(stage, seconds)
+
+  def record(self, stage, seconds):
+    with self._lock:
+      histogram = self.histograms.get(stage)
+      if histogram is None:
+        histogram = self.histograms[stage] = Histogram()
+      histogram.record(seconds)
+
+  def summary(self):
+    """Summarize the recorded stages.
+
+    :return: A table with one row per stage, slowest total first: the stage,
+      its count, and its total, mean, median, 99th percentile and maximum
+      latency in milliseconds.
+    :rtype: str
+
+    """
+    rows = []
+    for stage, h in sorted(self.histograms.items(), key=lambda i: -i[1].total):
+      rows.append([stage, h.count] + [1000 * v for v in (
+        h.total, h.mean, h.percentile(50), h.percentile(99), h.max)])
+    return tabulate(rows, headers=['stage', 'count', 'total ms', 'mean ms', 'p50 ms', 'p99 ms', 'max ms'],
+                    floatfmt='.3f')
+
+
+def add_callback(callback):
+  """Call ``callback(stage, seconds)`` every time a stage completes."""
+  _callbacks.append(callback)
+
+
+def remove_callback(callback):
+  """Stop calling a callback added with :func:`add_callback`."""
+  _callbacks.remove(callback)
+
+
+def enable(registry=None):
+  """Start recording stages into a registry.
+
+  :param Registry registry: The registry to record into. Defaults to a new
+    registry.
+  :return: The registry.
+  :rtype: :class:`Registry`
+
+  """
+  registry = registry if registry is not None else Registry()
+  add_callback(registry)
+  return registry
+
+
+def disable(registry):
+  """Stop recording stages into a registry enabled with :func:`enable`."""
+  remove_callback(registry)
+
+
+class _Timer(object):
+
+  __slots__ = ('stage', 'start')
+
+  def __init__(self, stage):
+    self.stage = stage
+
+  def __enter__(self):
+    self.start = clock()
+    return self
+
+  def __exit__(self, *exc_info):
+    elapsed = clock() - self.start
+    for callback in list(_callbacks):
+      callback(self.stage, elapsed)
+
+
+class _NoopTimer(object):
+
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    pass
+
+
+_NOOP = _NoopTimer()
+
+
+def timed(stage):
+  """Time a stage.
+
+  Use the return value as a context manager around the stage's work.
+
+  :param str stage: The name of the stage.
+
+  """
+  if not _callbacks:
+    return _NOOP
+  return _Timer(stage)
@@ -0,0 +1,689 @@
+"""Check certificates for revocation with OCSP and CRLs.
+
+A :class:`RevocationChecker` checks the chains produced by
+:func:`~py509.utils.assemble_chain`. Certificates with an OCSP responder in
+their authority information access extension are checked with OCSP; the others
+fall back to the CRLs named in their CRL distribution points. OCSP requests
+are grouped per responder and sent over pooled connections, and both OCSP
+responses and CRLs are cached until their next update.
+
+Checking many certificates against very large CRLs is better served by a
+:class:`RevocationIndex`: a :class:`RevocationIndexBuilder` streams CRLs into
+a hash table of revoked serial numbers keyed by their issuer's key identifier,
+which is written to a file and memory mapped, so that lookups take constant
+time and the file is shared between processes.
+
+"""
+
+import binascii
+import calendar
+import collections
+import datetime
+import logging
+import mmap
+import struct
+import threading
+import zlib
+from multiprocessing.pool import ThreadPool
+
+from cryptography import x509 as cx509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import dsa, ec, padding, rsa, utils
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import SignatureAlgorithmOID
+import urllib3
+
+from py509 import der, metrics
+from py509.x509 import get_extensions
+
+
+log = logging.getLogger(__name__)
+
+
+GOOD = 'good'
+REVOKED = 'revoked'
+UNKNOWN = 'unknown'
+
+#: How far OCSP responders' and CRL issuers' clocks may be from ours.
+CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+#: The revocation status of a certificate. ``status`` is one of :data:`GOOD`,
+#: :data:`REVOKED` or :data:`UNKNOWN`; ``source`` is the URL the status came
+#: from; ``error`` explains an :data:`UNKNOWN` status.
+RevocationStatus = collections.namedtuple(
+  'RevocationStatus', ['status', 'revoked_at', 'next_update', 'source', 'error'])
+
+
+def _unknown(source, error):
+  return RevocationStatus(UNKNOWN, None, None, source, error)
+
+
+def _text(value):
+  return value.decode('ascii') if isinstance(value, bytes) else value
+
+
+def ocsp_url(x509cert):
+  """Get a certificate's OCSP responder URL, if it has one."""
+  extensions = get_extensions(x509cert)
+  if 'authorityInfoAccess' not in extensions:
+    return None
+  return _text(extensions['authorityInfoAccess'].ocsp)
+
+
+def crl_urls(x509cert):
+  """Get the URLs of a certificate's CRL distribution points."""
+  try:
+    points = x509cert.to_cryptography().extensions.get_extension_for_class(cx509.CRLDistributionPoints)
+  except cx509.ExtensionNotFound:
+    return []
+  urls = []
+  for point in points.value:
+    for name in point.full_name or ():
+      if isinstance(name, cx509.UniformResourceIdentifier):
+        urls.append(name.value)
+  return urls
+
+
+def ocsp_request(x509cert, issuer):
+  """Build a DER encoded OCSP request for a certificate.
+
+  :param OpenSSL.crypto.X509 x509cert: The certificate to check.
+  :param OpenSSL.crypto.X509 issuer: The certificate's issuer.
+  :rtype: bytes
+
+  """
+  builder = ocsp.OCSPRequestBuilder().add_certificate(
+    x509cert.to_cryptography(), issuer.to_cryptography(), hashes.SHA1())
+  return builder.build().public_bytes(serialization.Encoding.DER)
+
+
+def _verify_signature(public_key, signature, data, hash_algorithm):
+  if isinstance(public_key, rsa.RSAPublicKey):
+    public_key.verify(signature, data, padding.PKCS1v15(), hash_algorithm)
+  elif isinstance(public_key, ec.EllipticCurvePublicKey):
+    public_key.verify(signature, data, ec.ECDSA(hash_algorithm))
+  elif isinstance(public_key, dsa.DSAPublicKey):
+    public_key.verify(signature, data, hash_algorithm)
+  else:
+    public_key.verify(signature, data)
+
+
+def _verify_response(response, issuer, now):
+  """Check that an OCSP response was signed by the issuer or its delegate."""
+  signer = issuer
+  for delegate in response.certificates:
+    if delegate.issuer == issuer.subject:
+      try:
+        usage = delegate.extensions.get_extension_for_class(cx509.ExtendedKeyUsage).value
+      except cx509.ExtensionNotFound:
+        continue
+      if cx509.oid.ExtendedKeyUsageOID.OCSP_SIGNING in usage:
+        if not delegate.not_valid_before - CLOCK_SKEW <= now <= delegate.not_valid_after + CLOCK_SKEW:
+          raise ValueError('The OCSP responder\'s certificate is not valid now')
+        _verify_signature(issuer.public_key(), delegate.signature, delegate.tbs_certificate_bytes,
+                          delegate.signature_hash_algorithm)
+        signer = delegate
+        break
+  _verify_signature(signer.public_key(), response.signature, response.tbs_response_bytes,
+                    response.signature_hash_algorithm)
+
+
+class CRLSet(object):
+  """The serial numbers revoked by a CRL, hashed for constant time lookups.
+
+  :param bytes data: A DER or PEM encoded CRL.
+  :param OpenSSL.crypto.X509 issuer: If given, the CRL's signature is checked
+    against this issuer.
+  :raises ValueError: If the CRL cannot be loaded or its signature is invalid.
+
+  """
+
+  def __init__(self, data, issuer=None):
+    backend = default_backend()
+    if data.lstrip().startswith(b'-----'):
+      crl = cx509.load_pem_x509_crl(data, backend)
+    else:
+      crl = cx509.load_der_x509_crl(data, backend)
+    if issuer is not None and not crl.is_signature_valid(issuer.to_cryptography().public_key()):
+      raise ValueError('Invalid CRL signature')
+    #: The DER encoded name of the CRL's issuer.
+    self.issuer = crl.issuer.public_bytes(backend)
+    #: When the CRL should next be updated.
+    self.next_update = crl.next_update
+    self._revoked = dict((entry.serial_number, entry.revocation_date) for entry in crl)
+
+  def __len__(self):
+    return len(self._revoked)
+
+  def __contains__(self, serial):
+    return serial in self._revoked
+
+  def revoked_at(self, serial):
+    """When a serial number was revoked, or :class:`None` if it was not."""
+    return self._revoked.get(serial)
+
+  def status(self, x509cert, source=None):
+    """Look up a certificate issued by the CRL's issuer.
+
+    :rtype: :class:`RevocationStatus`
+
+    """
+    if x509cert.get_issuer().der() != self.issuer:
+      return _unknown(source, 'The CRL was not issued by the certificate\'s issuer')
+    if self.next_update is not None and self.next_update < datetime.datetime.utcnow() - CLOCK_SKEW:
+      return _unknown(source, 'The CRL has expired')
+    revoked_at = self._revoked.get(x509cert.get_serial_number())
+    return RevocationStatus(REVOKED if revoked_at else GOOD, revoked_at, self.next_update, source, None)
+
+
+class RevocationChecker(object):
+  """Check certificates for revocation, caching responses.
+
+  :param urllib3.PoolManager http: The connection pool to use.
+  :param int default_ttl: How long, in seconds, to cache responses and CRLs
+    that have no next update time.
+  :param int max_responders: The number of responders queried in parallel.
+  :param int timeout: The timeout, in seconds, of each request.
+
+  """
+
+  def __init__(self, http=None, default_ttl=3600, max_responders=8, timeout=10):
+    self.http = http or urllib3.PoolManager(maxsize=4)
+    self.default_ttl = default_ttl
+    self.max_responders = max_responders
+    self.timeout = timeout
+    #: The number of OCSP requests sent and CRLs fetched.
+    self.fetches = 0
+    #: The number of statuses answered from the cache.
+    self.cache_hits = 0
+    self._ocsp_cache = {}
+    self._crl_cache = {}
+    self._lock = threading.Lock()
+
+  def _expires(self, next_update):
+    if next_update is None:
+      return datetime.datetime.utcnow() + datetime.timedelta(seconds=self.default_ttl)
+    return next_update
+
+  def _cached(self, cache, key):
+    with self._lock:
+      entry = cache.get(key)
+      if entry is None:
+        return None
+      if entry[1] <= datetime.datetime.utcnow():
+        del cache[key]
+        return None
+      self.cache_hits += 1
+      return entry[0]
+
+  def _store(self, cache, key, value, next_update):
+    with self._lock:
+      cache[key] = (value, self._expires(next_update))
+
+  def _fetch(self, method, url, body=None, headers=None):
+    with self._lock:
+      self.fetches += 1
+    with metrics.timed('revocation_fetch'):
+      rsp = self.http.request(method, url, body=body, headers=headers, timeout=self.timeout)
+    if rsp.status != 200:
+      raise RuntimeError('{0} responded with status {1}'.format(url, rsp.status))
+    return rsp.data
+
+  def _ocsp(self, url, x509cert, issuer):
+    key = (issuer.digest('sha256'), x509cert.get_serial_number())
+    status = self._cached(self._ocsp_cache, key)
+    if status is not None:
+      return status
+    try:
+      data = self._fetch('POST', url, body=ocsp_request(x509cert, issuer),
+                         headers={'Content-Type': 'application/ocsp-request'})
+      response = ocsp.load_der_ocsp_response(data)
+      if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+        return _unknown(url, 'OCSP responder returned {0}'.format(response.response_status.name))
+      now = datetime.datetime.utcnow()
+      _verify_response(response, issuer.to_cryptography(), now)
+      if response.serial_number != x509cert.get_serial_number():
+        return _unknown(url, 'OCSP response is for another certificate')
+      if response.this_update > now + CLOCK_SKEW:
+        return _unknown(url, 'OCSP response is not yet valid')
+      if response.next_update is not None and response.next_update < now - CLOCK_SKEW:
+        return _unknown(url, 'OCSP response has expired')
+    except InvalidSignature:
+      return _unknown(url, 'Invalid OCSP response signature')
+    except Exception as e:
+      log.warning('OCSP request to %s failed: %s', url, e)
+      return _unknown(url, str(e))
+
+    if response.certificate_status == ocsp.OCSPCertStatus.GOOD:
+      status = RevocationStatus(GOOD, None, response.next_update, url, None)
+    elif response.certificate_status == ocsp.OCSPCertStatus.REVOKED:
+      status = RevocationStatus(REVOKED, response.revocation_time, response.next_update, url, None)
+    else:
+      status = RevocationStatus(UNKNOWN, None, response.next_update, url, 'Unknown to the OCSP responder')
+    self._store(self._ocsp_cache, key, status, response.next_update)
+    return status
+
+  def crl(self, url, issuer=None):
+    """Fetch a CRL, or get it from the cache.
+
+    :param str url: The CRL's URL.
+    :param OpenSSL.crypto.X509 issuer: If given, the CRL's signature is checked
+      against this issuer.
+    :rtype: :class:`CRLSet`
+
+    """
+    # A CRL is cached per issuer it was checked against, so one fetched
+    # unchecked or checked against another issuer is never reused.
+    key = (url, issuer.digest('sha256') if issuer is not None else None)
+    crl = self._cached(self._crl_cache, key)
+    if crl is None:
+      crl = CRLSet(self._fetch('GET', url), issuer)
+      self._store(self._crl_cache, key, crl, crl.next_update)
+    return crl
+
+  def _crl(self, urls, x509cert, issuer):
+    for url in urls:
+      try:
+        return self.crl(url, issuer).status(x509cert, url)
+      except Exception as e:
+        log.warning('Failed to check the CRL at %s: %s', url, e)
+    return _unknown(urls[0] if urls else None, 'No OCSP responder or CRL available')
+
+  def check(self, x509cert, issuer):
+    """Check a certificate.
+
+    :param OpenSSL.crypto.X509 x509cert: The certificate to check.
+    :param OpenSSL.crypto.X509 issuer: The certificate's issuer.
+    :rtype: :class:`RevocationStatus`
+
+    """
+    return self.check_many([(x509cert, issuer)])[0]
+
+  def check_many(self, pairs):
+    """Check many certificates.
+
+    OCSP requests are grouped by responder. Responders are queried in
+    parallel, and each responder's requests are sent one after the other over
+    a pooled connection.
+
+    :param list pairs: ``(certificate, issuer)`` pairs.
+    :return: A status for each pair, in order.
+    :rtype: list[:class:`RevocationStatus`]
+
+    """
+    statuses = [None] * len(pairs)
+    by_responder = collections.OrderedDict()
+    for idx, (x509cert, issuer) in enumerate(pairs):
+      by_responder.setdefault(ocsp_url(x509cert), []).append(idx)
+
+    def run(item):
+      url, indices = item
+      for idx in indices:
+        x509cert, issuer = pairs[idx]
+        if url:
+          statuses[idx] = self._ocsp(url, x509cert, issuer)
+        else:
+          statuses[idx] = self._crl(crl_urls(x509cert), x509cert, issuer)
+
+    items = list(by_responder.items())
+    if len(items) == 1:
+      run(items[0])
+    else:
+      pool = ThreadPool(min(self.max_responders, len(items)))
+      try:
+        pool.map(run, items)
+      finally:
+        pool.close()
+    return statuses
+
+  def check_chain(self, chain):
+    """Check every certificate in a chain but its root.
+
+    :param list[OpenSSL.crypto.X509] chain: A chain, root first, as returned
+      by :func:`~py509.utils.assemble_chain`.
+    :return: A status for each certificate in the chain, with :class:`None`
+      for the root.
+    :rtype: list[:class:`RevocationStatus`]
+
+    """
+    pairs = [(chain[idx], chain[idx - 1]) for idx in range(1, len(chain))]
+    return [None] + self.check_many(pairs)
+
+
+_INDEX_MAGIC = b'PY509RVX'
+_INDEX_VERSION = 2
+# magic, version, issuer count, entry count, slot count
+_HEADER = struct.Struct('>8sIIII')
+# key identifier length, key identifier, next update
+_ISSUER = struct.Struct('>B32sq')
+# issuer number (0 for an empty slot), revocation time, serial length, serial
+_SLOT = struct.Struct('>IqB23s')
+_MAX_SERIAL = 23
+_AKI_OID = '2.5.29.35'
+# The hashes of the CRL signature algorithms add_crl can check.
+_SIGNATURE_HASHES = {
+  SignatureAlgorithmOID.RSA_WITH_SHA1.dotted_string: hashes.SHA1,
+  SignatureAlgorithmOID.RSA_WITH_SHA224.dotted_string: hashes.SHA224,
+  SignatureAlgorithmOID.RSA_WITH_SHA256.dotted_string: hashes.SHA256,
+  SignatureAlgorithmOID.RSA_WITH_SHA384.dotted_string: hashes.SHA384,
+  SignatureAlgorithmOID.RSA_WITH_SHA512.dotted_string: hashes.SHA512,
+  SignatureAlgorithmOID.ECDSA_WITH_SHA1.dotted_string: hashes.SHA1,
+  SignatureAlgorithmOID.ECDSA_WITH_SHA224.dotted_string: hashes.SHA224,
+  SignatureAlgorithmOID.ECDSA_WITH_SHA256.dotted_string: hashes.SHA256,
+  SignatureAlgorithmOID.ECDSA_WITH_SHA384.dotted_string: hashes.SHA384,
+  SignatureAlgorithmOID.ECDSA_WITH_SHA512.dotted_string: hashes.SHA512,
+  SignatureAlgorithmOID.DSA_WITH_SHA1.dotted_string: hashes.SHA1,
+  SignatureAlgorithmOID.DSA_WITH_SHA224.dotted_string: hashes.SHA224,
+  SignatureAlgorithmOID.DSA_WITH_SHA256.dotted_string: hashes.SHA256,
+}
+# The number of bytes of a CRL hashed at once.
+_HASH_CHUNK = 1 << 16
+
+
+def _integer_bytes(value):
+  """Encode an integer as the contents of a DER INTEGER."""
+  length = (value + (value < 0)).bit_length() // 8 + 1
+  value &= (1 << (8 * length)) - 1
+  return binascii.unhexlify('{0:0{1}x}'.format(value, 2 * length))
+
+
+def _timestamp(value):
+  return calendar.timegm(value.utctimetuple()) if value else 0
+
+
+def _datetime(value):
+  return datetime.datetime.utcfromtimestamp(value) if value else None
+
+
+def _key_identifier(x509cert, name):
+  extensions = get_extensions(x509cert)
+  if name not in extensions:
+    return None
+  value = extensions[name].id
+  return binascii.unhexlify(value) if value else None
+
+
+def _slot_hash(key_id, serial):
+  return zlib.crc32(key_id + serial) & 0xffffffff
+
+
+def _crl_buffer(data):
+  """Get a buffer of DER from a DER or PEM encoded CRL."""
+  if data[:1] != b'\x30':
+    return bytearray(cx509.load_pem_x509_crl(bytes(data), default_backend()).public_bytes(
+      serialization.Encoding.DER))
+  if isinstance(data, bytearray) or (isinstance(data, mmap.mmap) and bytes is not str):
+    return data
+  return bytearray(data)
+
+
+def _verify_crl(buf, public_key):
+  """Check a DER encoded CRL's signature, hashing its TBSCertList in place.
+
+  :raises ValueError: If the signature is invalid or its algorithm is not
+    supported.
+
+  """
+  (_, tbs, _, tbs_end), (_, algorithm, _, _), (_, _, signature, signature_end) = der.children(buf, 0)[:3]
+  oid = der.read_oid(buf, *der.children(buf, algorithm)[0][2:])
+  if oid not in _SIGNATURE_HASHES:
+    raise ValueError('Unsupported CRL signature algorithm {0}'.format(oid))
+  hash_algorithm = _SIGNATURE_HASHES[oid]()
+  digest = hashes.Hash(hash_algorithm, default_backend())
+  for offset in range(tbs, tbs_end, _HASH_CHUNK):
+    digest.update(bytes(buf[offset:min(offset + _HASH_CHUNK, tbs_end)]))
+  try:
+    # Skip the BIT STRING's byte of unused bits.
+    _verify_signature(public_key, bytes(buf[signature + 1:signature_end]), digest.finalize(),
+                      utils.Prehashed(hash_algorithm))
+  except InvalidSignature:
+    raise ValueError('Invalid CRL signature')
+
+
+def _read_crl(buf):
+  """Walk a DER encoded CRL in place.
+
+  :return: The CRL's this update and next update times, the key identifier in
+    its authority key identifier extension, and an iterator of ``(serial,
+    revoked_at)`` pairs, where ``serial`` holds the contents of the serial
+    number's INTEGER.
+
+  """
+  _, content, end = der.read_header(buf, 0)
+  _, tbs, tbs_end = der.read_header(buf, content, end)
+  fields = list(der.iter_elements(buf, tbs, tbs_end))
+  if fields[0][0] == der.INTEGER:
+    fields = fields[1:]
+  # signature, issuer
+  this_update = der.read_time(fields[2][0], buf, fields[2][2], fields[2][3])
+  fields = fields[3:]
+  next_update = None
+  if fields and fields[0][0] in (der.UTC_TIME, der.GENERALIZED_TIME):
+    next_update = der.read_time(fields[0][0], buf, fields[0][2], fields[0][3])
+    fields = fields[1:]
+  revoked = None
+  if fields and fields[0][0] == der.SEQUENCE:
+    revoked = fields[0]
+    fields = fields[1:]
+
+  key_id = None
+  if fields and fields[0][0] == der.context(0):
+    for _, ext, _, _ in der.children(buf, der.children(buf, fields[0][1])[0][1]):
+      parts = der.children(buf, ext)
+      if der.read_oid(buf, *parts[0][2:]) != _AKI_OID:
+        continue
+      for tag, _, start, stop in der.children(buf, parts[-1][2]):
+        if tag == der.context(0, constructed=False):
+          key_id = bytes(buf[start:stop])
+
+  def entries():
+    if revoked is None:
+      return
+    for _, _, entry, entry_end in der.iter_elements(buf, revoked[2], revoked[3]):
+      _, serial_start, serial_end = der.read_header(buf, entry, entry_end)
+      tag, time_start, time_end = der.read_header(buf, serial_end, entry_end)
+      yield bytes(buf[serial_start:serial_end]), der.read_time(tag, buf, time_start, time_end)
+
+  return this_update, next_update, key_id, entries()
+
+
+class RevocationIndexBuilder(object):
+  """Build a :class:`RevocationIndex` from CRLs.
+
+  Entries are packed as they are read, so CRLs with hundreds of thousands of
+  entries are ingested without building an object per entry. Only the newest
+  CRL of each issuer is kept, and a CRL whose signature was checked is never
+  replaced by one whose signature was not.
+
+  """
+
+  def __init__(self):
+    # Maps a key identifier to its issuer number, its CRL's this update and
+    # next update, and whether its CRL's signature was checked.
+    self._issuers = collections.OrderedDict()
+    # Maps an issuer number to its CRL's packed entries.
+    self._slots = {}
+
+  def __len__(self):
+    return sum(len(slots) for slots in self._slots.values()) // _SLOT.size
+
+  def add_crl(self, data, issuer=None):
+    """Add the entries of a CRL.
+
+    :param bytes data: A DER or PEM encoded CRL. DER may also be given as a
+      :class:`mmap.mmap`, which is read in place.
+    :param OpenSSL.crypto.X509 issuer: The CRL's issuer. If given, the CRL's
+      signature is checked and the issuer's subject key identifier is used
+      instead of the CRL's authority key identifier. If not, the CRL is
+      trusted as is, and cannot replace a CRL whose signature was checked.
+    :return: The number of entries added, which is 0 if the issuer's CRL
+      already added is kept. A CRL whose signature was checked replaces one
+      whose signature was not, and otherwise a newer CRL replaces an older
+      one.
+    :rtype: int
+    :raises ValueError: If the CRL's signature is invalid, its issuer's key
+      identifier is unknown, or it revokes a serial number that is too long.
+
+    """
+    buf = _crl_buffer(data)
+    if issuer is not None:
+      _verify_crl(buf, issuer.to_cryptography().public_key())
+    this_update, next_update, key_id, entries = _read_crl(buf)
+    if issuer is not None:
+      key_id = _key_identifier(issuer, 'subjectKeyIdentifier') or key_id
+    if not key_id or len(key_id) > 32:
+      raise ValueError('Cannot identify the key of the CRL\'s issuer')
+
+    verified = issuer is not None
+    number, previous, _, was_verified = self._issuers.get(key_id, (len(self._issuers) + 1, None, None, False))
+    if was_verified and not verified:
+      return 0
+    if previous is not None and previous > _timestamp(this_update) and verified == was_verified:
+      return 0
+    slots = bytearray()
+    for serial, revoked_at in entries:
+      if len(serial) > _MAX_SERIAL:
+        raise ValueError('Serial number {0} is too long'.format(binascii.hexlify(serial)))
+      slots += _SLOT.pack(number, _timestamp(revoked_at), len(serial), serial)
+    self._issuers[key_id] = (number, _timestamp(this_update), _timestamp(next_update), verified)
+    self._slots[number] = slots
+    return len(slots) // _SLOT.size
+
+  def add_crl_file(self, path, issuer=None):
+    """Add the entries of a CRL file, memory mapping it if it is DER encoded.
+
+    :param str path: The CRL file.
+    :param OpenSSL.crypto.X509 issuer: See :meth:`add_crl`.
+    :rtype: int
+
+    """
+    with open(path, 'rb') as fh:
+      if fh.read(1) != b'\x30':
+        fh.seek(0)
+        return self.add_crl(fh.read(), issuer)
+      mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        return self.add_crl(mapped, issuer)
+      finally:
+        mapped.close()
+
+  def write(self, path):
+    """Write the index to a file that :class:`RevocationIndex` can map.
+
+    :param str path: The file to write.
+
+    """
+    issuers = sorted(self._issuers.items(), key=lambda item: item[1][0])
+    key_ids = [key_id for key_id, _ in issuers]
+    count = len(self)
+    size = 1
+    while size < 2 * count + 1:
+      size <<= 1
+    table = bytearray(size * _SLOT.size)
+    entries = 0
+    for slots in self._slots.values():
+      for idx in range(len(slots) // _SLOT.size):
+        record = slots[idx * _SLOT.size:(idx + 1) * _SLOT.size]
+        number, _, length, serial = _SLOT.unpack(bytes(record))
+        serial = serial[:length]
+        slot = _slot_hash(key_ids[number - 1], serial) & (size - 1)
+        while True:
+          offset = slot * _SLOT.size
+          existing = _SLOT.unpack_from(table, offset)
+          if not existing[0] or (existing[0] == number and existing[3][:existing[2]] == serial):
+            # A CRL listing a serial twice keeps its last entry.
+            entries += not existing[0]
+            table[offset:offset + _SLOT.size] = record
+            break
+          slot = (slot + 1) & (size - 1)
+
+    with open(path, 'wb') as fh:
+      fh.write(_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, len(issuers), entries, size))
+      for key_id, (_, _, next_update, _) in issuers:
+        fh.write(_ISSUER.pack(len(key_id), key_id, next_update))
+      fh.write(table)
+
+
+class RevocationIndex(object):
+  """A memory mapped index of revoked serial numbers.
+
+  Certificates are looked up by the key identifier in their authority key
+  identifier extension and their serial number, in constant time.
+
+  :param str path: A file written by :meth:`RevocationIndexBuilder.write`.
+  :raises ValueError: If the file is not a revocation index.
+
+  """
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as fh:
+      self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, issuers, self._entries, self._size = _HEADER.unpack_from(self._map, 0)
+    if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+      self._map.close()
+      raise ValueError('{0} is not a revocation index'.format(path))
+    # Maps a key identifier to its issuer number and next update.
+    self._issuers = {}
+    offset = _HEADER.size
+    for number in range(1, issuers + 1):
+      length, key_id, next_update = _ISSUER.unpack_from(self._map, offset)
+      self._issuers[key_id[:length]] = (number, _datetime(next_update))
+      offset += _ISSUER.size
+    self._table = offset
+
+  def close(self):
+    """Unmap the index."""
+    self._map.close()
+
+  def __len__(self):
+    return self._entries
+
+  def _find(self, key_id, serial):
+    """Find a serial number's revocation time, or :class:`None`."""
+    number = self._issuers[key_id][0]
+    serial = _integer_bytes(serial)
+    slot = _slot_hash(key_id, serial) & (self._size - 1)
+    while True:
+      entry, revoked_at, length, value = _SLOT.unpack_from(self._map, self._table + slot * _SLOT.size)
+      if not entry:
+        return None
+      if entry == number and value[:length] == serial:
+        return revoked_at
+      slot = (slot + 1) & (self._size - 1)
+
+  def status(self, x509cert, issuer=None):
+    """Look up a certificate.
+
+    :param OpenSSL.crypto.X509 x509cert: The certificate, e.g. as loaded by
+      :func:`~py509.x509.load_certificate`.
+    :param OpenSSL.crypto.X509 issuer: The certificate's issuer, for
+      certificates without an authority key identifier.
+    :return: A :data:`GOOD` or :data:`REVOKED` status, or :data:`UNKNOWN` if
+      the index has no CRL from the certificate's issuer or its CRL has
+      expired.
+    :rtype: :class:`RevocationStatus`
+
+    """
+    key_id = _key_identifier(x509cert, 'authorityKeyIdentifier')
+    if key_id is None and issuer is not None:
+      key_id = _key_identifier(issuer, 'subjectKeyIdentifier')
+    if key_id not in self._issuers:
+      return _unknown(self.path, 'No CRL from the certificate\'s issuer is indexed')
+    next_update = self._issuers[key_id][1]
+    if next_update is not None and next_update < datetime.datetime.utcnow() - CLOCK_SKEW:
+      return _unknown(self.path, 'The indexed CRL has expired')
+    revoked_at = self._find(key_id, x509cert.get_serial_number())
+    if revoked_at is None:
+      return RevocationStatus(GOOD, None, next_update, self.path, None)
+    return RevocationStatus(REVOKED, _datetime(revoked_at), next_update, self.path, None)
+
+  def is_revoked(self, x509cert, issuer=None):
+    """Whether a certificate is revoked by an indexed CRL.
+
+    :rtype: bool
+
+    """
+    return self.status(x509cert, issuer).status == REVOKED
@@ -0,0 +1,306 @@
+"""A long running certificate verification service.
+
+Verifying certificates from a fresh process means importing dependencies and
+loading the trust store every time. A :class:`VerificationService` keeps the
+trust store, the intermediates it has seen and the verification cache warm,
+and :func:`make_server` exposes it over HTTP on localhost:
+
+  - ``POST /verify`` verifies a certificate. The body holds the certificate,
+    optionally followed by intermediates, PEM or DER encoded.
+  - ``POST /chain`` assembles a certificate's chain, like
+    :func:`~py509.utils.assemble_chain`.
+  - ``GET /stats`` reports throughput, latency and cache statistics.
+
+Responses are JSON. The trust store is reloaded in the background when its
+files change; requests in flight keep using the previous store.
+
+"""
+
+import collections
+import json
+import logging
+import threading
+import time
+
+try:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+except ImportError:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+
+from OpenSSL import crypto
+
+from py509 import metrics
+from py509.utils import assemble_chain, chain_index
+from py509.verification import Verifier, VerificationCache
+from py509.x509 import load_certificates
+
+
+log = logging.getLogger(__name__)
+
+
+def _subject(x509cert):
+  return x509cert.get_subject().CN
+
+
+class _Overlay(dict):
+  """A chain index that falls back to a shared base index."""
+
+  def __init__(self, base, extra):
+    super(_Overlay, self).__init__(extra)
+    self.base = base
+
+  def __missing__(self, key):
+    return self.base[key]
+
+
+class _Recorder(object):
+  """Record the latency of a request into a registry."""
+
+  def __init__(self, registry, name):
+    self.registry = registry
+    self.name = name
+
+  def __enter__(self):
+    self.start = metrics.clock()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.registry.record(self.name, metrics.clock() - self.start)
+
+
+class VerificationService(object):
+  """Verify certificates against a trust store that is kept up to date.
+
+  :param py509.store.TrustStore trust_store: The trust store. It is refreshed
+    when the service is created and every ``reload_interval`` seconds once
+    :meth:`start` is called.
+  :param int reload_interval: The number of seconds between checks for
+    changes to the trust store.
+  :param int cache_size: The number of verification outcomes to remember.
+  :param int time_bucket: The number of seconds an outcome is reused for.
+  :param int max_intermediates: The number of intermediates to remember. The
+    least recently used are forgotten first.
+
+  """
+
+  def __init__(self, trust_store, reload_interval=5, cache_size=65536, time_bucket=3600,
+               max_intermediates=10000):
+    self.trust_store = trust_store
+    self.reload_interval = reload_interval
+    self.time_bucket = time_bucket
+    self.max_intermediates = max_intermediates
+    self.cache = VerificationCache(cache_size)
+    self.latency = metrics.Registry()
+    self.started = time.time()
+    # Intermediates sent with requests are unauthenticated, so they are kept
+    # by fingerprint, and every one with a matching subject is offered to the
+    # verifier, which picks the one that actually issued the certificate.
+    self._intermediates = collections.OrderedDict()
+    self._issuers = {}
+    self._intermediates_lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+    self.trust_store.refresh()
+    self._swap()
+
+  def _swap(self):
+    certificates = self.trust_store.certificates
+    verifier = Verifier(certificates, cache=self.cache, time_bucket=self.time_bucket)
+    # The counters are reported by stats, so they survive reloads.
+    previous = getattr(self, '_state', None)
+    if previous is not None:
+      verifier.signature_checks = previous[0].signature_checks
+      verifier.signature_checks_saved = previous[0].signature_checks_saved
+    # Both are replaced by a single assignment so that requests in flight
+    # always see a consistent pair.
+    self._state = (verifier, chain_index(certificates))
+
+  def reload(self):
+    """Reload the trust store if any of its files changed.
+
+    :return: Whether the trust store changed.
+    :rtype: bool
+
+    """
+    if any(self.trust_store.refresh()):
+      self._swap()
+      log.info('Reloaded trust store with %d certificates', len(self.trust_store))
+      return True
+    return False
+
+  def start(self):
+    """Start reloading the trust store in the background."""
+    self._thread = threading.Thread(target=self._reload_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop reloading the trust store."""
+    self._stop.set()
+    if self._thread:
+      self._thread.join()
+
+  def _reload_forever(self):
+    while not self._stop.wait(self.reload_interval):
+      try:
+        self.reload()
+      except Exception:
+        log.exception('Failed to reload the trust store')
+
+  def _remember(self, intermediates):
+    with self._intermediates_lock:
+      for x509cert in intermediates:
+        fingerprint = x509cert.digest('sha256')
+        if self._intermediates.pop(fingerprint, None) is None:
+          self._issuers.setdefault(x509cert.get_subject().der(), set()).add(fingerprint)
+        self._intermediates[fingerprint] = x509cert
+      while len(self._intermediates) > self.max_intermediates:
+        fingerprint, x509cert = self._intermediates.popitem(last=False)
+        subject = x509cert.get_subject().der()
+        self._issuers[subject].discard(fingerprint)
+        if not self._issuers[subject]:
+          del self._issuers[subject]
+
+  def _intermediates_for(self, leaf, given):
+    """Complete the intermediates given with a request from those remembered."""
+    intermediates = list(given)
+    seen = set(c.digest('sha256') for c in intermediates)
+    pending = [leaf] + intermediates
+    with self._intermediates_lock:
+      while pending:
+        for fingerprint in self._issuers.get(pending.pop().get_issuer().der(), ()):
+          if fingerprint in seen:
+            continue
+          seen.add(fingerprint)
+          x509cert = self._intermediates.pop(fingerprint)
+          self._intermediates[fingerprint] = x509cert
+          intermediates.append(x509cert)
+          pending.append(x509cert)
+    return intermediates
+
+  def _parse(self, body):
+    try:
+      certificates = list(load_certificates(body))
+    except crypto.Error:
+      raise ValueError('Failed to load the certificates in the request')
+    if not certificates:
+      raise ValueError('No certificates found in the request')
+    self._remember(certificates[1:])
+    return certificates[0], certificates[1:]
+
+  def verify(self, body):
+    """Verify a certificate.
+
+    :param bytes body: The certificate, optionally followed by intermediates.
+    :rtype: dict
+
+    """
+    with _Recorder(self.latency, 'verify'):
+      verifier, index = self._state
+      leaf, given = self._parse(body)
+      intermediates = self._intermediates_for(leaf, given)
+      outcome = verifier.verify(leaf, intermediates)
+      chain = assemble_chain(leaf, _Overlay(index, chain_index(intermediates)))
+      return {
+        'valid': outcome.valid,
+        'error': outcome.error,
+        'chain': [_subject(c) for c in chain],
+      }
+
+  def chain(self, body):
+    """Assemble a certificate's chain.
+
+    :param bytes body: The certificate, optionally followed by intermediates.
+    :rtype: dict
+
+    """
+    with _Recorder(self.latency, 'chain'):
+      _, index = self._state
+      leaf, given = self._parse(body)
+      intermediates = self._intermediates_for(leaf, given)
+      chain = assemble_chain(leaf, _Overlay(index, chain_index(intermediates)))
+      return {'chain': [_subject(c) for c in chain]}
+
+  def stats(self):
+    """Report the service's statistics.
+
+    :rtype: dict
+
+    """
+    verifier, _ = self._state
+    uptime = time.time() - self.started
+    requests = {}
+    for name, h in list(self.latency.histograms.items()):
+      requests[name] = {
+        'count': h.count,
+        'per_second': h.count / uptime if uptime else 0.0,
+        'mean_ms': 1000 * h.mean,
+        'p50_ms': 1000 * h.percentile(50),
+        'p99_ms': 1000 * h.percentile(99),
+        'max_ms': 1000 * h.max,
+      }
+    return {
+      'uptime': uptime,
+      'requests': requests,
+      'cache': {'size': len(self.cache), 'hits': self.cache.hits, 'misses': self.cache.misses},
+      'signature_checks': verifier.signature_checks,
+      'signature_checks_saved': verifier.signature_checks_saved,
+      'trust_store': {'certificates': len(self.trust_store), 'generation': self.trust_store.generation},
+      'intermediates': len(self._intermediates),
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+  def _respond(self, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if self.path == '/stats':
+      self._respond(200, self.server.service.stats())
+    else:
+      self._respond(404, {'error': 'Not found'})
+
+  def do_POST(self):
+    handlers = {'/verify': self.server.service.verify, '/chain': self.server.service.chain}
+    if self.path not in handlers:
+      self._respond(404, {'error': 'Not found'})
+      return
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    try:
+      self._respond(200, handlers[self.path](body))
+    except ValueError as e:
+      self._respond(400, {'error': str(e)})
+
+  def log_message(self, format, *args):
+    log.debug(format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  """An HTTP server that handles each request on its own daemon thread."""
+
+  daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8509):
+  """Make an HTTP server for a verification service.
+
+  Each request is handled on its own thread. Call ``serve_forever()`` on the
+  returned server to start serving.
+
+  :param VerificationService service: The service to expose.
+  :param str host: The address to listen on.
+  :param int port: The port to listen on, or ``0`` to pick a free one.
+  :rtype: :class:`http.server.HTTPServer`
+
+  """
+  server = ThreadingHTTPServer((host, port), _Handler)
+  server.service = service
+  return server
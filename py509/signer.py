@@ -0,0 +1,418 @@
+"""A certificate authority that signs certificates in a pool of processes.
+
+:func:`~py509.x509.make_certificate` signs one certificate at a time, in the
+calling thread. A :class:`SigningService` instead hands the CA key to a pool
+of worker processes once, queues certificate signing requests from any number
+of threads, and sends them to the workers in batches, so that bursts of
+requests are signed in parallel without paying for a round trip to a worker
+per certificate. Each client is limited to a number of requests per second,
+and the time from submission to issuance is recorded for every certificate.
+
+:func:`make_server` exposes a service over HTTP on localhost:
+
+  - ``POST /sign`` signs the PEM encoded certificate signing request in the
+    body and responds with the PEM encoded certificate. Clients are told apart
+    by their address, which is what the rate limit applies to.
+  - ``GET /stats`` reports issuance counts and latency percentiles.
+
+"""
+
+import collections
+import json
+import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from OpenSSL import crypto
+
+from py509 import metrics
+from py509.server import ThreadingHTTPServer
+from py509.x509 import clear_issuance_listeners, load_certificate, make_certificate, make_serial, notify_issuance
+
+try:
+  from http.server import BaseHTTPRequestHandler
+except ImportError:
+  from BaseHTTPServer import BaseHTTPRequestHandler
+
+
+log = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(RuntimeError):
+  """Raised when a client submits requests faster than it is allowed to."""
+
+
+class _TokenBucket(object):
+
+  __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+  def __init__(self, rate, burst):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.updated = metrics.clock()
+
+  def take(self):
+    now = metrics.clock()
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+    if self.tokens < 1:
+      return False
+    self.tokens -= 1
+    return True
+
+
+class Issuance(object):
+  """A pending certificate, returned by :meth:`SigningService.submit`."""
+
+  def __init__(self, client):
+    self.client = client
+    self.submitted = metrics.clock()
+    self._done = threading.Event()
+    self._certificate = None
+    self._error = None
+
+  def _finish(self, certificate=None, error=None):
+    self._certificate = certificate
+    self._error = error
+    self._done.set()
+
+  def done(self):
+    """Whether the certificate was issued or failed."""
+    return self._done.is_set()
+
+  def result(self, timeout=None):
+    """Wait for the certificate.
+
+    :param float timeout: The number of seconds to wait, or :class:`None` to
+      wait forever.
+    :rtype: :class:`OpenSSL.crypto.X509`
+    :raises ValueError: If the request could not be signed.
+    :raises RuntimeError: If the certificate was not issued in time.
+
+    """
+    if not self._done.wait(timeout):
+      raise RuntimeError('The certificate was not issued in time')
+    if self._error is not None:
+      raise ValueError(self._error)
+    return self._certificate
+
+
+# The CA key and certificate, loaded once in each worker process.
+_ca = None
+
+
+def _init_worker(key_pem, cert_pem):
+  global _ca
+  # Listeners inherited from the parent process are called by the parent
+  # instead, once the certificate is back.
+  clear_issuance_listeners()
+  _ca = (crypto.load_privatekey(crypto.FILETYPE_PEM, key_pem),
+         crypto.load_certificate(crypto.FILETYPE_PEM, cert_pem))
+
+
+def _sign_batch(batch):
+  """Sign a batch of requests in a worker process.
+
+  Keys and certificates cannot be pickled, so requests and results cross the
+  process boundary PEM encoded, and extensions as ``(type, critical, value)``
+  tuples.
+
+  :return: A ``(certificate, error)`` pair for each request.
+
+  """
+  ca_key, ca_cert = _ca
+  results = []
+  for csr_pem, not_before, not_after, digest, exts in batch:
+    try:
+      csr = crypto.load_certificate_request(crypto.FILETYPE_PEM, csr_pem)
+      if not csr.verify(csr.get_pubkey()):
+        raise ValueError('Invalid request signature')
+      extensions = [crypto.X509Extension(t, critical, value) for t, critical, value in exts]
+      crt = make_certificate(csr, ca_key, ca_cert, make_serial(), not_before, not_after,
+                             digest=digest, exts=extensions)
+      results.append((crypto.dump_certificate(crypto.FILETYPE_PEM, crt), None))
+    except Exception as e:
+      results.append((None, str(e) or e.__class__.__name__))
+  return results
+
+
+class SigningService(object):
+  """Sign certificate signing requests in a pool of worker processes.
+
+  :param OpenSSL.crypto.PKey ca_key: The signing authority's key.
+  :param OpenSSL.crypto.X509 ca_cert: The signing authority's certificate.
+  :param int processes: The number of worker processes.
+  :param int batch_size: The most requests sent to a worker at once.
+  :param float batch_wait: How long, in seconds, to wait for a batch to fill
+    up once it has its first request.
+  :param float rate: The number of requests each client may submit per
+    second, or :class:`None` for no limit.
+  :param int burst: The number of requests a client may submit at once.
+    Defaults to ``rate``, or one if that is less.
+  :param int validity: How long, in seconds, certificates are valid for.
+  :param str digest: The digest to sign certificates with.
+  :param list exts: Extensions to add to every certificate, as
+    ``(type, critical, value)`` tuples, e.g.
+    ``(b'basicConstraints', True, b'CA:FALSE')``.
+  :param int max_clients: The number of clients whose rate limits are
+    remembered. The least recently seen are forgotten first.
+
+  """
+
+  def __init__(self, ca_key, ca_cert, processes=2, batch_size=64, batch_wait=0.005, rate=None, burst=None,
+               validity=365 * 24 * 60 * 60, digest='sha256', exts=(), max_clients=10000):
+    self.processes = processes
+    self.batch_size = batch_size
+    self.batch_wait = batch_wait
+    self.rate = rate
+    self.burst = burst if burst is not None else max(1, rate or 0)
+    self.validity = validity
+    self.digest = digest
+    self.exts = list(exts)
+    self.max_clients = max_clients
+    self.latency = metrics.Registry()
+    #: The number of certificates issued.
+    self.issued = 0
+    #: The number of requests that could not be signed.
+    self.failed = 0
+    #: The number of requests refused by the rate limit.
+    self.rate_limited = 0
+    #: The number of batches sent to the workers.
+    self.batches = 0
+    self._initargs = (crypto.dump_privatekey(crypto.FILETYPE_PEM, ca_key),
+                      crypto.dump_certificate(crypto.FILETYPE_PEM, ca_cert))
+    # Token buckets by client, least recently seen first.
+    self._buckets = collections.OrderedDict()
+    self._queue = queue.Queue()
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._pool = None
+    self._completions = None
+    self._thread = None
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.stop()
+
+  def start(self):
+    """Start the worker processes and the dispatcher."""
+    self._pool = multiprocessing.Pool(self.processes, initializer=_init_worker, initargs=self._initargs)
+    # Collects the results of the batches in flight, of which there are
+    # rarely more than there are workers.
+    self._completions = ThreadPool(self.processes)
+    self._thread = threading.Thread(target=self._dispatch_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Sign the requests already submitted, then stop the workers."""
+    # Set under the lock, so that no request is queued after the dispatcher
+    # has seen the queue empty and exited.
+    with self._lock:
+      self._stop.set()
+    if self._thread:
+      self._thread.join()
+    if self._completions:
+      self._completions.close()
+      self._completions.join()
+    if self._pool:
+      self._pool.close()
+      self._pool.join()
+
+  def _allow(self, client):
+    # Called with the lock held.
+    if self.rate is None:
+      return True
+    bucket = self._buckets.pop(client, None)
+    if bucket is None:
+      bucket = _TokenBucket(self.rate, self.burst)
+    self._buckets[client] = bucket
+    while len(self._buckets) > self.max_clients:
+      self._buckets.popitem(last=False)
+    if bucket.take():
+      return True
+    self.rate_limited += 1
+    return False
+
+  def submit(self, csr, client='local', not_before=0, not_after=None, exts=()):
+    """Queue a certificate signing request.
+
+    :param csr: The request, as an :class:`OpenSSL.crypto.X509Req` or PEM
+      encoded bytes.
+    :param str client: The client the request is counted against.
+    :param int not_before: A number of seconds from now to wait before the
+      certificate is valid.
+    :param int not_after: A number of seconds from now to expire the
+      certificate. Defaults to the service's ``validity``.
+    :param list exts: Extensions to add to this certificate, after the
+      service's.
+    :rtype: :class:`Issuance`
+    :raises RateLimitExceeded: If the client is over its rate limit.
+    :raises RuntimeError: If the service is not running.
+
+    """
+    if isinstance(csr, crypto.X509Req):
+      csr = crypto.dump_certificate_request(crypto.FILETYPE_PEM, csr)
+    issuance = Issuance(client)
+    not_after = self.validity if not_after is None else not_after
+    with self._lock:
+      if self._pool is None or self._stop.is_set():
+        raise RuntimeError('The signing service is not running')
+      if not self._allow(client):
+        raise RateLimitExceeded('{0} is over its rate limit'.format(client))
+      self._queue.put((issuance, (csr, not_before, not_after, self.digest, self.exts + list(exts))))
+    return issuance
+
+  def sign(self, csr, client='local', timeout=None, **kwargs):
+    """Sign a certificate signing request and wait for the certificate.
+
+    Takes the same arguments as :meth:`submit`.
+
+    :rtype: :class:`OpenSSL.crypto.X509`
+
+    """
+    return self.submit(csr, client, **kwargs).result(timeout)
+
+  def _next_batch(self):
+    try:
+      batch = [self._queue.get(timeout=0.1)]
+    except queue.Empty:
+      return []
+    deadline = metrics.clock() + self.batch_wait
+    while len(batch) < self.batch_size:
+      remaining = deadline - metrics.clock()
+      try:
+        batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+      except queue.Empty:
+        break
+    return batch
+
+  def _dispatch_forever(self):
+    while not (self._stop.is_set() and self._queue.empty()):
+      batch = self._next_batch()
+      if not batch:
+        continue
+      issuances = [issuance for issuance, _ in batch]
+      with self._lock:
+        self.batches += 1
+      result = self._pool.apply_async(_sign_batch, ([request for _, request in batch],))
+      # Results are collected on another thread, so that the next batch is
+      # dispatched while this one is signed.
+      self._completions.apply_async(self._complete, (issuances, result))
+
+  def _complete(self, issuances, result):
+    try:
+      results = result.get()
+    except Exception as e:
+      log.exception('A signing worker failed')
+      results = [(None, str(e))] * len(issuances)
+    for issuance, (cert_pem, error) in zip(issuances, results):
+      # Counted before the waiter is woken, so that stats include the issuance.
+      with self._lock:
+        if error is None:
+          self.issued += 1
+        else:
+          self.failed += 1
+      if error is not None:
+        issuance._finish(error=error)
+        continue
+      self.latency.record('issue', metrics.clock() - issuance.submitted)
+      certificate = load_certificate(crypto.FILETYPE_PEM, cert_pem)
+      try:
+        notify_issuance(certificate)
+      except Exception:
+        # The certificate was issued, so a failing listener must not keep it
+        # from its waiter or the rest of the batch.
+        log.exception('An issuance listener failed')
+      issuance._finish(certificate=certificate)
+
+  def stats(self):
+    """Report the service's statistics.
+
+    :rtype: dict
+
+    """
+    h = self.latency.histograms.get('issue') or metrics.Histogram()
+    return {
+      'issued': self.issued,
+      'failed': self.failed,
+      'rate_limited': self.rate_limited,
+      'queued': self._queue.qsize(),
+      'batches': self.batches,
+      'mean_batch_size': (self.issued + self.failed) / float(self.batches) if self.batches else 0.0,
+      'latency': {
+        'mean_ms': 1000 * h.mean,
+        'p50_ms': 1000 * h.percentile(50),
+        'p90_ms': 1000 * h.percentile(90),
+        'p99_ms': 1000 * h.percentile(99),
+        'max_ms': 1000 * h.max,
+      },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+  def _respond(self, status, body, content_type='application/json'):
+    if content_type == 'application/json':
+      body = json.dumps(body).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if self.path == '/stats':
+      self._respond(200, self.server.service.stats())
+    else:
+      self._respond(404, {'error': 'Not found'})
+
+  def do_POST(self):
+    if self.path != '/sign':
+      self._respond(404, {'error': 'Not found'})
+      return
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    # Headers are set by the client, so only its address is trusted.
+    client = self.client_address[0]
+    try:
+      crt = self.server.service.sign(body, client, timeout=self.server.sign_timeout)
+    except RateLimitExceeded as e:
+      self._respond(429, {'error': str(e)})
+    except ValueError as e:
+      self._respond(400, {'error': str(e)})
+    except RuntimeError as e:
+      self._respond(503, {'error': str(e)})
+    else:
+      self._respond(200, crypto.dump_certificate(crypto.FILETYPE_PEM, crt), 'application/x-pem-file')
+
+  def log_message(self, format, *args):
+    log.debug(format, *args)
+
+
+def make_server(service, host='127.0.0.1', port=8510, timeout=30):
+  """Make an HTTP server for a signing service.
+
+  Each request is handled on its own thread. Call ``serve_forever()`` on the
+  returned server to start serving.
+
+  :param SigningService service: The service to expose. It must be started.
+  :param str host: The address to listen on.
+  :param int port: The port to listen on, or ``0`` to pick a free one.
+  :param int timeout: How long, in seconds, to wait for a certificate.
+  :rtype: :class:`http.server.HTTPServer`
+
+  """
+  server = ThreadingHTTPServer((host, port), _Handler)
+  server.service = service
+  server.sign_timeout = timeout
+  return server
@@ -0,0 +1,166 @@
+"""Load trust stores from files, directories and glob patterns.
+
+Trust stores are often kept as directories of thousands of certificate files,
+for example as hashed directories made by OpenSSL's ``c_rehash``. A
+:class:`TrustStore` loads such directories in parallel and remembers each
+file's modification time, size and certificates, so that refreshing it after a
+small change only parses the files that changed.
+
+"""
+
+import fnmatch
+import glob
+import logging
+import os
+import re
+import threading
+from multiprocessing.pool import ThreadPool
+
+from OpenSSL import crypto
+
+from py509.x509 import load_certificates
+
+
+log = logging.getLogger(__name__)
+
+
+#: The file name patterns loaded from directories.
+DEFAULT_PATTERNS = ('*.pem', '*.crt', '*.cer', '*.[0-9]')
+
+# The characters that make a path a glob pattern, as understood by glob.
+_GLOB_MAGIC = re.compile('[*?[]')
+
+
+def _load_file(path):
+  """Load every certificate in a file, returning ``(path, certificates)``."""
+  try:
+    with open(path, 'rb') as fh:
+      data = fh.read()
+  except (IOError, OSError) as e:
+    log.error('Failed to read %s: %s', path, e)
+    return path, []
+  try:
+    return path, list(load_certificates(data))
+  except (crypto.Error, ValueError):
+    log.error('Failed to load any certificate from %s', path)
+    return path, []
+
+
+def _stat_key(st):
+  return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+
+
+class TrustStore(object):
+  """A set of trusted certificates loaded from the file system.
+
+  Nothing is loaded until :meth:`refresh` is called.
+
+  :param paths: A file, directory or glob pattern, or a list of them. Files
+    may be in any format supported by :func:`~py509.x509.load_certificates`.
+  :param tuple patterns: The file name patterns to load from directories.
+  :param int processes: The number of files to load in parallel.
+
+  """
+
+  def __init__(self, paths, patterns=DEFAULT_PATTERNS, processes=8):
+    self.paths = [paths] if isinstance(paths, (str, type(u''))) else list(paths)
+    self.patterns = patterns
+    self.processes = processes
+    #: Incremented every time a refresh changes the set of certificates.
+    self.generation = 0
+    # Maps a file to its (mtime, size) and the fingerprints it holds.
+    self._files = {}
+    # Maps a fingerprint to its certificate and the number of files that
+    # hold it.
+    self._certificates = {}
+    self._x509store = None
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._certificates)
+
+  def _list_files(self):
+    files = []
+    for path in self.paths:
+      if os.path.isdir(path):
+        for name in os.listdir(path):
+          if any(fnmatch.fnmatch(name, p) for p in self.patterns):
+            files.append(os.path.join(path, name))
+      elif _GLOB_MAGIC.search(path):
+        files.extend(glob.glob(path))
+      else:
+        files.append(path)
+    return files
+
+  def refresh(self):
+    """Load new and changed files, and forget removed ones.
+
+    :return: The number of files added, changed and removed.
+    :rtype: tuple(int, int, int)
+
+    """
+    with self._lock:
+      current = {}
+      for path in self._list_files():
+        try:
+          current[path] = _stat_key(os.stat(path))
+        except OSError:
+          continue
+
+      removed = [p for p in self._files if p not in current]
+      stale = [p for p, key in current.items() if p not in self._files or self._files[p][0] != key]
+      added = sum(1 for p in stale if p not in self._files)
+
+      loaded = []
+      if stale:
+        pool = ThreadPool(min(self.processes, len(stale)))
+        try:
+          loaded = pool.map(_load_file, stale)
+        finally:
+          pool.close()
+
+      for path in removed:
+        self._release(self._files.pop(path)[1])
+      for path, certificates in loaded:
+        if path in self._files:
+          self._release(self._files[path][1])
+        fingerprints = []
+        for x509cert in certificates:
+          fingerprint = x509cert.digest('sha256')
+          fingerprints.append(fingerprint)
+          entry = self._certificates.setdefault(fingerprint, [x509cert, 0])
+          entry[1] += 1
+        self._files[path] = (current[path], tuple(fingerprints))
+
+      if removed or stale:
+        self.generation += 1
+        self._x509store = None
+      return added, len(stale) - added, len(removed)
+
+  def _release(self, fingerprints):
+    for fingerprint in fingerprints:
+      entry = self._certificates[fingerprint]
+      entry[1] -= 1
+      if not entry[1]:
+        del self._certificates[fingerprint]
+
+  @property
+  def certificates(self):
+    """The distinct certificates in the store."""
+    return [entry[0] for entry in list(self._certificates.values())]
+
+  def x509store(self):
+    """Get the certificates as a store for verification.
+
+    The store is built once per :attr:`generation` and shared.
+
+    :rtype: :class:`OpenSSL.crypto.X509Store`
+
+    """
+    with self._lock:
+      if self._x509store is None:
+        x509store = crypto.X509Store()
+        for x509cert in self.certificates:
+          x509store.add_cert(x509cert)
+        self._x509store = x509store
+      return self._x509store
@@ -0,0 +1,415 @@
+"""An append-only log of issued certificates, in the style of Certificate Transparency.
+
+An :class:`IssuanceLog` records every certificate it is given, with the time
+it was logged, and keeps a Merkle tree over its entries as defined by RFC
+6962. The tree's root commits to the whole log, so auditors can check with
+an inclusion proof that a certificate was logged, and with a consistency
+proof that a later log only appended to an earlier one.
+
+A log is a directory of append-only files:
+
+  - ``entries`` holds each entry's timestamp and DER encoded certificate.
+  - ``offsets`` holds the offset of each entry in ``entries``.
+  - ``level-NN`` holds the hashes of the complete subtrees of ``2 ** NN``
+    entries, left to right; ``level-00`` holds the leaf hashes.
+
+Appending an entry writes a constant number of hashes on average, and files
+are memory mapped for reading, so proofs are computed from ``O(log n)``
+stored hashes however large the log grows. Call :meth:`IssuanceLog.attach` to
+log every certificate signed by :func:`~py509.x509.make_certificate`.
+
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from OpenSSL import crypto
+
+from py509.x509 import add_issuance_listener, load_certificate, remove_issuance_listener
+
+
+# timestamp in milliseconds, certificate length
+_ENTRY = struct.Struct('>QI')
+_OFFSET = struct.Struct('>Q')
+_HASH_SIZE = 32
+
+
+def leaf_hash(data):
+  """Hash a leaf of a Merkle tree, as defined by RFC 6962."""
+  return hashlib.sha256(b'\x00' + data).digest()
+
+
+def node_hash(left, right):
+  """Hash an interior node of a Merkle tree, as defined by RFC 6962."""
+  return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _split(n):
+  """The largest power of two smaller than ``n``."""
+  return 1 << ((n - 1).bit_length() - 1)
+
+
+def verify_inclusion(leaf, index, size, proof, root):
+  """Verify an inclusion proof, as defined by RFC 9162.
+
+  :param bytes leaf: The entry's leaf hash.
+  :param int index: The entry's index.
+  :param int size: The size of the tree the proof is for.
+  :param list[bytes] proof: The proof.
+  :param bytes root: The root of the tree the proof is for.
+  :rtype: bool
+
+  """
+  if index >= size:
+    return False
+  fn, sn = index, size - 1
+  r = leaf
+  for p in proof:
+    if sn == 0:
+      return False
+    if fn & 1 or fn == sn:
+      r = node_hash(p, r)
+      while fn and not fn & 1:
+        fn >>= 1
+        sn >>= 1
+    else:
+      r = node_hash(r, p)
+    fn >>= 1
+    sn >>= 1
+  return sn == 0 and r == root
+
+
+def verify_consistency(first, second, first_root, second_root, proof):
+  """Verify a consistency proof, as defined by RFC 9162.
+
+  :param int first: The size of the earlier tree.
+  :param int second: The size of the later tree.
+  :param bytes first_root: The root of the earlier tree.
+  :param bytes second_root: The root of the later tree.
+  :param list[bytes] proof: The proof.
+  :rtype: bool
+
+  """
+  if first > second:
+    return False
+  if first == second:
+    return not proof and first_root == second_root
+  if first == 0:
+    return not proof
+  if not proof:
+    return False
+  if first & (first - 1) == 0:
+    proof = [first_root] + list(proof)
+  fn, sn = first - 1, second - 1
+  while fn & 1:
+    fn >>= 1
+    sn >>= 1
+  fr = sr = proof[0]
+  for c in proof[1:]:
+    if sn == 0:
+      return False
+    if fn & 1 or fn == sn:
+      fr = node_hash(c, fr)
+      sr = node_hash(c, sr)
+      while fn and not fn & 1:
+        fn >>= 1
+        sn >>= 1
+    else:
+      sr = node_hash(sr, c)
+    fn >>= 1
+    sn >>= 1
+  return sn == 0 and fr == first_root and sr == second_root
+
+
+class _AppendFile(object):
+  """A file that is appended to, and read through a memory map."""
+
+  def __init__(self, path):
+    self.fh = open(path, 'a+b')
+    self.fh.seek(0, os.SEEK_END)
+    self.size = self.fh.tell()
+    self._map = None
+
+  def append(self, data):
+    self.fh.write(data)
+    self.size += len(data)
+
+  def read(self, offset, length):
+    if self._map is None or offset + length > len(self._map):
+      # Map everything written so far.
+      self.fh.flush()
+      if self._map is not None:
+        self._map.close()
+      self._map = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return self._map[offset:offset + length]
+
+  def truncate(self, size):
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+    self.fh.truncate(size)
+    self.size = size
+
+  def flush(self, sync=False):
+    self.fh.flush()
+    if sync:
+      os.fsync(self.fh.fileno())
+
+  def close(self):
+    if self._map is not None:
+      self._map.close()
+    self.fh.close()
+
+
+class IssuanceLog(object):
+  """An append-only, Merkle tree backed log of certificates.
+
+  :param str path: The log's directory. It is created if it does not exist.
+  :param bool sync: Whether to ``fsync`` the log's files after every append.
+
+  """
+
+  def __init__(self, path, sync=False):
+    self.path = path
+    self.sync = sync
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    self._lock = threading.Lock()
+    self._entries = _AppendFile(os.path.join(path, 'entries'))
+    self._offsets = _AppendFile(os.path.join(path, 'offsets'))
+    self._levels = []
+    self._attached = False
+    self._recover()
+
+  def _level(self, level):
+    while len(self._levels) <= level:
+      self._levels.append(_AppendFile(os.path.join(self.path, 'level-{0:02d}'.format(len(self._levels)))))
+    return self._levels[level]
+
+  def _recover(self):
+    """Make the files agree after an interrupted append.
+
+    The offset of an entry is written last, so entries without one, and
+    hashes past the last complete entry, are discarded, and hashes that are
+    missing are recomputed.
+
+    """
+    self._size = self._offsets.size // _OFFSET.size
+    self._offsets.truncate(self._size * _OFFSET.size)
+    end = 0
+    if self._size:
+      offset = _OFFSET.unpack(self._offsets.read((self._size - 1) * _OFFSET.size, _OFFSET.size))[0]
+      end = offset + _ENTRY.size + _ENTRY.unpack(self._entries.read(offset, _ENTRY.size))[1]
+    self._entries.truncate(end)
+
+    level = 0
+    while os.path.exists(os.path.join(self.path, 'level-{0:02d}'.format(level))) or self._size >> level:
+      nodes = self._size >> level
+      current = self._level(level)
+      if current.size > nodes * _HASH_SIZE:
+        current.truncate(nodes * _HASH_SIZE)
+      for idx in range(current.size // _HASH_SIZE, nodes):
+        if level == 0:
+          current.append(leaf_hash(self._entry_data(idx)))
+        else:
+          below = self._levels[level - 1]
+          current.append(node_hash(below.read(2 * idx * _HASH_SIZE, _HASH_SIZE),
+                                   below.read((2 * idx + 1) * _HASH_SIZE, _HASH_SIZE)))
+      current.flush()
+      level += 1
+
+  def __len__(self):
+    return self._size
+
+  def close(self):
+    """Detach the log and close its files."""
+    self.detach()
+    with self._lock:
+      for fh in [self._entries, self._offsets] + self._levels:
+        fh.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def attach(self):
+    """Log every certificate signed by :func:`~py509.x509.make_certificate`."""
+    if not self._attached:
+      add_issuance_listener(self.append)
+      self._attached = True
+
+  def detach(self):
+    """Stop logging certificates signed by :func:`~py509.x509.make_certificate`."""
+    if self._attached:
+      remove_issuance_listener(self.append)
+      self._attached = False
+
+  def append(self, certificate, timestamp=None):
+    """Append a certificate to the log.
+
+    :param certificate: An :class:`OpenSSL.crypto.X509` or its DER encoding.
+    :param int timestamp: When the certificate was logged, in milliseconds
+      since the epoch. Defaults to now.
+    :return: The entry's index.
+    :rtype: int
+
+    """
+    if isinstance(certificate, crypto.X509):
+      certificate = crypto.dump_certificate(crypto.FILETYPE_ASN1, certificate)
+    if timestamp is None:
+      timestamp = int(time.time() * 1000)
+    data = _ENTRY.pack(timestamp, len(certificate)) + certificate
+
+    with self._lock:
+      idx = self._size
+      offset = self._entries.size
+      self._entries.append(data)
+      node = leaf_hash(data)
+      self._level(0).append(node)
+      level = 0
+      while (idx >> level) & 1:
+        left = self._levels[level].read(((idx >> level) - 1) * _HASH_SIZE, _HASH_SIZE)
+        node = node_hash(left, node)
+        level += 1
+        self._level(level).append(node)
+      for fh in [self._entries] + self._levels[:level + 1]:
+        fh.flush(self.sync)
+      # The offset commits the entry, so it is written last.
+      self._offsets.append(_OFFSET.pack(offset))
+      self._offsets.flush(self.sync)
+      self._size += 1
+      return idx
+
+  def _entry_data(self, idx):
+    offset = _OFFSET.unpack(self._offsets.read(idx * _OFFSET.size, _OFFSET.size))[0]
+    length = _ENTRY.unpack(self._entries.read(offset, _ENTRY.size))[1]
+    return self._entries.read(offset, _ENTRY.size + length)
+
+  def entry(self, idx):
+    """Get an entry.
+
+    :param int idx: The entry's index.
+    :return: When the entry was logged, in milliseconds since the epoch, and
+      the DER encoded certificate.
+    :rtype: tuple(int, bytes)
+    :raises IndexError: If there is no such entry.
+
+    """
+    if not 0 <= idx < self._size:
+      raise IndexError('No entry {0} in a log of {1}'.format(idx, self._size))
+    with self._lock:
+      data = self._entry_data(idx)
+    return _ENTRY.unpack(data[:_ENTRY.size])[0], data[_ENTRY.size:]
+
+  def certificate(self, idx):
+    """Get an entry's certificate.
+
+    :rtype: :class:`OpenSSL.crypto.X509`
+
+    """
+    return load_certificate(crypto.FILETYPE_ASN1, self.entry(idx)[1])
+
+  def leaf_hash(self, idx):
+    """Get an entry's leaf hash."""
+    if not 0 <= idx < self._size:
+      raise IndexError('No entry {0} in a log of {1}'.format(idx, self._size))
+    with self._lock:
+      return self._levels[0].read(idx * _HASH_SIZE, _HASH_SIZE)
+
+  def _subtree(self, start, end):
+    """The hash of the entries in ``[start, end)``.
+
+    Complete subtrees are read from their level; others are split into a
+    complete left subtree and the rest.
+
+    """
+    n = end - start
+    if n & (n - 1) == 0 and start % n == 0:
+      level = n.bit_length() - 1
+      return self._levels[level].read((start >> level) * _HASH_SIZE, _HASH_SIZE)
+    k = _split(n)
+    return node_hash(self._subtree(start, start + k), self._subtree(start + k, end))
+
+  def _check_size(self, size):
+    if size is None:
+      return self._size
+    if not 0 <= size <= self._size:
+      raise ValueError('The log has {0} entries, not {1}'.format(self._size, size))
+    return size
+
+  def root(self, size=None):
+    """Get the Merkle tree root of the log.
+
+    :param int size: The number of entries to get the root of. Defaults to
+      all of them.
+    :rtype: bytes
+
+    """
+    with self._lock:
+      size = self._check_size(size)
+      if not size:
+        return hashlib.sha256().digest()
+      return self._subtree(0, size)
+
+  def inclusion_proof(self, idx, size=None):
+    """Prove that an entry is in the log.
+
+    :param int idx: The entry's index.
+    :param int size: The size of the tree to prove inclusion in. Defaults to
+      the whole log.
+    :return: The audit path, to check with :func:`verify_inclusion`.
+    :rtype: list[bytes]
+
+    """
+    with self._lock:
+      size = self._check_size(size)
+      if not 0 <= idx < size:
+        raise IndexError('No entry {0} in a log of {1}'.format(idx, size))
+      proof = []
+      start, end = 0, size
+      while end - start > 1:
+        k = _split(end - start)
+        if idx < start + k:
+          proof.append(self._subtree(start + k, end))
+          end = start + k
+        else:
+          proof.append(self._subtree(start, start + k))
+          start += k
+      return proof[::-1]
+
+  def consistency_proof(self, first, second=None):
+    """Prove that the log of ``second`` entries extends the log of ``first``.
+
+    :param int first: The size of the earlier log.
+    :param int second: The size of the later log. Defaults to the whole log.
+    :return: The proof, to check with :func:`verify_consistency`.
+    :rtype: list[bytes]
+
+    """
+    with self._lock:
+      second = self._check_size(second)
+      if not 0 <= first <= second:
+        raise ValueError('Cannot prove {0} entries consistent with {1}'.format(first, second))
+      if first in (0, second):
+        return []
+      proof = []
+      start, end, m, complete = 0, second, first, True
+      while m != end - start:
+        k = _split(end - start)
+        if m <= k:
+          proof.append(self._subtree(start + k, end))
+          end = start + k
+        else:
+          proof.append(self._subtree(start, start + k))
+          start += k
+          m -= k
+          complete = False
+      if not complete:
+        proof.append(self._subtree(start, end))
+      return proof[::-1]
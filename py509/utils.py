@@ -1,51 +1,169 @@
 """Utilties and helpers that don't have a home."""
 
+from array import array
+
 from OpenSSL import crypto
 
+from py509 import metrics
 from py509.x509 import patch_certificate
 
 
+class CompactTree(object):
+  """A tree of labelled nodes addressed by integer ids.
+
+  Nodes are stored in flat arrays rather than nested :class:`dict` objects,
+  which keeps very large trees (for example, an entire CA hierarchy) cheap to
+  build and to render with :func:`tree`.
+
+  :param list labels: Optional initial labels; each one is added as a child of
+    the previous label, which makes a linear chain.
+
+  """
+
+  __slots__ = ('labels', 'parents', '_children', '_roots')
+
+  def __init__(self, labels=()):
+    self.labels = []
+    self.parents = array('l')
+    self._children = {}
+    self._roots = array('l')
+    parent = -1
+    for label in labels:
+      parent = self.add(label, parent)
+
+  def __len__(self):
+    return len(self.labels)
+
+  def add(self, label, parent=-1):
+    """Add a node.
+
+    :param label: The node's label, passed to the formatters of :func:`tree`.
+    :param int parent: The id of the parent node, or ``-1`` for a root.
+    :return: The new node's id.
+    :rtype: int
+
+    """
+    node = len(self.labels)
+    self.labels.append(label)
+    self.parents.append(parent)
+    if parent < 0:
+      self._roots.append(node)
+    else:
+      self._children.setdefault(parent, array('l')).append(node)
+    return node
+
+  def roots(self):
+    """The ids of the root nodes."""
+    return self._roots
+
+  def children(self, node):
+    """The ids of a node's children."""
+    return self._children.get(node, ())
+
+
 def transmogrify(l):
-  """Fit a flat list into a treeable object."""
-  d = {l[0]: {}}
-  tmp = d
-  for c in l:
-    tmp[c] = {}
-    tmp = tmp[c]
-  return d
+  """Fit a flat list into a treeable object.
 
+  :param list l: The nodes, each one the child of the one before it.
+  :rtype: :class:`CompactTree`
 
-def tree(node, formatter=None, prefix=None, postfix=None, _depth=1):
+  """
+  return CompactTree(l)
+
+
+def _tree_lines(node, formatter, prefix, postfix):
+  if isinstance(node, CompactTree):
+    def label(n):
+      return node.labels[n]
+    children = node.children
+    roots = node.roots()
+  else:
+    # Dictionary trees are walked as (key, sub-tree) pairs since the same key
+    # may appear in several sub-trees.
+    def label(n):
+      return n[0]
+
+    def children(n):
+      return list(n[1].items()) if n[1] else ()
+    roots = list(node.items())
+
+  tee_joint = u'\u251c\u2500\u2500'
+  elbow_joint = u'\u2514\u2500\u2500'
+
+  # Each stack entry holds a level's indentation, an iterator over the nodes
+  # left to visit on it and how many of them remain, so only the current path
+  # is ever held in memory.
+  stack = [[u'', iter(roots), len(roots)]]
+  while stack:
+    frame = stack[-1]
+    for n in frame[1]:
+      frame[2] -= 1
+      last = frame[2] == 0
+      key = label(n)
+      yield u'{indent} {space} {prefix}{key}{postfix}'.format(
+        indent=frame[0],
+        space=elbow_joint if last else tee_joint,
+        prefix=prefix(key) if prefix else u'',
+        key=formatter(key) if formatter else key,
+        postfix=postfix(key) if postfix else u'')
+      kids = children(n)
+      if kids:
+        stack.append([frame[0] + (u'    ' if last else u' |  '), iter(kids), len(kids)])
+        break
+    else:
+      stack.pop()
+
+
+def tree(node, formatter=None, prefix=None, postfix=None):
   """Print a tree.
 
   Sometimes it's useful to print datastructures as a tree. This function prints
   out a pretty tree with root `node`. A tree is represented as a :class:`dict`,
   whose keys are node names and values are :class:`dict` objects for sub-trees
-  and :class:`None` for terminals.
+  and :class:`None` for terminals, or as a :class:`CompactTree`.
+
+  The tree is walked iteratively, so arbitrarily deep trees can be printed.
 
-  :param dict node: The root of the tree to print.
+  :param node: The root of the tree to print.
+  :type node: dict or CompactTree
   :param callable formatter: A callable that takes a single argument, the key,
     that formats the key in the tree.
   :param callable prefix: A callable that takes a single argument, the key,
     that adds any additional text before the formatted key.
   :param callable postfix: A callable that takes a single argument, the key,
     that adds any additional text after the formatted key.
+  :return: An iterator over the lines of the tree.
+
+  """
+  return _tree_lines(node, formatter, prefix, postfix)
+
+
+def write_tree(stream, node, formatter=None, prefix=None, postfix=None, buffer_lines=1024):
+  """Write a tree to a stream.
+
+  Lines are rendered as with :func:`tree` and written out in blocks, which is
+  considerably faster than writing or printing each line of a large tree.
+
+  :param stream: A file-like object opened for writing text.
+  :param node: The root of the tree to write.
+  :type node: dict or CompactTree
+  :param int buffer_lines: The number of lines to buffer between writes.
+  :return: The number of lines written.
+  :rtype: int
 
   """
-  current = 0
-  length = len(node.keys())
-  tee_joint = '\xe2\x94\x9c\xe2\x94\x80\xe2\x94\x80'
-  elbow_joint = '\xe2\x94\x94\xe2\x94\x80\xe2\x94\x80'
-  for key, value in node.iteritems():
-    current += 1
-    k = formatter(key) if formatter else key
-    pre = prefix(key) if prefix else ''
-    post = postfix(key) if postfix else ''
-    space = elbow_joint if current == length else tee_joint
-    yield ' {space} {prefix}{key}{postfix}'.format(space=space, key=k, prefix=pre, postfix=post)
-    if value:
-      for e in tree(value, formatter=formatter, prefix=prefix, postfix=postfix, _depth=_depth + 1):
-        yield (' |  ' if current != length else '    ') + e
+  count = 0
+  buf = []
+  for line in _tree_lines(node, formatter, prefix, postfix):
+    buf.append(line)
+    if len(buf) == buffer_lines:
+      stream.write(u'\n'.join(buf) + u'\n')
+      count += len(buf)
+      del buf[:]
+  if buf:
+    stream.write(u'\n'.join(buf) + u'\n')
+    count += len(buf)
+  return count
 
 
 # XXX: Currently, pyOpenSSL doesn't expose any nice OpenSSL.crypto.X509Store
@@ -59,16 +177,31 @@ def assemble_chain(leaf, store):
 
   :param OpenSSL.crypto.X509 leaf: The leaf certificate from which to build the
     chain.
-  :param list[OpenSSL.crypto.X509] store: A list of certificates to use to
-    resolve the chain.
+  :param store: A list of certificates to use to resolve the chain, or an
+    index of them made with :func:`chain_index` to reuse across calls.
+  :type store: list[OpenSSL.crypto.X509] or dict
   :return: The trust chain.
   :rtype: list[OpenSSL.crypto.X509]
 
+  """
+  with metrics.timed('chain_assembly'):
+    return _assemble_chain(leaf, store if isinstance(store, dict) else chain_index(store))
+
+
+def chain_index(store):
+  """Index certificates for :func:`assemble_chain`.
+
+  :param list[OpenSSL.crypto.X509] store: The certificates to index.
+  :rtype: dict
+
   """
   store_dict = {}
   for cert in store:
     store_dict[cert.get_subject().CN] = cert
+  return store_dict
+
 
+def _assemble_chain(leaf, store_dict):
   chain = [leaf]
 
   current = leaf
@@ -0,0 +1,349 @@
+"""Verify certificates against a trust store.
+
+Services tend to verify the same few chains over and over again. The
+:class:`Verifier` in this module wraps :class:`OpenSSL.crypto.X509StoreContext`
+and memoizes outcomes in a :class:`VerificationCache`, so repeated
+verifications of a chain are dictionary lookups. It also remembers which
+intermediates it has verified up to the trust store, so verifying many leaves
+issued under the same intermediates only checks each leaf's own signature.
+
+Of everything checked, only the validity periods of the certificates depend
+on when a chain is verified. :meth:`Verifier.validity_period` verifies a chain
+once without checking times and remembers the period in which all of its
+certificates are valid, so :meth:`Verifier.verify_at` can tell whether a chain
+verifies at any number of dates, e.g. to find what would break on a future
+date, without verifying it again.
+
+"""
+
+import collections
+import hashlib
+import threading
+import time
+
+from OpenSSL import crypto
+
+from py509 import metrics
+from py509.x509 import get_extensions, parse_time
+
+
+# X509_V_FLAG_PARTIAL_CHAIN and X509_V_FLAG_NO_CHECK_TIME, which pyOpenSSL
+# does not expose by name.
+_PARTIAL_CHAIN = 0x80000
+_NO_CHECK_TIME = 0x200000
+
+# OpenSSL's messages for certificates outside of their validity period.
+_NOT_YET_VALID = 'certificate is not yet valid'
+_EXPIRED = 'certificate has expired'
+
+#: The outcome of verifying a certificate. ``error`` is the reason
+#: verification failed, or :class:`None` if it succeeded.
+Verification = collections.namedtuple('Verification', ['valid', 'error'])
+
+
+class ValidityPeriod(collections.namedtuple('ValidityPeriod', ['not_before', 'not_after', 'error'])):
+  """When a chain verifies.
+
+  ``not_before`` and ``not_after`` bound the period in which every
+  certificate in the chain is valid, as naive UTC datetimes. ``error`` is the
+  reason the chain never verifies, whatever the time, or :class:`None`.
+
+  """
+
+  __slots__ = ()
+
+  def at(self, when):
+    """Whether the chain verifies at a point in time.
+
+    :param datetime.datetime when: A naive UTC datetime.
+    :rtype: :class:`Verification`
+
+    """
+    if self.error is not None:
+      return Verification(False, self.error)
+    if when < self.not_before:
+      return Verification(False, _NOT_YET_VALID)
+    if when > self.not_after:
+      return Verification(False, _EXPIRED)
+    return Verification(True, None)
+
+
+def trust_store_hash(certificates):
+  """Hash the contents of a trust store.
+
+  The hash only depends on which certificates are in the store, not on their
+  order or on duplicates.
+
+  :param iterable certificates: The trusted certificates.
+  :return: A hex digest.
+  :rtype: str
+
+  """
+  h = hashlib.sha256()
+  for fingerprint in sorted(set(c.digest('sha256') for c in certificates)):
+    h.update(fingerprint)
+  return h.hexdigest()
+
+
+def _key_id(x509cert, name):
+  extensions = get_extensions(x509cert)
+  return extensions[name].id if name in extensions else None
+
+
+def error_string(e):
+  """Get the reason a certificate failed to verify.
+
+  :param OpenSSL.crypto.X509StoreContextError e: The verification error.
+  :rtype: str
+
+  """
+  # pyOpenSSL has reported the error as both a [code, depth, string] list and
+  # as a plain string over time.
+  message = e.args[0]
+  if isinstance(message, (list, tuple)):
+    return message[2]
+  return message
+
+
+class VerificationCache(object):
+  """A thread safe LRU cache of verification outcomes.
+
+  Keys are ``(fingerprints, trust_store_hash, time_bucket)`` tuples, where
+  ``fingerprints`` are the SHA-256 fingerprints of the verified chain, leaf
+  first. Validity periods, which do not depend on the time, are cached with a
+  ``time_bucket`` of :class:`None`.
+
+  :param int maxsize: The maximum number of outcomes to remember.
+
+  """
+
+  def __init__(self, maxsize=4096):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key):
+    """Look up an outcome.
+
+    :return: The outcome, or :class:`None` if there is none.
+    :rtype: :class:`Verification`
+
+    """
+    with self._lock:
+      try:
+        value = self._entries.pop(key)
+      except KeyError:
+        self.misses += 1
+        return None
+      self._entries[key] = value
+      self.hits += 1
+      return value
+
+  def put(self, key, value):
+    """Remember an outcome, evicting the least recently used one if full."""
+    with self._lock:
+      self._entries.pop(key, None)
+      self._entries[key] = value
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def invalidate(self, fingerprint=None):
+    """Forget outcomes.
+
+    :param bytes fingerprint: If given, only forget outcomes of chains that
+      contain the certificate with this SHA-256 fingerprint. Otherwise, forget
+      everything.
+    :return: The number of outcomes forgotten.
+    :rtype: int
+
+    """
+    with self._lock:
+      if fingerprint is None:
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+      stale = [k for k in self._entries if fingerprint in k[0]]
+      for key in stale:
+        del self._entries[key]
+      return len(stale)
+
+
+class Verifier(object):
+  """Verify certificates against a trust store, memoizing the outcomes.
+
+  An outcome is reused for as long as the chain, the trust store and the time
+  bucket stay the same. Since certificates expire, an outcome can be up to
+  ``time_bucket`` seconds out of date; pick a bucket that is small compared to
+  how close to expiry you care about.
+
+  Once an intermediate has been verified up to the trust store, it is trusted
+  as a partial chain anchor: later leaves whose authority key identifier
+  matches it only have their own signature checked, falling back to verifying
+  the full chain if that fails. The :attr:`signature_checks` and
+  :attr:`signature_checks_saved` counters show how much work this saves.
+
+  :param iterable trust_store: The trusted certificates.
+  :param VerificationCache cache: The cache to use. Defaults to a new cache.
+  :param int time_bucket: The number of seconds an outcome is reused for.
+  :param int max_anchors: The number of verified intermediates to trust as
+    anchors. The least recently used are forgotten first.
+
+  """
+
+  def __init__(self, trust_store, cache=None, time_bucket=3600, max_anchors=1024):
+    self.cache = cache if cache is not None else VerificationCache()
+    self.time_bucket = time_bucket
+    self.max_anchors = max_anchors
+    self.trust_store = list(trust_store)
+    self.trust_store_hash = trust_store_hash(self.trust_store)
+    self._x509store = crypto.X509Store()
+    self._timeless_x509store = crypto.X509Store()
+    self._timeless_x509store.set_flags(_NO_CHECK_TIME)
+    for ca in self.trust_store:
+      self._x509store.add_cert(ca)
+      self._timeless_x509store.add_cert(ca)
+
+    #: The number of signatures checked so far.
+    self.signature_checks = 0
+    #: The number of signature checks skipped because an intermediate had
+    #: already been verified.
+    self.signature_checks_saved = 0
+
+    # Maps a verified intermediate's fingerprint to a store that trusts it as
+    # a partial chain anchor, the number of signatures between it and the
+    # trust store, and its subject key identifier, least recently used first.
+    self._anchors = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def verify(self, x509cert, intermediates=()):
+    """Verify a certificate.
+
+    :param OpenSSL.crypto.X509 x509cert: The certificate to verify.
+    :param list[OpenSSL.crypto.X509] intermediates: Untrusted certificates
+      that may be used to build the chain to the trust store.
+    :rtype: :class:`Verification`
+
+    """
+    intermediates = list(intermediates)
+    fingerprints = [c.digest('sha256') for c in intermediates]
+    key = (
+      tuple([x509cert.digest('sha256')] + fingerprints),
+      self.trust_store_hash,
+      int(time.time() // self.time_bucket),
+    )
+    outcome = self.cache.get(key)
+    if outcome is None:
+      with metrics.timed('verification'):
+        outcome = self._verify(x509cert, intermediates, fingerprints)
+      self.cache.put(key, outcome)
+    return outcome
+
+  def validity_period(self, x509cert, intermediates=()):
+    """Find when a certificate verifies.
+
+    The chain is verified once, ignoring times, and its period is cached for
+    as long as the chain and the trust store stay the same.
+
+    :param OpenSSL.crypto.X509 x509cert: The certificate to verify.
+    :param list[OpenSSL.crypto.X509] intermediates: Untrusted certificates
+      that may be used to build the chain to the trust store.
+    :rtype: :class:`ValidityPeriod`
+
+    """
+    intermediates = list(intermediates)
+    key = (
+      tuple([x509cert.digest('sha256')] + [c.digest('sha256') for c in intermediates]),
+      self.trust_store_hash,
+      None,
+    )
+    period = self.cache.get(key)
+    if period is None:
+      with metrics.timed('verification'):
+        try:
+          chain = crypto.X509StoreContext(
+            self._timeless_x509store, x509cert, chain=intermediates or None).get_verified_chain()
+        except crypto.X509StoreContextError as e:
+          period = ValidityPeriod(None, None, error_string(e))
+        else:
+          self._count(len(chain) - 1)
+          period = ValidityPeriod(
+            max(parse_time(c.get_notBefore()) for c in chain),
+            min(parse_time(c.get_notAfter()) for c in chain),
+            None)
+      self.cache.put(key, period)
+    return period
+
+  def verify_at(self, x509cert, dates, intermediates=()):
+    """Verify a certificate as of many points in time.
+
+    :param OpenSSL.crypto.X509 x509cert: The certificate to verify.
+    :param iterable dates: Naive UTC datetimes.
+    :param list[OpenSSL.crypto.X509] intermediates: Untrusted certificates
+      that may be used to build the chain to the trust store.
+    :return: An outcome for each date, in order.
+    :rtype: list[:class:`Verification`]
+
+    """
+    period = self.validity_period(x509cert, intermediates)
+    return [period.at(when) for when in dates]
+
+  def _count(self, checks, saved=0):
+    with self._lock:
+      self.signature_checks += checks
+      self.signature_checks_saved += saved
+
+  def _anchor(self, fingerprint):
+    with self._lock:
+      anchor = self._anchors.pop(fingerprint, None)
+      if anchor is not None:
+        self._anchors[fingerprint] = anchor
+      return anchor
+
+  def _verify(self, x509cert, intermediates, fingerprints):
+    issuer = x509cert.get_issuer().der()
+    authority_key_id = _key_id(x509cert, 'authorityKeyIdentifier')
+    for intermediate, fingerprint in zip(intermediates, fingerprints):
+      anchor = self._anchor(fingerprint)
+      if anchor is None or intermediate.get_subject().der() != issuer:
+        continue
+      x509store, saved, key_id = anchor
+      # A re-keyed intermediate has the same subject, so only the key
+      # identifiers tell whether this one issued the certificate.
+      if authority_key_id is None or key_id != authority_key_id:
+        continue
+      try:
+        crypto.X509StoreContext(x509store, x509cert).verify_certificate()
+      except crypto.X509StoreContextError:
+        # The full chain may still verify, e.g. through another intermediate.
+        self._count(1)
+        break
+      self._count(1, saved)
+      return Verification(True, None)
+
+    try:
+      chain = crypto.X509StoreContext(
+        self._x509store, x509cert, chain=intermediates or None).get_verified_chain()
+    except crypto.X509StoreContextError as e:
+      return Verification(False, error_string(e))
+
+    # The chain runs from the leaf to the trust anchor, and every certificate
+    # in it but the anchor had its signature checked.
+    self._count(len(chain) - 1)
+    for depth, intermediate in enumerate(chain[1:-1], 1):
+      fingerprint = intermediate.digest('sha256')
+      if self._anchor(fingerprint) is not None:
+        continue
+      x509store = crypto.X509Store()
+      x509store.add_cert(intermediate)
+      x509store.set_flags(_PARTIAL_CHAIN)
+      with self._lock:
+        self._anchors.setdefault(fingerprint, (
+          x509store, len(chain) - 1 - depth, _key_id(intermediate, 'subjectKeyIdentifier')))
+        while len(self._anchors) > self.max_anchors:
+          self._anchors.popitem(last=False)
+    return Verification(True, None)
@@ -0,0 +1,228 @@
+"""A lightweight, immutable view of a certificate.
+
+:func:`~py509.x509.load_certificate` builds a full
+:class:`OpenSSL.crypto.X509`, which is comparatively heavy and cannot be
+pickled. A :class:`CertificateView` instead reads the fields most programs
+need straight out of the certificate's DER encoding. Views are cheap to
+create, copy and pickle, so they can be cached and passed between processes
+freely; the pyOpenSSL object is only built when it is asked for.
+
+"""
+
+import hashlib
+
+from OpenSSL import crypto
+
+from py509 import der
+from py509.x509 import load_certificate
+
+
+#: Short names of common extension OIDs, matching pyOpenSSL's.
+EXTENSION_NAMES = {
+  '2.5.29.14': 'subjectKeyIdentifier',
+  '2.5.29.15': 'keyUsage',
+  '2.5.29.17': 'subjectAltName',
+  '2.5.29.19': 'basicConstraints',
+  '2.5.29.30': 'nameConstraints',
+  '2.5.29.31': 'crlDistributionPoints',
+  '2.5.29.32': 'certificatePolicies',
+  '2.5.29.35': 'authorityKeyIdentifier',
+  '2.5.29.37': 'extendedKeyUsage',
+  '1.3.6.1.5.5.7.1.1': 'authorityInfoAccess',
+}
+
+#: Short names of common public key algorithm OIDs.
+KEY_ALGORITHMS = {
+  '1.2.840.113549.1.1.1': 'RSA',
+  '1.2.840.10040.4.1': 'DSA',
+  '1.2.840.10045.2.1': 'EC',
+  '1.3.101.112': 'Ed25519',
+  '1.3.101.113': 'Ed448',
+}
+
+_CURVE_BITS = {
+  '1.2.840.10045.3.1.7': 256,
+  '1.3.132.0.10': 256,
+  '1.3.132.0.34': 384,
+  '1.3.132.0.35': 521,
+}
+
+
+def _key_bits(buf, algorithm, params, key):
+  """Work out a public key's size from its SubjectPublicKeyInfo parts."""
+  if algorithm == 'RSA':
+    # The BIT STRING holds an RSAPublicKey, after a byte of unused bits.
+    (_, _, start, end) = der.children(buf, key[2] + 1, key[3])[0]
+    while start < end and buf[start] == 0:
+      start += 1
+    return 8 * (end - start) - 8 + buf[start].bit_length() if start < end else 0
+  if algorithm == 'DSA' and params and params[0] == der.SEQUENCE:
+    (_, _, start, end) = der.children(buf, params[1], params[3])[0]
+    while start < end and buf[start] == 0:
+      start += 1
+    return 8 * (end - start) - 8 + buf[start].bit_length() if start < end else 0
+  if algorithm == 'EC' and params and params[0] == der.OID:
+    return _CURVE_BITS.get(der.read_oid(buf, params[2], params[3]))
+  if algorithm == 'Ed25519':
+    return 256
+  if algorithm == 'Ed448':
+    return 456
+  return None
+
+
+class CertificateView(object):
+  """An immutable view of a DER encoded certificate.
+
+  :param bytes der_data: The DER encoded certificate.
+  :raises py509.der.DERError: If ``der_data`` is not a DER encoded
+    certificate.
+
+  """
+
+  __slots__ = (
+    'der', 'version', 'serial', 'issuer', 'subject', 'not_before',
+    'not_after', 'key_algorithm', 'key_bits', 'spki_offset', 'spki_length',
+    'extensions', '_x509',
+  )
+
+  def __init__(self, der_data):
+    der_data = bytes(der_data)
+    buf = bytearray(der_data)
+    _, tbs, _, _ = der.children(buf, 0)[0]
+    fields = der.children(buf, tbs)
+    if fields and fields[0][0] == der.context(0):
+      version = der.read_integer(buf, *der.children(buf, fields[0][1])[0][2:])
+      fields = fields[1:]
+    else:
+      version = 0
+    serial, _, issuer, validity, subject, spki = fields[:6]
+    not_before, not_after = der.children(buf, validity[1])
+    algorithm, key = der.children(buf, spki[1])
+    algorithm_parts = der.children(buf, algorithm[1])
+    key_algorithm = der.read_oid(buf, *algorithm_parts[0][2:])
+    key_algorithm = KEY_ALGORITHMS.get(key_algorithm, key_algorithm)
+
+    extensions = []
+    for field in fields[6:]:
+      if field[0] != der.context(3):
+        continue
+      for _, ext, _, _ in der.children(buf, der.children(buf, field[1])[0][1]):
+        parts = der.children(buf, ext)
+        critical = len(parts) == 3 and buf[parts[1][2]] != 0
+        oid = der.read_oid(buf, *parts[0][2:])
+        _, _, start, end = parts[-1]
+        extensions.append((EXTENSION_NAMES.get(oid, oid), critical, start, end - start))
+
+    values = {
+      'der': der_data,
+      'version': version,
+      'serial': der.read_integer(buf, *serial[2:]),
+      'issuer': der.read_name(buf, issuer[1]),
+      'subject': der.read_name(buf, subject[1]),
+      'not_before': der.read_time(not_before[0], buf, *not_before[2:]),
+      'not_after': der.read_time(not_after[0], buf, *not_after[2:]),
+      'key_algorithm': key_algorithm,
+      'key_bits': _key_bits(buf, key_algorithm, algorithm_parts[1] if len(algorithm_parts) > 1 else None, key),
+      'spki_offset': spki[1],
+      'spki_length': spki[3] - spki[1],
+      'extensions': tuple(extensions),
+      '_x509': None,
+    }
+    for name, value in values.items():
+      object.__setattr__(self, name, value)
+
+  @classmethod
+  def from_x509(cls, x509cert):
+    """Make a view of a pyOpenSSL certificate.
+
+    :param OpenSSL.crypto.X509 x509cert: The certificate.
+    :rtype: :class:`CertificateView`
+
+    """
+    view = cls(crypto.dump_certificate(crypto.FILETYPE_ASN1, x509cert))
+    object.__setattr__(view, '_x509', x509cert)
+    return view
+
+  def __setattr__(self, name, value):
+    raise AttributeError('CertificateView objects are immutable')
+
+  def __delattr__(self, name):
+    raise AttributeError('CertificateView objects are immutable')
+
+  def __reduce__(self):
+    return (CertificateView, (self.der,))
+
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
+  def __eq__(self, other):
+    return isinstance(other, CertificateView) and self.der == other.der
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash(self.der)
+
+  def __repr__(self):
+    return 'CertificateView(subject="{0}", serial={1:x})'.format(der.format_name(self.subject), self.serial)
+
+  def name_attribute(self, attribute, issuer=False):
+    """Get the first value of a subject (or issuer) name attribute.
+
+    :param str attribute: The attribute's short name, e.g. ``CN``.
+    :param bool issuer: Look in the issuer's name instead of the subject's.
+    :return: The value, or :class:`None` if the name has no such attribute.
+
+    """
+    for key, value in (self.issuer if issuer else self.subject):
+      if key == attribute:
+        return value
+    return None
+
+  @property
+  def spki(self):
+    """The DER encoded SubjectPublicKeyInfo."""
+    return self.der[self.spki_offset:self.spki_offset + self.spki_length]
+
+  def extension_data(self, name):
+    """Get an extension's data.
+
+    The data is the same as :meth:`OpenSSL.crypto.X509Extension.get_data`'s,
+    so it can be decoded with the decoders in :mod:`py509.extensions`.
+
+    :param str name: The extension's short name or dotted OID.
+    :return: The extension's DER encoded value, or :class:`None` if the
+      certificate has no such extension.
+    :rtype: bytes
+
+    """
+    for ext_name, _, offset, length in self.extensions:
+      if ext_name == name:
+        return self.der[offset:offset + length]
+    return None
+
+  def fingerprint(self, algorithm='sha256'):
+    """Hash the certificate.
+
+    :param str algorithm: A :mod:`hashlib` algorithm name.
+    :rtype: bytes
+
+    """
+    return hashlib.new(algorithm, self.der).digest()
+
+  def to_x509(self):
+    """Get the certificate as a pyOpenSSL object.
+
+    The object is loaded with :func:`~py509.x509.load_certificate` the first
+    time it is asked for, and reused after that.
+
+    :rtype: :class:`OpenSSL.crypto.X509`
+
+    """
+    if self._x509 is None:
+      object.__setattr__(self, '_x509', load_certificate(crypto.FILETYPE_ASN1, self.der))
+    return self._x509
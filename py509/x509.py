@@ -1,48 +1,132 @@
+import base64
+import datetime
 import logging
 import re
 import uuid
 
 from OpenSSL import crypto
+import dateutil.parser
+import dateutil.tz
 import urllib3
 
+from py509 import der, metrics
 from py509.extensions import SubjectAltName, AuthorityInformationAccess, SubjectKeyIdentifier, AuthorityKeyIdentifier
 
 
 log = logging.getLogger(__name__)
 
+try:
+  basestring
+except NameError:
+  basestring = str
 
-def resolve_pkix_certificate(url):
-  """Resolve a certificate from a remote host.
+#: A buffer of PEM armored certificates.
+FORMAT_PEM = 'pem'
+#: A buffer of one or more concatenated DER encoded certificates.
+FORMAT_DER = 'der'
+#: A PKCS#7 (certs-only) bundle, DER encoded or PEM armored.
+FORMAT_PKCS7 = 'pkcs7'
+
+# The DER encoding of the PKCS#7 signedData OID, 1.2.840.113549.1.7.2.
+_PKCS7_SIGNED_DATA = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02'
+
+_PEM_PKCS7 = re.compile(b'-----BEGIN (PKCS7|CMS)-----(.+?)-----END \\1-----', re.DOTALL)
+
+_PEM_CERTIFICATE = re.compile(b'-----BEGIN ((?:X509 |TRUSTED )?CERTIFICATE)-----(.+?)-----END \\1-----', re.DOTALL)
+
+#: Names of the public key types, by their pyOpenSSL type.
+KEY_TYPES = {
+  crypto.TYPE_RSA: 'RSA',
+  crypto.TYPE_DSA: 'DSA',
+}
+if hasattr(crypto, 'TYPE_EC'):
+  KEY_TYPES[crypto.TYPE_EC] = 'EC'
+
+_issuance_listeners = []
+
+
+def resolve_pkix_certificates(url):
+  """Resolve certificates from a remote host.
 
   Extensions like the authority information access extension point to
-  certificates hosted on remote servers. This functionc an be used to
-  download and load the certificate.
+  certificates hosted on remote servers. This function can be used to
+  download and load them. Servers may respond with a single certificate or
+  with a PKCS#7 bundle of several, as allowed by RFC 5280.
 
-  :param str url: The URL to resolve a certificate from.
-  :returns: The certificate.
-  :rtype: OpenSSL.crypto.X509
+  :param str url: The URL to resolve certificates from.
+  :returns: The certificates.
+  :rtype: list[OpenSSL.crypto.X509]
 
   """
   http = urllib3.PoolManager()
-  rsp = http.request('GET', url, headers={'Content-Type': 'application/pkix-cert'})
+  with metrics.timed('aia_fetch'):
+    rsp = http.request('GET', url, headers={
+      'Accept': 'application/pkix-cert, application/pkcs7-mime, application/x-x509-ca-cert'})
   if rsp.status == 200:
     # if strict_compliance and 'application/x-x509-ca-cert' not in rsp.headers:
     #   # This web server's response isn't following the RFC, but might contain
     #   # data representing a DER encoded certificate.
     #   return
     try:
-      return load_certificate(crypto.FILETYPE_ASN1, rsp.data)
-    except crypto.Error:
-      log.error('Failed to load DER encoded certificate from %s', url)
-    try:
-      return load_certificate(crypto.FILETYPE_PEM, rsp.data)
-    except crypto.Error:
-      log.error('Failed to load PEM encoded certificate from %s', url)
-    raise RuntimeError('Failed to load any certificate from %s', url)
+      certificates = list(load_certificates(rsp.data))
+    except (crypto.Error, ValueError):
+      log.error('Failed to load certificates from %s', url)
+      certificates = []
+    if not certificates:
+      raise RuntimeError('Failed to load any certificate from {0}'.format(url))
+    return certificates
   else:
     raise RuntimeError('Failed to fetch intermediate certificate at {0}!'.format(url))
 
 
+def resolve_pkix_certificate(url):
+  """Resolve a certificate from a remote host.
+
+  This is like :func:`resolve_pkix_certificates`, but only returns the first
+  certificate.
+
+  :param str url: The URL to resolve a certificate from.
+  :returns: The certificate.
+  :rtype: OpenSSL.crypto.X509
+
+  """
+  return resolve_pkix_certificates(url)[0]
+
+
+def add_issuance_listener(listener):
+  """Call ``listener(certificate)`` every time :func:`make_certificate` signs one.
+
+  Listeners are called in the thread that signed the certificate, in the order
+  they were added, e.g. to record issuance in an
+  :class:`~py509.transparency.IssuanceLog`.
+
+  """
+  _issuance_listeners.append(listener)
+
+
+def remove_issuance_listener(listener):
+  """Stop calling a listener added with :func:`add_issuance_listener`."""
+  _issuance_listeners.remove(listener)
+
+
+def clear_issuance_listeners():
+  """Stop calling every listener added with :func:`add_issuance_listener`."""
+  del _issuance_listeners[:]
+
+
+def notify_issuance(crt):
+  """Call the issuance listeners with a certificate signed elsewhere.
+
+  :func:`make_certificate` calls this itself; it is for certificates signed
+  out of process, e.g. by a :class:`~py509.signer.SigningService`.
+
+  :param OpenSSL.crypto.X509 crt: The signed certificate.
+
+  """
+  for listener in list(_issuance_listeners):
+    listener(crt)
+
+
 def make_serial():
   """Make a random serial number.
 
@@ -102,6 +186,9 @@ def make_certificate(csr, ca_key, ca_cert, serial, not_before, not_after, digest
     - subjectKeyIdentifier
     - authorityKeyIdentifier
 
+  Listeners added with :func:`add_issuance_listener` are called with the
+  signed certificate.
+
   :param OpenSSL.crypto.X509Request csr: A certificate signing request.
   :param OpenSSL.crypto.PKey ca_key: The signing authority's key.
   :param OpenSSL.crypto.X509 ca_cert: The signing authority's certificate.
@@ -136,6 +223,7 @@ def make_certificate(csr, ca_key, ca_cert, serial, not_before, not_after, digest
   crt.add_extensions(exts)
 
   crt.sign(ca_key, digest)
+  notify_issuance(crt)
   return crt
 
 
@@ -191,12 +279,13 @@ class X509ExtensionDict(dict):
 
     for idx in range(0, x509cert.get_extension_count()):
       ext = x509cert.get_extension(idx)
-      self[ext.get_short_name()] = ext
+      self[ext.get_short_name().decode('ascii')] = ext
 
   def __getitem__(self, key):
     ext = super(X509ExtensionDict, self).__getitem__(key)
     if key in self.decoders:
-      return self.decoders[key](ext.get_data())
+      with metrics.timed('extension_decode'):
+        return self.decoders[key](ext.get_data())
     return str(ext)
 
   def __setitem__(self, key, value):
@@ -218,6 +307,46 @@ def patch_certificate(cert):
   cert.extensions = X509ExtensionDict(cert)
 
 
+def get_extensions(x509cert):
+  """Get a certificate's extensions as an :class:`X509ExtensionDict`.
+
+  The extensions of certificates loaded with :func:`load_certificate` are
+  already decoded, and are reused.
+
+  :param OpenSSL.crypto.X509 x509cert: The certificate.
+  :rtype: :class:`X509ExtensionDict`
+
+  """
+  extensions = getattr(x509cert, 'extensions', None)
+  return extensions if extensions is not None else X509ExtensionDict(x509cert)
+
+
+def parse_time(value):
+  """Parse a time into a naive UTC datetime.
+
+  ASN.1 times, e.g. from ``get_notAfter()``, are parsed directly; anything
+  else, such as a date given on the command line, is parsed with
+  :mod:`dateutil` and taken to be in UTC unless it has a zone.
+
+  :param value: The time, as :class:`bytes` or :class:`str`. :class:`None`
+    is returned as is.
+  :rtype: datetime.datetime
+
+  """
+  if value is None:
+    return None
+  if isinstance(value, bytes):
+    value = value.decode('ascii')
+  try:
+    return datetime.datetime.strptime(value, '%Y%m%d%H%M%SZ')
+  except ValueError:
+    pass
+  when = dateutil.parser.parse(value)
+  if when.tzinfo is not None:
+    when = when.astimezone(dateutil.tz.tzutc()).replace(tzinfo=None)
+  return when
+
+
 def load_certificate(filetype, buf):
   """Load a certificate and patch in incubating functionality.
 
@@ -232,22 +361,151 @@ def load_certificate(filetype, buf):
     :py:data:`OpenSSL.crypto.FILETYPE_ASN1`.
   :param str buf: The buffer containing the certificate.
   """
-  x509cert = crypto.load_certificate(filetype, buf)
-  patch_certificate(x509cert)
+  with metrics.timed('parse'):
+    x509cert = crypto.load_certificate(filetype, buf)
+    patch_certificate(x509cert)
   return x509cert
 
 
+def detect_format(buf):
+  """Detect the format of a buffer of certificates from its first bytes.
+
+  :param bytes buf: The buffer.
+  :return: One of :data:`FORMAT_PEM`, :data:`FORMAT_DER` or
+    :data:`FORMAT_PKCS7`, or :class:`None` if the format is not recognized.
+  :rtype: str
+
+  """
+  if isinstance(buf, type(u'')):
+    buf = buf.encode('ascii', 'replace')
+  if buf[:1] == b'\x30':
+    try:
+      _, content, _ = der.read_header(bytearray(buf[:16]), 0, len(buf))
+    except der.DERError:
+      return None
+    # A certificate starts with its tbsCertificate SEQUENCE, a PKCS#7
+    # ContentInfo with the signedData content type OID.
+    if buf[content:content + len(_PKCS7_SIGNED_DATA)] == _PKCS7_SIGNED_DATA:
+      return FORMAT_PKCS7
+    return FORMAT_DER
+  start = buf.find(b'-----BEGIN ')
+  if start == -1:
+    return None
+  if buf.startswith(b'-----BEGIN PKCS7-----', start) or buf.startswith(b'-----BEGIN CMS-----', start):
+    return FORMAT_PKCS7
+  return FORMAT_PEM
+
+
+def pkcs7_certificates(buf):
+  """Extract the certificates from a PKCS#7 bundle.
+
+  The bundle is walked in a single pass and the certificates are returned as
+  slices of it, without decoding anything else. PEM armored buffers may hold
+  several bundles.
+
+  :param bytes buf: A DER encoded or PEM armored PKCS#7 SignedData bundle,
+    e.g. a "certs-only" ``application/pkcs7-mime`` message.
+  :return: The DER encoded certificates.
+  :rtype: list[bytes]
+  :raises ValueError: If the buffer is not a PKCS#7 SignedData bundle.
+
+  """
+  if isinstance(buf, type(u'')):
+    buf = buf.encode('ascii', 'replace')
+  if buf[:1] != b'\x30':
+    certificates = []
+    for _, body in _PEM_PKCS7.findall(buf):
+      certificates.extend(pkcs7_certificates(base64.b64decode(b''.join(body.split()))))
+    return certificates
+
+  data = bytearray(buf)
+  try:
+    content_type, content = der.children(data, 0)[:2]
+    if bytes(data[content_type[1]:content_type[3]]) != _PKCS7_SIGNED_DATA or content[0] != der.context(0):
+      raise ValueError('Not a PKCS#7 SignedData bundle')
+    signed_data = der.children(data, content[1])[0]
+    certificates = []
+    for tag, start, _, _ in der.children(data, signed_data[1]):
+      if tag == der.context(0):
+        # Only plain certificates are extracted: the other choices of
+        # CertificateChoices are obsolete or not X.509 certificates.
+        certificates.extend(bytes(data[b:e]) for t, b, _, e in der.children(data, start) if t == der.SEQUENCE)
+    return certificates
+  except (der.DERError, IndexError):
+    raise ValueError('Malformed PKCS#7 bundle')
+
+
+def der_certificates(buf):
+  """Find the DER encoding of every certificate in a buffer, whatever its format.
+
+  This is what :func:`load_certificates` parses, so it is much cheaper when
+  only the certificates' encoding is needed, e.g. to hash them. OpenSSL's
+  ``TRUSTED CERTIFICATE`` PEM blocks are accepted, without their trust
+  settings.
+
+  :param bytes buf: The buffer.
+  :return: An iterator over the DER encoded certificates in the buffer.
+  :rtype: iterator[bytes]
+  :raises ValueError: If the buffer's format is not recognized.
+
+  """
+  if isinstance(buf, type(u'')):
+    buf = buf.encode('ascii', 'replace')
+  fmt = detect_format(buf)
+  if fmt == FORMAT_PEM:
+    with metrics.timed('pem_scan'):
+      pems = _PEM_CERTIFICATE.findall(buf)
+    for label, body in pems:
+      asn1 = base64.b64decode(b''.join(body.split()))
+      if label == b'TRUSTED CERTIFICATE':
+        # The certificate is followed by its trust settings.
+        asn1 = asn1[:der.read_header(bytearray(asn1[:16]), 0, len(asn1))[2]]
+      yield asn1
+  elif fmt == FORMAT_DER:
+    data = bytearray(buf)
+    for _, start, _, end in der.iter_elements(data):
+      yield bytes(data[start:end])
+  elif fmt == FORMAT_PKCS7:
+    for asn1 in pkcs7_certificates(buf):
+      yield asn1
+  else:
+    raise ValueError('Unrecognized certificate format')
+
+
+def load_certificates(buf):
+  """Load all certificates in a buffer, whatever its format.
+
+  The buffer's format is detected with :func:`detect_format`. PEM buffers may
+  hold any number of certificates and arbitrary text around them; DER buffers
+  may hold any number of concatenated certificates, which are loaded without
+  a base64 round trip; and PKCS#7 bundles are unpacked with
+  :func:`pkcs7_certificates`.
+
+  :param bytes buf: The buffer.
+  :return: An iterator over the certificates in the buffer.
+  :rtype: iterator[:class:`OpenSSL.crypto.X509`]
+  :raises ValueError: If the buffer's format is not recognized.
+
+  """
+  # Certificates are found by der_certificates, so both accept the same
+  # buffers.
+  for asn1 in der_certificates(buf):
+    yield load_certificate(crypto.FILETYPE_ASN1, asn1)
+
+
 def load_x509_certificates(buf):
   """Load one or multiple X.509 certificates from a buffer.
 
-  :param str buf: A buffer is an instance of `basestring` and can contain multiple
-    certificates.
+  :param str buf: A buffer is an instance of `basestring` or `bytes` and can
+    contain multiple certificates in any format supported by
+    :func:`load_certificates`.
   :return: An iterator that iterates over certificates in a buffer.
   :rtype: list[:class:`OpenSSL.crypto.X509`]
 
   """
-  if not isinstance(buf, basestring):
+  if not isinstance(buf, (basestring, bytes)):
     raise ValueError('`buf` should be an instance of `basestring` not `%s`' % type(buf))
 
-  for pem in re.findall('(-----BEGIN CERTIFICATE-----\s(\S+\n*)+\s-----END CERTIFICATE-----\s)', buf):
-    yield load_certificate(crypto.FILETYPE_PEM, pem[0])
+  if detect_format(buf) is None:
+    return iter(())
+  return load_certificates(buf)
@@ -11,7 +11,9 @@ entry_points = {
     'ssl-diff = py509.bin.diff:main',
     'ssl-get = py509.bin.get:main',
     'ssl-ls = py509.bin.ls:main',
+    'ssl-signd = py509.bin.signd:main',
     'ssl-verify = py509.bin.verify:main',
+    'ssl-verifyd = py509.bin.verifyd:main',
   ],
 }
 
@@ -59,13 +61,19 @@ setup(
     'certifi>=2015.4.28',
     'click>=4.0',
     'cryptography>=0.9.1',
-    'pyOpenSSL>=0.15.1',
+    'pyOpenSSL>=20.0.0',
     'pyasn1>=0.1.8',
     'pyasn1_modules>=0.0.6',
     'python-dateutil>=2.4.2',
     'tabulate>=0.7.5',
     'urllib3>=1.10.4',
   ],
+  extras_require={
+    'analytics': [
+      'numpy',
+      'pyarrow',
+    ],
+  },
   tests_require=[
     'flake8',
     'pytest',
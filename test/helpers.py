@@ -0,0 +1,32 @@
+"""Certificates and authorities shared by the tests."""
+
+from OpenSSL import crypto
+
+from py509.x509 import make_pkey, make_certificate_signing_request, make_certificate, make_serial
+
+
+TEST_KEY_SIZE = 512
+TEST_DIGEST = 'sha256'
+
+
+def make_csr(cn, key_bits=TEST_KEY_SIZE):
+  key = make_pkey(key_bits=key_bits)
+  return key, make_certificate_signing_request(key, CN=cn, digest=TEST_DIGEST)
+
+
+def sign(csr, ca_key, ca_crt, not_after=3600, ca=False, exts=()):
+  exts = list(exts)
+  if ca:
+    exts.insert(0, crypto.X509Extension(b'basicConstraints', True, b'CA:TRUE'))
+  return make_certificate(csr, ca_key, ca_crt, make_serial(), 0, not_after, digest=TEST_DIGEST, exts=exts)
+
+
+def make_self_signed(cn):
+  key, csr = make_csr(cn)
+  return sign(csr, key, csr)
+
+
+def make_ca(cn='Test CA'):
+  # Large enough to sign CRLs and OCSP responses with SHA-256.
+  key, csr = make_csr(cn, key_bits=1024)
+  return key, sign(csr, key, csr, ca=True)
@@ -0,0 +1,34 @@
+import base64
+import hashlib
+
+from cryptography.hazmat.primitives import serialization
+from OpenSSL import crypto
+import pytest
+
+from py509.digests import WIDTHS, bulk_digests
+from py509.x509 import X509ExtensionDict
+
+from helpers import make_self_signed
+
+
+@pytest.mark.parametrize('processes,pool', [(1, 'thread'), (2, 'thread'), (2, 'process')])
+def test_bulk_digests(processes, pool):
+  certs = [make_self_signed('Test {0}'.format(i)) for i in range(5)]
+  blobs = [crypto.dump_certificate(crypto.FILETYPE_ASN1, c) for c in certs]
+  blobs.insert(2, b'not a certificate')
+
+  digests = bulk_digests(iter(blobs), processes=processes, chunk_size=2, pool=pool)
+  assert digests.count == 6
+  assert digests.errors == [2]
+  for name, width in WIDTHS.items():
+    assert len(getattr(digests, name)) == 6 * width
+
+  for idx, cert in zip([0, 1, 3, 4, 5], certs):
+    spki = cert.get_pubkey().to_cryptography_key().public_bytes(
+      serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    assert digests.get('sha1', idx) == bytearray.fromhex(cert.digest('sha1').decode('ascii').replace(':', ''))
+    assert digests.get('sha256', idx) == hashlib.sha256(blobs[idx]).digest()
+    assert digests.get('spki_sha256', idx) == hashlib.sha256(spki).digest()
+    assert digests.pin(idx) == 'sha256/' + base64.b64encode(hashlib.sha256(spki).digest()).decode('ascii')
+    assert digests.get('key_id', idx) == bytearray.fromhex(X509ExtensionDict(cert)['subjectKeyIdentifier'].id)
+  assert digests.get('key_id', 2) == b'\x00' * 20
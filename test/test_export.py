@@ -0,0 +1,41 @@
+import pytest
+from OpenSSL import crypto
+
+from py509.export import COLUMNS, certificate_row, iter_batches
+
+from helpers import TEST_KEY_SIZE, make_ca, make_csr, sign
+
+
+def make_test_certificates(count):
+  ca_key, ca_crt = make_ca()
+  san = crypto.X509Extension(b'subjectAltName', False, b'DNS:foo.com,DNS:bar.com,IP:0.0.0.0')
+  return [ca_crt] + [sign(make_csr('Test Cert {0}'.format(i))[1], ca_key, ca_crt, exts=[san]) for i in range(count - 1)]
+
+
+def test_certificate_row():
+  ca_crt, crt = make_test_certificates(2)
+  row = certificate_row(crt)
+  assert set(row) == set(name for name, _ in COLUMNS)
+  assert row['subject_CN'] == 'Test Cert 0'
+  assert row['issuer_CN'] == 'Test CA'
+  assert row['key_type'] == 'RSA'
+  assert row['key_bits'] == TEST_KEY_SIZE
+  assert row['san_dns_count'] == 2
+  assert row['san_ip_count'] == 1
+  assert row['authority_key_id'] == certificate_row(ca_crt)['subject_key_id']
+  assert (row['not_after'] - row['not_before']).total_seconds() == 3600
+
+
+def test_iter_batches():
+  certs = make_test_certificates(5)
+  batches = list(iter_batches(iter(certs), batch_size=2, backend='python'))
+  assert [len(b['serial']) for b in batches] == [2, 2, 1]
+  assert batches[0]['subject_CN'] == ['Test CA', 'Test Cert 0']
+
+
+def test_iter_batches_numpy():
+  pytest.importorskip('numpy')
+  certs = make_test_certificates(3)
+  batch, = iter_batches(certs, backend='numpy')
+  assert batch['key_bits'].tolist() == [certs[0].get_pubkey().bits()] + [TEST_KEY_SIZE] * 2
+  assert str(batch['not_before'].dtype) == 'datetime64[s]'
@@ -1,6 +1,6 @@
 from OpenSSL import crypto
 
-from py509.extensions import SubjectAltName
+from py509.extensions import DNS_NAME, IP_ADDRESS, SubjectAltName, decode_subject_alt_names
 
 
 def test_make_san_extensions():
@@ -13,3 +13,40 @@ def test_make_san_extensions():
   e3 = crypto.X509Extension(b'subjectAltName', True, b'URI:this:is:a:uri(hello-world)')
   assert e3
   assert SubjectAltName(e3.get_data()).uris == ['this:is:a:uri(hello-world)']
+
+
+def test_decode_all_general_names():
+  ext = crypto.X509Extension(
+    b'subjectAltName', False,
+    b'DNS:foo.com, IP:::1, IP:2001:db8::8a2e:370:7334, IP:10.0.0.1, email:me@foo.com, '
+    b'URI:http://foo.com/, RID:1.2.3.4, otherName:1.3.6.1.4.1.311.20.2.3;UTF8:me@foo.com')
+  san = SubjectAltName(ext.get_data())
+  assert san.dns == ['foo.com']
+  assert san.ips == ['::1', '2001:db8::8a2e:370:7334', '10.0.0.1']
+  assert san.emails == ['me@foo.com']
+  assert san.uris == ['http://foo.com/']
+  assert san.registered_ids == ['1.2.3.4']
+  assert san.other_names == [('1.3.6.1.4.1.311.20.2.3', 'me@foo.com')]
+  assert san.names[0] == ('dNSName', 'foo.com')
+  assert len(san.names) == 8
+
+
+def test_decode_directory_name():
+  name = crypto.X509().get_subject()
+  name.CN = 'Test'
+  name.organizationName = 'Org'
+  dirname = b'\xa4' + bytes(bytearray([len(name.der())])) + name.der()
+  san = SubjectAltName(b'\x30' + bytes(bytearray([len(dirname)])) + dirname)
+  assert san.directory_names == ['CN=Test, O=Org']
+
+
+def test_decode_subject_alt_names():
+  datas = [
+    crypto.X509Extension(b'subjectAltName', False, b'DNS:a.com, DNS:b.com').get_data(),
+    b'',
+    crypto.X509Extension(b'subjectAltName', False, b'IP:::1').get_data(),
+  ]
+  names = decode_subject_alt_names(datas)
+  assert list(names.indices) == [0, 0, 2]
+  assert list(names.types) == [DNS_NAME, DNS_NAME, IP_ADDRESS]
+  assert names.values == ['a.com', 'b.com', '::1']
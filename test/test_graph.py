@@ -0,0 +1,34 @@
+from py509.graph import IssuanceGraph
+from py509.utils import tree
+
+from helpers import make_csr, sign
+
+
+def test_issuance_graph():
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr)
+  other_key, other_csr = make_csr('Other Root')
+  other = sign(other_csr, other_key, other_csr)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root)
+  cross = sign(inter_csr, other_key, other)
+  leaves = [sign(make_csr('Leaf {0}'.format(i))[1], inter_key, inter) for i in range(3)]
+  stray_key, stray_csr = make_csr('Stray CA')
+  orphan = sign(make_csr('Orphan')[1], stray_key, sign(stray_csr, stray_key, stray_csr))
+
+  graph = IssuanceGraph([root, other, inter, cross, orphan] + leaves + [root])
+  assert len(graph) == 8
+  ids = dict((graph.certificates[n].get_subject().CN, n) for n in range(len(graph)))
+
+  assert sorted(graph.roots()) == sorted([graph.node(root), graph.node(other)])
+  assert graph.orphans() == [graph.node(orphan)]
+  assert [sorted(g) for g in graph.cross_signed()] == [sorted([graph.node(inter), graph.node(cross)])]
+  assert graph.issued_count(graph.node(inter)) == 3
+  assert graph.issued_count(graph.node(cross)) == 3
+  assert graph.subtree_size(graph.node(root)) == 4
+  assert graph.path(ids['Leaf 0'])[1:] in ([graph.node(inter), graph.node(root)],
+                                           [graph.node(cross), graph.node(other)])
+
+  lines = list(tree(graph.to_tree(), formatter=lambda c: c.get_subject().CN))
+  assert len(lines) == len(graph)
+  assert sum(1 for line in lines if 'Leaf' in line) == 3
@@ -0,0 +1,57 @@
+from OpenSSL import crypto
+import pytest
+
+from py509.lint import DEFAULT_RULES, ERROR, WARNING, Linter, Rule
+
+from helpers import make_ca, make_csr, sign
+
+
+def make_leaf(ca_key, ca_crt, not_after, *exts):
+  return sign(make_csr('Leaf')[1], ca_key, ca_crt, not_after, exts=exts)
+
+
+def _check_serial(fields):
+  if fields['serial'] % 2:
+    return 'Odd serial number'
+
+
+def _check_undeclared(fields):
+  return fields['subject']
+
+
+def test_rule_fields():
+  with pytest.raises(ValueError):
+    Rule('unknown', ('no such field',), _check_serial)
+
+
+@pytest.mark.parametrize('processes,pool', [(1, 'thread'), (2, 'thread'), (2, 'process')])
+def test_linter(processes, pool):
+  ca_key, ca_crt = make_ca('Lint CA')
+  bare = make_leaf(ca_key, ca_crt, 2 * 365 * 24 * 3600)
+  complete = make_leaf(
+    ca_key, ca_crt, 3600,
+    crypto.X509Extension(b'subjectAltName', False, b'DNS:example.com'),
+    crypto.X509Extension(b'authorityInfoAccess', False, b'OCSP;URI:http://ocsp.example.com'))
+  corpus = [ca_crt, bare, crypto.dump_certificate(crypto.FILETYPE_ASN1, complete), b'garbage']
+
+  rules = list(DEFAULT_RULES) + [Rule('undeclared', ('serial',), _check_undeclared)]
+  linter = Linter(rules, processes=processes, chunk_size=3, pool=pool)
+  results = list(linter.lint(iter(corpus)))
+  assert [r.index for r in results] == [0, 1, 2, 3]
+
+  def failed(result):
+    return sorted((f.rule, f.severity) for f in result.findings if f.rule != 'undeclared')
+
+  assert failed(results[0]) == [('key_size', ERROR)]
+  assert failed(results[1]) == [
+    ('authority_info_access', WARNING), ('key_size', ERROR), ('subject_alt_name', ERROR), ('validity_period', ERROR)]
+  assert failed(results[2]) == [('key_size', ERROR)]
+  assert failed(results[3]) == [('parse', ERROR)]
+  assert 'failed' in [f for f in results[0].findings if f.rule == 'undeclared'][0].message
+
+  histograms = linter.timings.histograms
+  assert histograms['rule:key_size'].count == 3
+  # Fields shared by several rules are decoded once per certificate.
+  assert histograms['field:is_ca'].count == 3
+  assert histograms['field:extensions'].count == 3
+  assert 'rule:key_size' in linter.timings.summary()
@@ -0,0 +1,35 @@
+from OpenSSL import crypto
+
+from py509 import metrics
+from py509.x509 import load_certificate
+
+from helpers import make_self_signed
+
+
+def test_timed_is_noop_when_disabled():
+  assert metrics.timed('parse') is metrics.timed('decode')
+
+
+def test_registry():
+  pem = crypto.dump_certificate(crypto.FILETYPE_PEM, make_self_signed('Test'))
+  registry = metrics.enable()
+  try:
+    for _ in range(3):
+      x509cert = load_certificate(crypto.FILETYPE_PEM, pem)
+      x509cert.extensions['subjectKeyIdentifier']
+  finally:
+    metrics.disable(registry)
+  assert registry.histograms['parse'].count == 3
+  assert registry.histograms['extension_decode'].count == 3
+  assert 'parse' in registry.summary()
+  load_certificate(crypto.FILETYPE_PEM, pem)
+  assert registry.histograms['parse'].count == 3
+
+
+def test_histogram_percentiles():
+  h = metrics.Histogram()
+  for ms in range(1, 101):
+    h.record(ms / 1000.0)
+  assert h.count == 100
+  assert 0.05 <= h.percentile(50) <= 0.1
+  assert h.percentile(100) == h.max == 0.1
@@ -0,0 +1,234 @@
+import datetime
+import threading
+
+try:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from cryptography import x509 as cx509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+from OpenSSL import crypto
+import pytest
+
+from py509.revocation import (
+  GOOD, REVOKED, UNKNOWN, CRLSet, RevocationChecker, RevocationIndex, RevocationIndexBuilder)
+from py509.utils import assemble_chain
+from py509.x509 import make_certificate, make_serial
+
+from helpers import make_ca, make_csr, sign
+
+
+def make_leaf(cn, ca_key, ca_crt, ext):
+  return sign(make_csr(cn)[1], ca_key, ca_crt, exts=[ext])
+
+
+class StandIn(BaseHTTPRequestHandler):
+  """A local OCSP responder and CRL server."""
+
+  def do_POST(self):
+    self.server.requests += 1
+    request = ocsp.load_der_ocsp_request(self.rfile.read(int(self.headers['Content-Length'])))
+    leaf = self.server.leaves[request.serial_number]
+    now = datetime.datetime.utcnow() + self.server.offset
+    revoked = request.serial_number in self.server.revoked
+    builder = ocsp.OCSPResponseBuilder().add_response(
+      cert=leaf, issuer=self.server.ca_crt, algorithm=hashes.SHA1(),
+      cert_status=ocsp.OCSPCertStatus.REVOKED if revoked else ocsp.OCSPCertStatus.GOOD,
+      this_update=now, next_update=now + datetime.timedelta(hours=1),
+      revocation_time=now if revoked else None, revocation_reason=None,
+    )
+    responder_crt, responder_key = self.server.responder
+    builder = builder.responder_id(ocsp.OCSPResponderEncoding.HASH, responder_crt)
+    if responder_crt != self.server.ca_crt:
+      builder = builder.certificates([responder_crt])
+    self._send(builder.sign(responder_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER))
+
+  def do_GET(self):
+    self.server.requests += 1
+    now = datetime.datetime.utcnow()
+    builder = cx509.CertificateRevocationListBuilder().issuer_name(
+      self.server.ca_crt.subject).last_update(now).next_update(now + datetime.timedelta(hours=1))
+    for serial in self.server.revoked:
+      builder = builder.add_revoked_certificate(
+        cx509.RevokedCertificateBuilder().serial_number(serial).revocation_date(now).build(default_backend()))
+    crl = builder.sign(self.server.ca_key, hashes.SHA256(), default_backend())
+    self._send(crl.public_bytes(serialization.Encoding.DER))
+
+  def _send(self, body):
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+def test_revocation_checker():
+  ca_key, ca_crt = make_ca()
+  server = HTTPServer(('127.0.0.1', 0), StandIn)
+  base = 'http://127.0.0.1:{0}'.format(server.server_port).encode('ascii')
+  aia = crypto.X509Extension(b'authorityInfoAccess', False, b'OCSP;URI:' + base + b'/ocsp')
+  cdp = crypto.X509Extension(b'crlDistributionPoints', False, b'URI:' + base + b'/crl')
+  good = make_leaf('Good', ca_key, ca_crt, aia)
+  revoked = make_leaf('Revoked', ca_key, ca_crt, aia)
+  crl_good = make_leaf('CRL Good', ca_key, ca_crt, cdp)
+  crl_revoked = make_leaf('CRL Revoked', ca_key, ca_crt, cdp)
+
+  server.ca_crt = ca_crt.to_cryptography()
+  server.ca_key = ca_key.to_cryptography_key()
+  server.responder = (server.ca_crt, server.ca_key)
+  server.leaves = dict((c.get_serial_number(), c.to_cryptography()) for c in (good, revoked))
+  server.revoked = set([revoked.get_serial_number(), crl_revoked.get_serial_number()])
+  server.requests = 0
+  server.offset = datetime.timedelta(0)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+
+  try:
+    checker = RevocationChecker()
+    statuses = checker.check_many([(c, ca_crt) for c in (good, revoked, crl_good, crl_revoked)])
+    assert [s.status for s in statuses] == [GOOD, REVOKED, GOOD, REVOKED]
+    assert statuses[1].revoked_at is not None
+    assert server.requests == 3
+
+    assert checker.check_chain(assemble_chain(good, [ca_crt]))[1].status == GOOD
+    assert checker.check(crl_revoked, ca_crt).status == REVOKED
+    assert server.requests == 3
+    assert checker.cache_hits == 3
+
+    impostor_key, impostor_crt = make_ca()
+    # A cached CRL is only reused for the issuer it was checked against.
+    crl_url = (base + b'/crl').decode('ascii')
+    checker.crl(crl_url)
+    with pytest.raises(ValueError):
+      checker.crl(crl_url, impostor_crt)
+
+    server.responder = (impostor_crt.to_cryptography(), impostor_key.to_cryptography_key())
+    forged = make_leaf('Forged', ca_key, ca_crt, aia)
+    server.leaves[forged.get_serial_number()] = forged.to_cryptography()
+    status = checker.check(forged, ca_crt)
+    assert status.status == UNKNOWN
+    assert 'signature' in status.error
+
+    server.responder = (server.ca_crt, server.ca_key)
+    for hours, error in ((-2, 'expired'), (2, 'not yet valid')):
+      server.offset = datetime.timedelta(hours=hours)
+      stale = make_leaf('Stale', ca_key, ca_crt, aia)
+      server.leaves[stale.get_serial_number()] = stale.to_cryptography()
+      status = checker.check(stale, ca_crt)
+      assert status.status == UNKNOWN
+      assert error in status.error
+
+    # A delegated responder whose certificate has expired.
+    server.offset = datetime.timedelta(0)
+    delegate_key, delegate_csr = make_csr('Responder')
+    delegate = make_certificate(
+      delegate_csr, ca_key, ca_crt, make_serial(), -7200, -3600, digest='sha256',
+      exts=[crypto.X509Extension(b'extendedKeyUsage', False, b'OCSPSigning')])
+    server.responder = (delegate.to_cryptography(), delegate_key.to_cryptography_key())
+    status = checker.check(forged, ca_crt)
+    assert status.status == UNKNOWN
+    assert 'not valid' in status.error
+  finally:
+    server.shutdown()
+    server.server_close()
+
+
+def test_crl_set():
+  ca_key, ca_crt = make_ca()
+  now = datetime.datetime.utcnow()
+  builder = cx509.CertificateRevocationListBuilder().issuer_name(
+    ca_crt.to_cryptography().subject).last_update(now).next_update(now)
+  for serial in range(1, 1001):
+    builder = builder.add_revoked_certificate(
+      cx509.RevokedCertificateBuilder().serial_number(serial).revocation_date(now).build(default_backend()))
+  crl = builder.sign(ca_key.to_cryptography_key(), hashes.SHA256(), default_backend())
+  crl_set = CRLSet(crl.public_bytes(serialization.Encoding.PEM), ca_crt)
+  assert len(crl_set) == 1000
+  assert 500 in crl_set
+  assert 1001 not in crl_set
+
+  leaf = make_leaf('Leaf', ca_key, ca_crt, crypto.X509Extension(b'basicConstraints', False, b'CA:FALSE'))
+  crl_set = CRLSet(make_crl(ca_key, ca_crt, [leaf.get_serial_number()]), ca_crt)
+  assert crl_set.status(leaf).status == REVOKED
+  stale = CRLSet(make_crl(ca_key, ca_crt, [], next_update=datetime.timedelta(hours=-1)), ca_crt)
+  assert stale.status(leaf).status == UNKNOWN
+
+
+def make_crl(ca_key, ca_crt, serials, **kwargs):
+  now = datetime.datetime.utcnow()
+  this_update = now + kwargs.get('this_update', datetime.timedelta(0))
+  next_update = now + kwargs.get('next_update', datetime.timedelta(days=1))
+  builder = cx509.CertificateRevocationListBuilder().issuer_name(
+    ca_crt.to_cryptography().subject).last_update(
+      min(this_update, next_update - datetime.timedelta(days=1))).next_update(next_update)
+  if kwargs.get('aki', True):
+    builder = builder.add_extension(cx509.AuthorityKeyIdentifier.from_issuer_public_key(
+      ca_crt.to_cryptography().public_key()), critical=False)
+  for serial in serials:
+    builder = builder.add_revoked_certificate(
+      cx509.RevokedCertificateBuilder().serial_number(serial).revocation_date(now).build(default_backend()))
+  return builder.sign(ca_key.to_cryptography_key(), hashes.SHA256(), default_backend()).public_bytes(
+    serialization.Encoding.DER)
+
+
+def test_revocation_index(tmpdir):
+  ca_key, ca_crt = make_ca()
+  other_key, other_crt = make_ca()
+  ext = crypto.X509Extension(b'basicConstraints', False, b'CA:FALSE')
+  revoked = make_leaf('Revoked', ca_key, ca_crt, ext)
+  good = make_leaf('Good', ca_key, ca_crt, ext)
+  elsewhere = make_leaf('Elsewhere', other_key, other_crt, ext)
+
+  crl_path = str(tmpdir.join('ca.crl'))
+  with open(crl_path, 'wb') as fh:
+    fh.write(make_crl(ca_key, ca_crt, list(range(1, 5001)) + [revoked.get_serial_number()]))
+
+  builder = RevocationIndexBuilder()
+  hour = datetime.timedelta(hours=1)
+  assert builder.add_crl(make_crl(ca_key, ca_crt, [1, 2, good.get_serial_number()], this_update=-hour), ca_crt) == 3
+  # A newer CRL replaces the entries of an older one, and an older one is
+  # ignored.
+  assert builder.add_crl_file(crl_path, ca_crt) == 5001
+  assert builder.add_crl(make_crl(ca_key, ca_crt, [1], this_update=-2 * hour), ca_crt) == 0
+  # A CRL whose signature was not checked never replaces one whose was.
+  assert builder.add_crl(make_crl(other_key, ca_crt, [], this_update=hour)) == 0
+  assert len(builder) == 5001
+  with pytest.raises(ValueError):
+    builder.add_crl(make_crl(other_key, other_crt, [1]), ca_crt)
+  with pytest.raises(ValueError):
+    builder.add_crl(make_crl(other_key, other_crt, [1], aki=False))
+  index_path = str(tmpdir.join('revoked.idx'))
+  builder.write(index_path)
+
+  index = RevocationIndex(index_path)
+  try:
+    assert len(index) == 5001
+    assert index.is_revoked(revoked)
+    assert index.status(revoked).revoked_at is not None
+    assert index.status(good).status == GOOD
+    assert index.status(elsewhere).status == UNKNOWN
+  finally:
+    index.close()
+
+  with pytest.raises(ValueError):
+    RevocationIndex(crl_path)
+
+
+def test_revocation_index_expired(tmpdir):
+  ca_key, ca_crt = make_ca()
+  leaf = make_leaf('Leaf', ca_key, ca_crt, crypto.X509Extension(b'basicConstraints', False, b'CA:FALSE'))
+  builder = RevocationIndexBuilder()
+  builder.add_crl(make_crl(ca_key, ca_crt, [leaf.get_serial_number()], next_update=-datetime.timedelta(hours=1)), ca_crt)
+  index_path = str(tmpdir.join('revoked.idx'))
+  builder.write(index_path)
+  index = RevocationIndex(index_path)
+  try:
+    assert index.status(leaf).status == UNKNOWN
+  finally:
+    index.close()
@@ -0,0 +1,87 @@
+import json
+import threading
+
+from OpenSSL import crypto
+import urllib3
+
+from py509.server import VerificationService, make_server
+from py509.store import TrustStore
+
+from helpers import make_csr, sign
+
+
+def pem(*certs):
+  return b''.join(crypto.dump_certificate(crypto.FILETYPE_PEM, c) for c in certs)
+
+
+def test_verification_service(tmpdir):
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, ca=True)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root, ca=True)
+  leaf = sign(make_csr('Leaf')[1], inter_key, inter)
+
+  other_key, other_csr = make_csr('Other Root')
+  tmpdir.join('other.pem').write_binary(pem(sign(other_csr, other_key, other_csr, ca=True)))
+  service = VerificationService(TrustStore(str(tmpdir)))
+  server = make_server(service, port=0)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  http = urllib3.PoolManager()
+  url = 'http://127.0.0.1:{0}'.format(server.server_port)
+
+  def post(path, body):
+    rsp = http.request('POST', url + path, body=body)
+    return rsp.status, json.loads(rsp.data.decode('utf-8'))
+
+  try:
+    status, result = post('/verify', pem(leaf, inter))
+    assert status == 200
+    assert not result['valid']
+
+    tmpdir.join('root.pem').write_binary(pem(root))
+    assert service.reload()
+    # The intermediate is remembered from the previous request.
+    status, result = post('/verify', pem(leaf))
+    assert result['valid']
+    assert result['chain'] == ['Root', 'Intermediate', 'Leaf']
+
+    assert post('/chain', pem(leaf)) == (200, {'chain': ['Root', 'Intermediate', 'Leaf']})
+    assert post('/verify', b'garbage')[0] == 400
+
+    stats = json.loads(http.request('GET', url + '/stats').data.decode('utf-8'))
+    assert stats['requests']['verify']['count'] == 3
+    assert stats['trust_store']['certificates'] == 2
+    assert stats['intermediates'] == 1
+    assert stats['signature_checks'] == 2
+
+    # Signature counters survive a reload.
+    tmpdir.join('other.pem').remove()
+    assert service.reload()
+    assert service.stats()['signature_checks'] == 2
+  finally:
+    server.shutdown()
+    server.server_close()
+
+
+def test_verification_service_remembers_intermediates_by_fingerprint(tmpdir):
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, ca=True)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root, ca=True)
+  leaf = sign(make_csr('Leaf')[1], inter_key, inter)
+  # An unrelated certificate with the intermediate's subject, sent first.
+  impostor_key, impostor_csr = make_csr('Intermediate')
+  impostor = sign(impostor_csr, impostor_key, impostor_csr, ca=True)
+
+  tmpdir.join('root.pem').write_binary(pem(root))
+  service = VerificationService(TrustStore(str(tmpdir)), max_intermediates=2)
+  assert not service.verify(pem(leaf, impostor))['valid']
+  assert service.verify(pem(leaf, inter))['valid']
+  assert service.verify(pem(leaf))['valid']
+
+  others = [sign(make_csr('Other {0}'.format(i))[1], root_key, root, ca=True) for i in range(2)]
+  service.verify(pem(leaf, *others))
+  assert service.stats()['intermediates'] == 2
+  assert not service.verify(pem(leaf))['valid']
@@ -0,0 +1,108 @@
+import json
+import threading
+
+from OpenSSL import crypto
+import pytest
+import urllib3
+
+from py509.signer import RateLimitExceeded, SigningService, make_server
+from py509.transparency import IssuanceLog
+from py509.x509 import add_issuance_listener, remove_issuance_listener
+
+from helpers import make_ca, make_csr
+
+
+@pytest.fixture(scope='module')
+def ca():
+  return make_ca('Signing CA')
+
+
+def test_signing_service(ca, tmpdir):
+  ca_key, ca_crt = ca
+  log = IssuanceLog(str(tmpdir))
+  log.attach()
+  exts = [(b'basicConstraints', True, b'CA:FALSE')]
+  with SigningService(ca_key, ca_crt, processes=2, batch_size=8, exts=exts) as service:
+    issuances = [service.submit(make_csr('Leaf {0}'.format(i))[1]) for i in range(20)]
+    certificates = [issuance.result(timeout=30) for issuance in issuances]
+    with pytest.raises(ValueError):
+      service.sign(b'garbage', timeout=30)
+  log.close()
+  # Certificates signed by the workers are logged by this process.
+  assert len(log) == 20
+
+  assert [c.get_subject().CN for c in certificates] == ['Leaf {0}'.format(i) for i in range(20)]
+  store = crypto.X509Store()
+  store.add_cert(ca_crt)
+  for crt in certificates:
+    assert crt.get_issuer() == ca_crt.get_subject()
+    assert 'CA:FALSE' in crt.extensions['basicConstraints']
+    crypto.X509StoreContext(store, crt).verify_certificate()
+
+  stats = service.stats()
+  assert stats['issued'] == 20
+  assert stats['failed'] == 1
+  assert stats['batches'] < 21
+  assert stats['latency']['p99_ms'] >= stats['latency']['p50_ms'] > 0
+
+  with pytest.raises(RuntimeError):
+    service.submit(make_csr('Too late')[1])
+
+
+def test_signing_service_survives_failing_listeners(ca):
+  ca_key, ca_crt = ca
+
+  def fail(certificate):
+    raise RuntimeError('Listener failed')
+
+  add_issuance_listener(fail)
+  try:
+    with SigningService(ca_key, ca_crt, processes=1, batch_size=4) as service:
+      issuances = [service.submit(make_csr('Leaf {0}'.format(i))[1]) for i in range(4)]
+      assert [i.result(timeout=30).get_subject().CN for i in issuances] == ['Leaf {0}'.format(i) for i in range(4)]
+  finally:
+    remove_issuance_listener(fail)
+
+
+def test_signing_server(ca):
+  ca_key, ca_crt = ca
+  service = SigningService(ca_key, ca_crt, processes=1, rate=0.01, burst=2)
+  service.start()
+  server = make_server(service, port=0)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  http = urllib3.PoolManager()
+  url = 'http://127.0.0.1:{0}'.format(server.server_port)
+  body = crypto.dump_certificate_request(crypto.FILETYPE_PEM, make_csr('Leaf')[1])
+
+  try:
+    rsp = http.request('POST', url + '/sign', body=body)
+    assert rsp.status == 200
+    assert crypto.load_certificate(crypto.FILETYPE_PEM, rsp.data).get_subject().CN == 'Leaf'
+    assert http.request('POST', url + '/sign', body=b'garbage').status == 400
+    # Clients are told apart by their address, whatever they claim to be.
+    assert http.request('POST', url + '/sign', body=body, headers={'X-Client': 'b'}).status == 429
+    with pytest.raises(RateLimitExceeded):
+      service.submit(body, client='127.0.0.1')
+
+    stats = json.loads(http.request('GET', url + '/stats').data.decode('utf-8'))
+    assert stats['issued'] == 1
+    assert stats['rate_limited'] == 2
+  finally:
+    server.shutdown()
+    server.server_close()
+    service.stop()
+
+
+def test_signing_service_forgets_idle_clients(ca):
+  ca_key, ca_crt = ca
+  body = crypto.dump_certificate_request(crypto.FILETYPE_PEM, make_csr('Leaf')[1])
+  with SigningService(ca_key, ca_crt, processes=1, rate=0.01, burst=1, max_clients=2) as service:
+    for client in ('a', 'b', 'c'):
+      service.submit(body, client=client)
+    with pytest.raises(RateLimitExceeded):
+      service.submit(body, client='c')
+    # 'a' was seen least recently, so its bucket was dropped for 'c'.
+    service.submit(body, client='a')
+  assert service.stats()['issued'] == 4
@@ -0,0 +1,47 @@
+import os
+
+from OpenSSL import crypto
+
+from py509.store import TrustStore
+
+from helpers import make_self_signed
+
+
+def write(path, *certs, **kwargs):
+  filetype = kwargs.get('filetype', crypto.FILETYPE_PEM)
+  with open(path, 'wb') as fh:
+    for x509cert in certs:
+      fh.write(crypto.dump_certificate(filetype, x509cert))
+
+
+def test_trust_store_refresh(tmpdir):
+  certs = [make_self_signed('CA {0}'.format(i)) for i in range(4)]
+  write(str(tmpdir.join('a.pem')), certs[0], certs[1])
+  write(str(tmpdir.join('b.0')), certs[2])
+  write(str(tmpdir.join('c.crt')), certs[3], filetype=crypto.FILETYPE_ASN1)
+  write(str(tmpdir.join('ignored.txt')), certs[0])
+
+  store = TrustStore(str(tmpdir))
+  assert store.refresh() == (3, 0, 0)
+  assert len(store) == 4
+  assert store.refresh() == (0, 0, 0)
+  generation = store.generation
+
+  write(str(tmpdir.join('b.0')), certs[2], certs[0])
+  os.utime(str(tmpdir.join('b.0')), (0, 0))
+  assert store.refresh() == (0, 1, 0)
+  assert store.generation == generation + 1
+  assert len(store) == 4
+
+  tmpdir.join('a.pem').remove()
+  assert store.refresh() == (0, 0, 1)
+  assert sorted(c.get_subject().CN for c in store.certificates) == ['CA 0', 'CA 2', 'CA 3']
+  assert store.x509store() is store.x509store()
+
+
+def test_trust_store_glob(tmpdir):
+  write(str(tmpdir.join('a.pem')), make_self_signed('A'))
+  write(str(tmpdir.join('b.pem')), make_self_signed('B'))
+  store = TrustStore(str(tmpdir.join('a*')))
+  store.refresh()
+  assert [c.get_subject().CN for c in store.certificates] == ['A']
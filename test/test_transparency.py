@@ -0,0 +1,62 @@
+import hashlib
+
+from OpenSSL import crypto
+import pytest
+
+from py509.transparency import IssuanceLog, leaf_hash, node_hash, verify_consistency, verify_inclusion
+
+from helpers import make_self_signed
+
+
+def mth(leaves):
+  """The Merkle tree hash of a list of leaf hashes, as RFC 6962 defines it."""
+  if not leaves:
+    return hashlib.sha256().digest()
+  if len(leaves) == 1:
+    return leaves[0]
+  k = 1 << ((len(leaves) - 1).bit_length() - 1)
+  return node_hash(mth(leaves[:k]), mth(leaves[k:]))
+
+
+def test_issuance_log(tmpdir):
+  path = str(tmpdir.join('log'))
+  log = IssuanceLog(path)
+  log.attach()
+  certs = [make_self_signed('Test {0}'.format(i)) for i in range(3)]
+  log.detach()
+  make_self_signed('Not logged')
+  assert len(log) == 3
+  assert [log.certificate(i).get_subject().CN for i in range(3)] == ['Test 0', 'Test 1', 'Test 2']
+
+  asn1 = crypto.dump_certificate(crypto.FILETYPE_ASN1, certs[0])
+  for timestamp in range(3, 40):
+    assert log.append(asn1, timestamp=timestamp) == timestamp
+  assert log.entry(39) == (39, asn1)
+  with pytest.raises(IndexError):
+    log.entry(40)
+
+  leaves = [log.leaf_hash(i) for i in range(40)]
+  assert leaves[5] == leaf_hash(b'\x00' * 7 + b'\x05' + b'\x00' * 2 + bytes(bytearray([len(asn1) >> 8, len(asn1) & 0xff])) + asn1)
+  for size in range(41):
+    root = log.root(size)
+    assert root == mth(leaves[:size])
+    for idx in range(size):
+      assert verify_inclusion(leaves[idx], idx, size, log.inclusion_proof(idx, size), root)
+    for first in range(size + 1):
+      assert verify_consistency(first, size, log.root(first), root, log.consistency_proof(first, size))
+  assert not verify_inclusion(leaves[1], 2, 40, log.inclusion_proof(2), log.root())
+  assert not verify_consistency(7, 40, log.root(8), log.root(), log.consistency_proof(7))
+  root = log.root()
+  log.close()
+
+  # An interrupted append is discarded, and missing hashes are recomputed.
+  with open(str(tmpdir.join('log', 'entries')), 'ab') as fh:
+    fh.write(b'partial entry')
+  with open(str(tmpdir.join('log', 'level-00')), 'ab') as fh:
+    fh.write(b'\x00' * 32)
+  tmpdir.join('log', 'level-02').remove()
+  with IssuanceLog(path) as log:
+    assert len(log) == 40
+    assert log.root() == root
+    log.append(asn1, timestamp=40)
+    assert log.root() == mth(leaves + [log.leaf_hash(40)])
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import io
+
+from py509.utils import CompactTree, transmogrify, tree, write_tree
+
+
+def test_tree_dict():
+  lines = list(tree({'a': {'b': {}, 'c': None}}))
+  assert lines == [
+    u' └── a',
+    u'     ├── b',
+    u'     └── c',
+  ] or lines == [
+    u' └── a',
+    u'     ├── c',
+    u'     └── b',
+  ]
+
+
+def test_tree_compact():
+  t = CompactTree()
+  root = t.add('root')
+  child = t.add('child', root)
+  t.add('grandchild', child)
+  t.add('sibling', root)
+  assert list(tree(t, formatter=str.upper, prefix=lambda k: '<', postfix=lambda k: '>')) == [
+    u' └── <ROOT>',
+    u'     ├── <CHILD>',
+    u'     |   └── <GRANDCHILD>',
+    u'     └── <SIBLING>',
+  ]
+
+
+def test_transmogrify():
+  assert list(tree(transmogrify(['root', 'intermediate', 'leaf']))) == [
+    u' └── root',
+    u'     └── intermediate',
+    u'         └── leaf',
+  ]
+
+
+def test_write_tree_deep():
+  depth = 5000
+  stream = io.StringIO()
+  assert write_tree(stream, transmogrify(range(depth)), formatter=str, buffer_lines=64) == depth
+  lines = stream.getvalue().splitlines()
+  assert len(lines) == depth
+  assert lines[-1].endswith(u'└── {0}'.format(depth - 1))
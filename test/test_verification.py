@@ -0,0 +1,144 @@
+import datetime
+
+from OpenSSL import crypto
+
+from py509.verification import Verifier, VerificationCache, trust_store_hash
+from py509.x509 import make_pkey, make_certificate, make_serial
+
+from helpers import TEST_DIGEST, TEST_KEY_SIZE, make_csr, sign
+
+
+def make_chain():
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, ca=True)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root, ca=True)
+  leaf = sign(make_csr('Leaf')[1], inter_key, inter)
+  return root, inter, leaf
+
+
+def test_trust_store_hash():
+  root, inter, leaf = make_chain()
+  assert trust_store_hash([root, inter]) == trust_store_hash([inter, root, inter])
+  assert trust_store_hash([root]) != trust_store_hash([root, inter])
+
+
+def test_verifier_caches_outcomes():
+  root, inter, leaf = make_chain()
+  verifier = Verifier([root])
+  assert verifier.verify(leaf, [inter]).valid
+  assert verifier.verify(leaf, [inter]).valid
+  assert (verifier.cache.hits, verifier.cache.misses) == (1, 1)
+
+  outcome = verifier.verify(leaf)
+  assert not outcome.valid
+  assert outcome.error
+  assert verifier.verify(leaf) == outcome
+  assert verifier.cache.hits == 2
+
+  assert verifier.cache.invalidate(inter.digest('sha256')) == 1
+  assert len(verifier.cache) == 1
+  assert verifier.cache.invalidate() == 1
+
+
+def test_verification_cache_evicts_least_recently_used():
+  cache = VerificationCache(maxsize=2)
+  cache.put('a', 1)
+  cache.put('b', 2)
+  assert cache.get('a') == 1
+  cache.put('c', 3)
+  assert cache.get('b') is None
+  assert cache.get('a') == 1
+  assert cache.get('c') == 3
+
+
+def test_verifier_reuses_verified_intermediates():
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, ca=True)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root, ca=True)
+  sub_key, sub_csr = make_csr('Sub Intermediate')
+  sub = sign(sub_csr, inter_key, inter, ca=True)
+  leaves = [sign(make_csr('Leaf {0}'.format(i))[1], sub_key, sub) for i in range(3)]
+  forged = sign(make_csr('Forged')[1], make_pkey(key_bits=TEST_KEY_SIZE), sub)
+
+  verifier = Verifier([root])
+  assert verifier.verify(leaves[0], [sub, inter]).valid
+  assert (verifier.signature_checks, verifier.signature_checks_saved) == (3, 0)
+  assert verifier.verify(leaves[1], [sub, inter]).valid
+  assert verifier.verify(leaves[2], [inter, sub]).valid
+  assert (verifier.signature_checks, verifier.signature_checks_saved) == (5, 4)
+  assert not verifier.verify(forged, [sub, inter]).valid
+  assert not verifier.verify(leaves[0]).valid
+
+
+def test_verifier_matches_anchors_by_key_identifier():
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, ca=True)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root, ca=True)
+  leaf = sign(make_csr('Leaf')[1], inter_key, inter)
+  # The same intermediate, re-keyed.
+  rekeyed_key, rekeyed_csr = make_csr('Intermediate')
+  rekeyed = sign(rekeyed_csr, root_key, root, ca=True)
+  rekeyed_leaf = sign(make_csr('Leaf')[1], rekeyed_key, rekeyed)
+
+  verifier = Verifier([root])
+  assert verifier.verify(leaf, [inter]).valid
+  assert verifier.verify(rekeyed_leaf, [inter, rekeyed]).valid
+  assert (verifier.signature_checks, verifier.signature_checks_saved) == (4, 0)
+  assert verifier.verify(sign(make_csr('Leaf 2')[1], rekeyed_key, rekeyed), [inter, rekeyed]).valid
+  assert (verifier.signature_checks, verifier.signature_checks_saved) == (5, 1)
+
+
+def test_verifier_forgets_least_recently_used_anchors():
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, ca=True)
+  inters = []
+  for i in range(2):
+    inter_key, inter_csr = make_csr('Intermediate {0}'.format(i))
+    inters.append((inter_key, sign(inter_csr, root_key, root, ca=True)))
+
+  verifier = Verifier([root], max_anchors=1)
+  for inter_key, inter in inters + inters[:1]:
+    assert verifier.verify(sign(make_csr('Leaf')[1], inter_key, inter), [inter]).valid
+  # The first intermediate was forgotten for the second, so its chain was
+  # verified in full again.
+  assert (verifier.signature_checks, verifier.signature_checks_saved) == (6, 0)
+  inter_key, inter = inters[0]
+  assert verifier.verify(sign(make_csr('Leaf')[1], inter_key, inter), [inter]).valid
+  assert (verifier.signature_checks, verifier.signature_checks_saved) == (7, 1)
+
+
+def test_verifier_verifies_at_many_dates():
+  root_key, root_csr = make_csr('Root')
+  root = sign(root_csr, root_key, root_csr, not_after=10 * 86400, ca=True)
+  inter_key, inter_csr = make_csr('Intermediate')
+  inter = sign(inter_csr, root_key, root, not_after=86400, ca=True)
+  leaf = sign(make_csr('Leaf')[1], inter_key, inter, not_after=2 * 86400)
+  old_key, old_csr = make_csr('Old Intermediate')
+  old = make_certificate(old_csr, root_key, root, make_serial(), -10800, 86400, digest=TEST_DIGEST,
+                         exts=[crypto.X509Extension(b'basicConstraints', True, b'CA:TRUE')])
+  expired = make_certificate(make_csr('Expired')[1], old_key, old, make_serial(), -7200, -3600,
+                             digest=TEST_DIGEST)
+
+  verifier = Verifier([root])
+  now = datetime.datetime.utcnow()
+  hours = [now + datetime.timedelta(hours=h) for h in (-1, 1, 12, 36)]
+  outcomes = verifier.verify_at(leaf, hours, [inter])
+  assert [o.valid for o in outcomes] == [False, True, True, False]
+  assert outcomes[0].error == 'certificate is not yet valid'
+  # The intermediate expires before the leaf.
+  assert outcomes[3].error == 'certificate has expired'
+  assert verifier.validity_period(leaf, [inter]).not_after < now + datetime.timedelta(hours=25)
+
+  # The chain is only verified once, whatever the dates.
+  assert verifier.verify_at(leaf, [now], [inter]) == [outcomes[1]]
+  assert (verifier.cache.hits, verifier.signature_checks) == (2, 2)
+
+  # Times are checked separately from everything else.
+  assert verifier.verify(expired, [old]).error == 'certificate has expired'
+  period = verifier.validity_period(expired, [old])
+  assert period.error is None
+  assert period.not_after < now
+  assert not verifier.verify_at(leaf, [now])[0].valid
@@ -0,0 +1,51 @@
+import copy
+import pickle
+
+from OpenSSL import crypto
+
+from py509.extensions import SubjectAltName
+from py509.view import CertificateView
+
+from helpers import TEST_KEY_SIZE, make_ca, make_csr, sign
+
+
+def make_x509():
+  ca_key, ca_crt = make_ca()
+  return sign(make_csr('Test Cert')[1], ca_key, ca_crt,
+              exts=[crypto.X509Extension(b'subjectAltName', True, b'DNS:foo.com')])
+
+
+def test_certificate_view():
+  x509cert = make_x509()
+  view = CertificateView(crypto.dump_certificate(crypto.FILETYPE_ASN1, x509cert))
+  assert view.version == 2
+  assert view.serial == x509cert.get_serial_number()
+  assert view.name_attribute('CN') == 'Test Cert'
+  assert view.name_attribute('CN', issuer=True) == 'Test CA'
+  assert dict(view.subject)['C'] == 'US'
+  assert view.not_before.strftime('%Y%m%d%H%M%SZ').encode() == x509cert.get_notBefore()
+  assert view.not_after.strftime('%Y%m%d%H%M%SZ').encode() == x509cert.get_notAfter()
+  assert view.key_algorithm == 'RSA'
+  assert view.key_bits == TEST_KEY_SIZE
+  assert [e[0] for e in view.extensions] == ['subjectKeyIdentifier', 'authorityKeyIdentifier', 'subjectAltName']
+  assert view.extensions[2][1]
+  assert view.extension_data('subjectAltName') == x509cert.get_extension(2).get_data()
+  assert SubjectAltName(view.extension_data('subjectAltName')).dns == ['foo.com']
+  assert view.extension_data('basicConstraints') is None
+  assert view.fingerprint('sha1') == bytes(bytearray.fromhex(x509cert.digest('sha1').decode().replace(':', '')))
+
+
+def test_certificate_view_is_immutable_and_picklable():
+  view = CertificateView.from_x509(make_x509())
+  try:
+    view.serial = 1
+  except AttributeError:
+    pass
+  else:
+    assert False, 'CertificateView should be immutable'
+  assert copy.copy(view) is view
+  clone = pickle.loads(pickle.dumps(view))
+  assert clone == view
+  assert clone.subject == view.subject
+  assert clone.to_x509().get_subject().CN == 'Test Cert'
+  assert 'subjectAltName' in clone.to_x509().extensions
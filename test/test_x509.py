@@ -1,6 +1,14 @@
 from OpenSSL import crypto
 
-from py509.x509 import make_pkey, make_certificate_signing_request, make_certificate_authority, make_certificate, make_serial
+import base64
+
+import pytest
+
+from py509.x509 import (
+  FORMAT_DER, FORMAT_PEM, FORMAT_PKCS7, der_certificates, detect_format, load_certificates, load_x509_certificates, pkcs7_certificates,
+  make_pkey, make_certificate_signing_request, make_certificate_authority, make_certificate, make_serial)
+
+from helpers import make_self_signed
 
 
 # These are known to be weak, but this is fast, and this is just for testing.
@@ -46,3 +54,69 @@ def test_make_certificate():
     exts=[crypto.X509Extension(b'subjectAltName', True, b'IP:0.0.0.0')],
     digest=TEST_DIGEST)
   assert crt.get_subject().CN == 'Test Cert'
+
+
+def test_load_certificates():
+  certs = [make_self_signed('Test {0}'.format(i)) for i in range(3)]
+  pem = b'Some text\n' + b'\n'.join(crypto.dump_certificate(crypto.FILETYPE_PEM, c) for c in certs)
+  asn1 = b''.join(crypto.dump_certificate(crypto.FILETYPE_ASN1, c) for c in certs)
+  assert detect_format(pem) == FORMAT_PEM
+  assert detect_format(asn1) == FORMAT_DER
+  assert detect_format(b'nothing here') is None
+  for buf in (pem, pem.decode('ascii'), asn1):
+    assert [c.get_subject().CN for c in load_certificates(buf)] == ['Test 0', 'Test 1', 'Test 2']
+    assert list(der_certificates(buf)) == [crypto.dump_certificate(crypto.FILETYPE_ASN1, c) for c in certs]
+  assert list(load_x509_certificates('nothing here')) == []
+  with pytest.raises(ValueError):
+    list(load_certificates(b'nothing here'))
+
+
+def test_load_trusted_certificates():
+  cert = make_self_signed('Trusted')
+  asn1 = crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)
+  # Trusted for TLS server authentication.
+  aux = b'\x30\x0c\x30\x0a\x06\x08\x2b\x06\x01\x05\x05\x07\x03\x01'
+  pem = b'-----BEGIN TRUSTED CERTIFICATE-----\n' + base64.b64encode(asn1 + aux) + b'\n-----END TRUSTED CERTIFICATE-----\n'
+  assert detect_format(pem) == FORMAT_PEM
+  assert list(der_certificates(pem)) == [asn1]
+  assert [c.get_subject().CN for c in load_certificates(pem)] == ['Trusted']
+
+
+def test_detect_format_pkcs7():
+  # A ContentInfo with the signedData content type and an empty content.
+  signed_data = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02'
+  assert detect_format(b'\x30\x0d' + signed_data + b'\xa0\x00') == FORMAT_PKCS7
+  assert detect_format(b'-----BEGIN PKCS7-----\n') == FORMAT_PKCS7
+
+
+def der_tlv(tag, *contents):
+  body = b''.join(contents)
+  if len(body) < 0x80:
+    return bytes(bytearray([tag, len(body)])) + body
+  return bytes(bytearray([tag, 0x82, len(body) >> 8, len(body) & 0xff])) + body
+
+
+def make_pkcs7(*certs):
+  signed_data_oid = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02'
+  data_oid = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x01'
+  signed_data = der_tlv(
+    0x30,
+    der_tlv(0x02, b'\x01'),
+    der_tlv(0x31),
+    der_tlv(0x30, data_oid),
+    der_tlv(0xa0, *[crypto.dump_certificate(crypto.FILETYPE_ASN1, c) for c in certs]),
+    der_tlv(0x31))
+  return der_tlv(0x30, signed_data_oid, der_tlv(0xa0, signed_data))
+
+
+def test_load_pkcs7_certificates():
+  certs = [make_self_signed('Test {0}'.format(i)) for i in range(2)]
+  bundle = make_pkcs7(*certs)
+  assert detect_format(bundle) == FORMAT_PKCS7
+  assert pkcs7_certificates(bundle) == [crypto.dump_certificate(crypto.FILETYPE_ASN1, c) for c in certs]
+  armored = b'-----BEGIN PKCS7-----\n' + base64.b64encode(bundle) + b'\n-----END PKCS7-----\n'
+  for buf in (bundle, armored):
+    assert [c.get_subject().CN for c in load_certificates(buf)] == ['Test 0', 'Test 1']
+  assert pkcs7_certificates(make_pkcs7()) == []
+  with pytest.raises(ValueError):
+    pkcs7_certificates(crypto.dump_certificate(crypto.FILETYPE_ASN1, certs[0]))